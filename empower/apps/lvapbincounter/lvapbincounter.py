@@ -98,6 +98,9 @@ class LVAPBinCounter(EWiFiApp):
         lvapp.register_message(PT_BIN_COUNTERS_REQUEST, BIN_COUNTERS_REQUEST)
         lvapp.register_message(PT_BIN_COUNTERS_RESPONSE, BIN_COUNTERS_RESPONSE)
 
+        # Other apps can subscribe to the responses for a (wtp, sta)
+        lvapp.register_demux(PT_BIN_COUNTERS_RESPONSE, lvapp.demux_sta)
+
         # Data structures
         self.counters = {
             "tx_packets": [],
@@ -18,6 +18,7 @@
 """UE measurements module."""
 
 import time
+import logging
 
 from construct import Struct, Int16ub, Int8ub, Int8sb, Container
 
@@ -56,6 +57,29 @@ UE_MEASUREMENTS_SERVICE_REPORT = Struct(
 UE_MEASUREMENTS_SERVICE_REPORT.name = "ue_measurements_service_report"
 
 
+LOG = logging.getLogger(__name__)
+
+
+def demux_reports(msg, vbs):
+    """Split a UE_MEASUREMENTS_SERVICE message into its reports.
+
+    Reports are keyed by (vbs, rnti, meas_id).
+    """
+
+    # only successful responses carry reports
+    if msg.flags.msg_type != MSG_TYPE_RESPONSE:
+        return []
+
+    if msg.tsrc.crud_result == RESULT_FAIL:
+        LOG.warning("Error in UE measurement from %s, ignoring.", vbs.addr)
+        return []
+
+    reports = msg.tlvs.decode(TLV_MEASUREMENTS_SERVICE_REPORT)
+
+    return [((vbs.addr, report.rnti, report.meas_id), report)
+            for report in reports]
+
+
 class UEMeasurements(ELTEApp):
     """UE Measurements Primitive.
 
@@ -92,6 +116,13 @@ class UEMeasurements(ELTEApp):
         # Register messages
         parser = (vbsp.PACKET, "ue_measurements_service")
         vbsp.register_message(PT_UE_MEASUREMENTS_SERVICE, parser)
+        vbsp.register_tlv(TLV_MEASUREMENTS_SERVICE_CONFIG,
+                          UE_MEASUREMENTS_SERVICE_CONFIG)
+        vbsp.register_tlv(TLV_MEASUREMENTS_SERVICE_REPORT,
+                          UE_MEASUREMENTS_SERVICE_REPORT)
+        vbsp.register_tlv(TLV_MEASUREMENTS_SERVICE_MEAS_ID,
+                          UE_MEASUREMENTS_SERVICE_MEAS_ID)
+        vbsp.register_demux(PT_UE_MEASUREMENTS_SERVICE, demux_reports)
 
         # Data structures
         self.rsrp = None
@@ -107,9 +138,6 @@ class UEMeasurements(ELTEApp):
     def start(self):
         """Start app."""
 
-        vbsp.register_callback(PT_UE_MEASUREMENTS_SERVICE,
-                               self.handle_response)
-
         super().start()
 
         if self.imsi in self.context.users:
@@ -125,9 +153,6 @@ class UEMeasurements(ELTEApp):
 
         super().stop()
 
-        vbsp.unregister_callback(PT_UE_MEASUREMENTS_SERVICE,
-                                 self.handle_response)
-
     @property
     def meas_id(self):
         """ Return the meas id. """
@@ -194,6 +219,9 @@ class UEMeasurements(ELTEApp):
     def handle_ue_join(self, user):
         """Called when a UE joins the network."""
 
+        if user.imsi == self.imsi:
+            self.subscribe_reports(user)
+
         interval = RRCReportInterval[self.interval].value
         amount = RRCReportAmount[self.amount].value
 
@@ -219,6 +247,9 @@ class UEMeasurements(ELTEApp):
     def handle_ue_leave(self, user):
         """Called when a UE leaves the network."""
 
+        if user.imsi == self.imsi:
+            self.unsubscribe(PT_UE_MEASUREMENTS_SERVICE)
+
         rrc_measurement_tlv = \
             Container(rnti=user.rnti, meas_id=self.meas_id)
 
@@ -235,31 +266,24 @@ class UEMeasurements(ELTEApp):
                                          tlvs=[tlv],
                                          callback=self.handle_del_response)
 
-    def handle_add_response(self, msg, vbs, _):
-        """Handle an incoming UE_MEASUREMENTS_SERVICE message."""
-
-        # if not a response then ignore
-        if msg.flags.msg_type != MSG_TYPE_RESPONSE:
-            self.log.warning("Not a response, ignoring.")
-            return
+    def subscribe_reports(self, user):
+        """Receive the reports for the current RNTI of this UE only."""
 
-        # there should be only one tlv
-        for tlv in msg.tlvs:
+        key = (user.vbs.addr, user.rnti, self.meas_id)
+        self.subscribe(PT_UE_MEASUREMENTS_SERVICE, key, self.handle_report)
 
-            if tlv.type == TLV_MEASUREMENTS_SERVICE_MEAS_ID:
+    def handle_ue_reports_service(self, *_):
+        """Follow the RNTI changes of the UE."""
 
-                parser = UE_MEASUREMENTS_SERVICE_MEAS_ID
-                option = parser.parse(tlv.value)
+        if PT_UE_MEASUREMENTS_SERVICE not in self.subscriptions:
+            return
 
-                # if result is fail then ignore
-                if msg.tsrc.crud_result == RESULT_FAIL:
-                    msg = "Error creating UE meas: %u" % option.meas_id
-                else:
-                    msg = "Success creating UE meas: %u" % option.meas_id
+        if self.imsi not in self.context.users:
+            return
 
-                self.log.warning(msg)
+        self.subscribe_reports(self.context.users[self.imsi])
 
-    def handle_del_response(self, msg, vbs, _):
+    def handle_add_response(self, msg, vbs, _):
         """Handle an incoming UE_MEASUREMENTS_SERVICE message."""
 
         # if not a response then ignore
@@ -268,22 +292,17 @@ class UEMeasurements(ELTEApp):
             return
 
         # there should be only one tlv
-        for tlv in msg.tlvs:
-
-            if tlv.type == TLV_MEASUREMENTS_SERVICE_MEAS_ID:
+        for option in msg.tlvs.decode(TLV_MEASUREMENTS_SERVICE_MEAS_ID):
 
-                parser = UE_MEASUREMENTS_SERVICE_MEAS_ID
-                option = parser.parse(tlv.value)
+            # if result is fail then ignore
+            if msg.tsrc.crud_result == RESULT_FAIL:
+                text = "Error creating UE meas: %u" % option.meas_id
+            else:
+                text = "Success creating UE meas: %u" % option.meas_id
 
-                # if result is fail then ignore
-                if msg.tsrc.crud_result == RESULT_FAIL:
-                    msg = "Error removing UE meas: %u" % option.meas_id
-                else:
-                    msg = "Success removing UE meas: %u" % option.meas_id
+            self.log.warning(text)
 
-                self.log.warning(msg)
-
-    def handle_response(self, msg, _):
+    def handle_del_response(self, msg, vbs, _):
         """Handle an incoming UE_MEASUREMENTS_SERVICE message."""
 
         # if not a response then ignore
@@ -291,42 +310,34 @@ class UEMeasurements(ELTEApp):
             self.log.warning("Not a response, ignoring.")
             return
 
-        # if result is fail then ignore
-        if msg.tsrc.crud_result == RESULT_FAIL:
-            self.log.warning("Error creating UE measurement, ignoring.")
-            return
-
-        # must be a success, parse TLVs
-        for tlv in msg.tlvs:
-
-            if tlv.type != TLV_MEASUREMENTS_SERVICE_REPORT:
-                continue
+        # there should be only one tlv
+        for option in msg.tlvs.decode(TLV_MEASUREMENTS_SERVICE_MEAS_ID):
 
-            # set last iteration time
-            self.last = time.time()
+            # if result is fail then ignore
+            if msg.tsrc.crud_result == RESULT_FAIL:
+                text = "Error removing UE meas: %u" % option.meas_id
+            else:
+                text = "Success removing UE meas: %u" % option.meas_id
 
-            parser = UE_MEASUREMENTS_SERVICE_REPORT
-            option = parser.parse(tlv.value)
+            self.log.warning(text)
 
-            self.log.debug("Processing options %s", parser.name)
+    def handle_report(self, report, _):
+        """Handle a UE measurements report for this UE."""
 
-            user = self.context.users[self.imsi]
-
-            if option.rnti != user.rnti:
-                continue
+        if self.imsi not in self.context.users:
+            return
 
-            if option.meas_id != self.meas_id:
-                continue
+        user = self.context.users[self.imsi]
 
-            self.rsrp = option.rsrp - 140
-            self.rsrq = int(option.rsrq/2 - 19.5)
+        self.rsrp = report.rsrp - 140
+        self.rsrq = int(report.rsrq/2 - 19.5)
 
-            self.log.debug("Received RSRP %u RSRQ %u", self.rsrp, self.rsrq)
+        self.log.debug("Received RSRP %u RSRQ %u", self.rsrp, self.rsrq)
 
-            user.ue_measurements = {
-                "rsrp": self.rsrp,
-                "rsrq": self.rsrq,
-            }
+        user.ue_measurements = {
+            "rsrp": self.rsrp,
+            "rsrq": self.rsrq,
+        }
 
         # handle callbacks
         self.handle_callbacks()
@@ -103,6 +103,9 @@ class RCStats(EWiFiApp):
         lvapp.register_message(PT_WIFI_RC_STATS_RESPONSE,
                                WIFI_RC_STATS_RESPONSE)
 
+        # Other apps can subscribe to the responses for a (wtp, sta)
+        lvapp.register_demux(PT_WIFI_RC_STATS_RESPONSE, lvapp.demux_sta)
+
         # Data structures
         self.rates = {}
         self.best_prob = None
@@ -22,13 +22,35 @@ import logging
 from pymodm import MongoModel, fields
 
 from empower_core.serialize import serializable_dict
-from empower_core.etheraddress import EtherAddress
+from empower_core.etheraddress import EtherAddressField
+
+
+class EtherAddressListField(fields.ListField):
+    """A field that stores a list of Ethernet addresses.
+
+    Comma separated strings (as stored by older releases) are accepted.
+    """
+
+    def __init__(self, **kwargs):
+
+        super().__init__(EtherAddressField(), **kwargs)
+
+    def to_python(self, value):
+
+        if isinstance(value, str):
+            value = [addr for addr in value.split(",") if addr]
+
+        return super().to_python(value)
 
 
 @serializable_dict
 class Alert(MongoModel):
     """Base Alert class.
 
+    Subscriptions and WTPs are parsed once and then kept as sets, the
+    stored lists are updated with $addToSet/$pull by the alerts manager
+    (and fully rewritten only when the whole alert is saved).
+
     Attributes:
         uuid: This Device MAC address (EtherAddress)
         alert: A human-radable description of this Device (str)
@@ -39,52 +61,77 @@ class Alert(MongoModel):
 
     alert_id = fields.UUIDField(primary_key=True)
     message = fields.CharField(required=True)
-    subscriptions = fields.CharField(required=False)
-    wtps = fields.CharField(required=False)
+    subscriptions = EtherAddressListField(required=False, blank=True)
+    wtps = EtherAddressListField(required=False, blank=True)
 
     def __init__(self, **kwargs):
 
         super().__init__(**kwargs)
 
+        # Parsed subscriptions and wtps (see get_subs and get_wtps)
+        self._subs = None
+        self._wtps = None
+
         self.log = logging.getLogger("%s" % self.__class__.__module__)
 
     def get_wtps(self):
-        """Return wtps."""
+        """Return wtps (a set, do not modify)."""
+
+        if self._wtps is None:
+            self._wtps = set(self.wtps or [])
 
-        if self.wtps:
-            return {EtherAddress(x) for x in self.wtps.split(",")}
+        return self._wtps
 
-        return set()
+    def add_wtps(self, wtps):
+        """Add wtps, return the ones that were not there."""
 
-    def set_wtps(self, wtps):
-        """Set wtps."""
+        added = set(wtps) - self.get_wtps()
+        self._wtps |= added
 
-        if not wtps:
-            self.wtps = None
-            return
+        return added
 
-        self.wtps = ",".join([str(x) for x in wtps])
+    def del_wtps(self, wtps):
+        """Remove wtps, return the ones that were there."""
 
-        self.save()
+        removed = set(wtps) & self.get_wtps()
+        self._wtps -= removed
+
+        return removed
 
     def get_subs(self):
-        """Return subscriptions."""
+        """Return subscriptions (a set, do not modify)."""
+
+        if self._subs is None:
+            self._subs = set(self.subscriptions or [])
+
+        return self._subs
+
+    def add_subs(self, subs):
+        """Add subscriptions, return the ones that were not there."""
+
+        added = set(subs) - self.get_subs()
+        self._subs |= added
+
+        return added
+
+    def del_subs(self, subs):
+        """Remove subscriptions, return the ones that were there."""
 
-        if self.subscriptions:
-            return {EtherAddress(x) for x in self.subscriptions.split(",")}
+        removed = set(subs) & self.get_subs()
+        self._subs -= removed
 
-        return set()
+        return removed
 
-    def set_subs(self, subs):
-        """Set subscriptions."""
+    def to_son(self):
+        """Return the alert as SON, including the current sets."""
 
-        if not subs:
-            self.subscriptions = None
-            return
+        if self._subs is not None:
+            self.subscriptions = list(self._subs)
 
-        self.subscriptions = ",".join([str(x) for x in subs])
+        if self._wtps is not None:
+            self.wtps = list(self._wtps)
 
-        self.save()
+        return super().to_son()
 
     def to_dict(self):
         """Return JSON-serializable representation of the object."""
@@ -21,6 +21,8 @@ import uuid
 
 import empower_core.apimanager.apimanager as apimanager
 
+import empower.managers.asyncapi as asyncapi
+
 
 # pylint: disable=W0223
 class AlertsHandler(apimanager.APIHandler):
@@ -46,8 +48,8 @@ class AlertsHandler(apimanager.APIHandler):
         return self.service.alerts \
             if not args else self.service.alerts[uuid.UUID(args[0])]
 
-    @apimanager.validate(returncode=201, min_args=1, max_args=1)
-    def put(self, *args, **kwargs):
+    @asyncapi.validate(returncode=201, min_args=1, max_args=1)
+    async def put(self, *args, **kwargs):
         """Update an alert.
 
         Args:
@@ -63,13 +65,13 @@ class AlertsHandler(apimanager.APIHandler):
         alert_id = uuid.UUID(args[0])
 
         if 'message' in kwargs:
-            alert = self.service.update(alert_id=alert_id,
-                                        message=kwargs['message'])
+            alert = await self.service.update(alert_id=alert_id,
+                                              message=kwargs['message'])
 
         self.set_header("Location", "/api/v1/alerts/%s" % alert.alert_id)
 
-    @apimanager.validate(returncode=201, min_args=0, max_args=1)
-    def post(self, *args, **kwargs):
+    @asyncapi.validate(returncode=201, min_args=0, max_args=1)
+    async def post(self, *args, **kwargs):
         """Create a new alert.
 
         Args:
@@ -85,15 +87,15 @@ class AlertsHandler(apimanager.APIHandler):
         alert_id = uuid.UUID(args[0]) if args else uuid.uuid4()
 
         if 'message' in kwargs:
-            alert = self.service.create(alert_id=alert_id,
-                                        message=kwargs['message'])
+            alert = await self.service.create(alert_id=alert_id,
+                                              message=kwargs['message'])
         else:
-            alert = self.service.create(alert_id=alert_id)
+            alert = await self.service.create(alert_id=alert_id)
 
         self.set_header("Location", "/api/v1/alerts/%s" % alert.alert_id)
 
-    @apimanager.validate(returncode=204, min_args=0, max_args=1)
-    def delete(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=0, max_args=1)
+    async def delete(self, *args, **kwargs):
         """Delete one or all alerts.
 
         Args:
@@ -107,6 +109,6 @@ class AlertsHandler(apimanager.APIHandler):
         """
 
         if args:
-            self.service.remove(uuid.UUID(args[0]))
+            await self.service.remove(uuid.UUID(args[0]))
         else:
-            self.service.remove_all()
+            await self.service.remove_all()
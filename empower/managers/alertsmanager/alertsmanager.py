@@ -18,11 +18,18 @@
 """Alerts manager."""
 
 import math
+import time
+
+import tornado.gen
+import tornado.ioloop
+
+from pymodm.errors import ValidationError
 
 from empower_core.service import EService
 from empower_core.etheraddress import EtherAddress
 from empower_core.ssid import WIFI_NWID_MAXSIZE
 
+from empower.managers.persistence import Persistence, resolved, chain
 from empower.managers.alertsmanager.alert import Alert
 from empower.managers.alertsmanager.alertshandler import AlertsHandler
 from empower.managers.alertsmanager.alertssubscriptionshandler \
@@ -31,7 +38,11 @@ from empower.managers.alertsmanager.alertswtpshandler import AlertsWTPsHandler
 
 
 class AlertsManager(EService):
-    """Alerts manager."""
+    """Alerts manager.
+
+    The methods modifying the alerts return the Future of the write (see
+    Persistence), resolved with the alert.
+    """
 
     HANDLERS = [AlertsHandler, AlertsSubscriptionsHandler, AlertsWTPsHandler]
 
@@ -42,118 +53,269 @@ class AlertsManager(EService):
         self.alerts = {}
         self.message_id = 0
 
+        # alert_id -> prebuilt beacons
+        self.beacons = {}
+
+        # alert_id -> wtps broadcasting the alert
+        self.wtps = {}
+
+        # wtp -> alert_id -> alert
+        self.wtp_alerts = {}
+
+        # Alerts are saved without blocking the IOLoop
+        self.persistence = Persistence()
+
+        # Startup phase -> time (in ms) since the manager was started
+        self.startup = {}
+        self.start_time = None
+
     def start(self):
         """Start api manager."""
 
         super().start()
 
-        for alert in Alert.objects:
-            self.alerts[alert.alert_id] = alert
+        self.start_time = time.time()
+
+        tornado.ioloop.IOLoop.current().spawn_callback(self.load_alerts)
+
+    async def load_alerts(self):
+        """Load the alerts from the database in the background."""
+
+        async for batch in self.persistence.load(Alert):
+
+            for doc in batch:
+
+                alert = Alert.from_document(doc)
+
+                # Skip the alerts created in the meanwhile
+                if alert.alert_id in self.alerts:
+                    continue
+
+                self.alerts[alert.alert_id] = alert
+                self.index(alert)
+
+                # Lists stored as strings by older releases can not be
+                # updated with $addToSet/$pull, rewrite them
+                if not all(isinstance(doc.get(name, []), list)
+                           for name in ("subscriptions", "wtps")):
+                    self.persistence.save(alert)
+
+            await tornado.gen.sleep(0)
+
+        self.startup["ready"] = (time.time() - self.start_time) * 1000
+
+        self.log.info("Loaded %u alerts in %.1f ms", len(self.alerts),
+                      self.startup["ready"])
+
+    def stop(self):
+        """Stop the manager."""
+
+        super().stop()
+
+        self.persistence.shutdown()
+
+    def to_dict(self):
+        """Return JSON-serializable representation of the object."""
+
+        out = super().to_dict()
+        out["persistence"] = self.persistence.to_dict()
+        out["startup"] = self.startup
+
+        return out
+
+    def index(self, alert):
+        """Parse the alert and build its beacons.
+
+        Must be called every time the message of the alert is modified,
+        wtps are reindexed by add_wtps/del_wtps.
+        """
+
+        self.unindex(alert.alert_id)
+
+        self.wtps[alert.alert_id] = set()
+        self.beacons[alert.alert_id] = self.build_beacons(alert)
+
+        for wtp in alert.get_wtps():
+            self.index_wtp(alert, wtp)
+
+    def unindex(self, alert_id):
+        """Remove the alert from the indexes."""
+
+        for wtp in list(self.wtps.get(alert_id, [])):
+            self.unindex_wtp(alert_id, wtp)
+
+        self.wtps.pop(alert_id, None)
+        self.beacons.pop(alert_id, None)
+
+    def index_wtp(self, alert, wtp):
+        """Broadcast the alert from the wtp."""
+
+        self.wtps[alert.alert_id].add(wtp)
+        self.wtp_alerts.setdefault(wtp, {})[alert.alert_id] = alert
+
+    def unindex_wtp(self, alert_id, wtp):
+        """Stop broadcasting the alert from the wtp."""
+
+        self.wtps[alert_id].discard(wtp)
+
+        alerts = self.wtp_alerts[wtp]
+        del alerts[alert_id]
+
+        if not alerts:
+            del self.wtp_alerts[wtp]
 
     def get_beacons(self, sta, wtp):
         """Get all the beacons for this station."""
 
-        beacons = []
+        alerts = self.wtp_alerts.get(wtp)
 
-        for alert in self.alerts.values():
+        if not alerts:
+            return []
 
-            # wtp not in alert
-            if wtp not in alert.get_wtps():
-                continue
+        beacons = []
+
+        for alert_id in alerts:
 
             # sta not in subs, can ignore the alert
-            #if sta not in alert.get_subs():
+            #if sta not in alerts[alert_id].get_subs():
             #    continue
 
-            # start processing the alert
-            message = alert.message
+            beacons.extend(self.beacons[alert_id])
+
+        return beacons
+
+    def build_beacons(self, alert):
+        """Build the beacons carrying the alert message.
+
+        A new message id is used every time the beacons are built.
+        """
+
+        beacons = []
 
-            nb_chunks = math.ceil(len(message) / 30)
-            chunks = [message[i:i+30] for i in range(0, len(message), 30)]
+        message = alert.message
 
-            self.message_id = (self.message_id + 1) % 255
-            msg_id = '{0:0{1}X}'.format(self.message_id, 2)
+        nb_chunks = math.ceil(len(message) / 30)
+        chunks = [message[i:i+30] for i in range(0, len(message), 30)]
 
-            chunk_id = 0
+        self.message_id = (self.message_id + 1) % 255
+        msg_id = '{0:0{1}X}'.format(self.message_id, 2)
 
-            for chunk in chunks:
+        chunk_id = 0
 
-                bytes_ssid = chunk.encode('UTF-8')
-                bytes_ssid = bytes_ssid + b'\0' * \
-                    (WIFI_NWID_MAXSIZE + 1 - len(bytes_ssid))
+        for chunk in chunks:
 
-                if chunk_id == nb_chunks - 1:
-                    bssid = "00:0D:B9:%s:%u:00" % (msg_id, chunk_id)
-                else:
-                    bssid = "00:0D:B9:%s:%u:01" % (msg_id, chunk_id)
+            bytes_ssid = chunk.encode('UTF-8')
+            bytes_ssid = bytes_ssid + b'\0' * \
+                (WIFI_NWID_MAXSIZE + 1 - len(bytes_ssid))
 
-                beacon = {
-                    "dst": EtherAddress("FF:FF:FF:FF:FF:FF"),
-                    "bssid": EtherAddress(bssid),
-                    "ssid": bytes_ssid
-                }
+            if chunk_id == nb_chunks - 1:
+                bssid = "00:0D:B9:%s:%u:00" % (msg_id, chunk_id)
+            else:
+                bssid = "00:0D:B9:%s:%u:01" % (msg_id, chunk_id)
 
-                beacons.append(beacon)
+            beacon = {
+                "dst": EtherAddress("FF:FF:FF:FF:FF:FF"),
+                "bssid": EtherAddress(bssid),
+                "ssid": bytes_ssid
+            }
 
-                chunk_id = chunk_id + 1
+            beacons.append(beacon)
+
+            chunk_id = chunk_id + 1
 
         return beacons
 
     def add_sub(self, alert_id, sub):
         """Add a new subscription."""
 
+        return self.add_subs(alert_id, [sub])
+
+    def add_subs(self, alert_id, subs):
+        """Add many subscriptions at once."""
+
         alert = self.alerts[alert_id]
 
-        try:
-            subs = alert.get_subs()
-            subs.add(sub)
-            alert.set_subs(subs)
-        finally:
-            alert.refresh_from_db()
+        added = alert.add_subs([EtherAddress(sub) for sub in subs])
+
+        if not added:
+            return resolved(alert)
 
-        return self.alerts[alert.alert_id]
+        future = self.persistence.update(alert, {"$addToSet": {
+            "subscriptions": {"$each": [str(sub) for sub in added]}}})
+
+        return chain([future], alert)
 
     def del_sub(self, alert_id, sub):
         """Del a subscription."""
 
+        if sub not in self.alerts[alert_id].get_subs():
+            raise KeyError("Subscription %s not found" % sub)
+
+        return self.del_subs(alert_id, [sub])
+
+    def del_subs(self, alert_id, subs):
+        """Del many subscriptions at once (missing ones are ignored)."""
+
         alert = self.alerts[alert_id]
 
-        try:
-            subs = alert.get_subs()
-            subs.remove(sub)
-            alert.set_subs(subs)
-        finally:
-            alert.refresh_from_db()
+        removed = alert.del_subs([EtherAddress(sub) for sub in subs])
+
+        if not removed:
+            return resolved(alert)
+
+        future = self.persistence.update(alert, {"$pull": {
+            "subscriptions": {"$in": [str(sub) for sub in removed]}}})
 
-        return self.alerts[alert.alert_id]
+        return chain([future], alert)
 
     def add_wtp(self, alert_id, wtp):
         """Add a new wtp."""
 
+        return self.add_wtps(alert_id, [wtp])
+
+    def add_wtps(self, alert_id, wtps):
+        """Add many wtps at once."""
+
         alert = self.alerts[alert_id]
 
-        try:
-            wtps = alert.get_wtps()
-            wtps.add(wtp)
-            alert.set_wtps(wtps)
-        finally:
-            alert.refresh_from_db()
+        added = alert.add_wtps([EtherAddress(wtp) for wtp in wtps])
+
+        for wtp in added:
+            self.index_wtp(alert, wtp)
+
+        if not added:
+            return resolved(alert)
+
+        future = self.persistence.update(alert, {"$addToSet": {
+            "wtps": {"$each": [str(wtp) for wtp in added]}}})
 
-        return self.alerts[alert.alert_id]
+        return chain([future], alert)
 
     def del_wtp(self, alert_id, wtp):
         """Del a wtp."""
 
+        if wtp not in self.alerts[alert_id].get_wtps():
+            raise KeyError("WTP %s not found" % wtp)
+
+        return self.del_wtps(alert_id, [wtp])
+
+    def del_wtps(self, alert_id, wtps):
+        """Del many wtps at once (missing ones are ignored)."""
+
         alert = self.alerts[alert_id]
 
-        try:
-            wtps = alert.get_wtps()
-            wtps.remove(wtp)
-            alert.set_wtps(wtps)
-        finally:
-            alert.refresh_from_db()
+        removed = alert.del_wtps([EtherAddress(wtp) for wtp in wtps])
+
+        for wtp in removed:
+            self.unindex_wtp(alert_id, wtp)
 
-        return self.alerts[alert.alert_id]
+        if not removed:
+            return resolved(alert)
+
+        future = self.persistence.update(alert, {"$pull": {
+            "wtps": {"$in": [str(wtp) for wtp in removed]}}})
+
+        return chain([future], alert)
 
     def create(self, alert_id, message="Generic alert"):
         """Create new alert."""
@@ -162,30 +324,34 @@ class AlertsManager(EService):
             raise ValueError("Alert %s already defined" % alert_id)
 
         alert = Alert(alert_id=alert_id, message=message)
-        alert.save()
+        future = self.persistence.save(alert)
 
         self.alerts[alert.alert_id] = alert
+        self.index(alert)
 
-        return self.alerts[alert.alert_id]
+        return chain([future], alert)
 
     def update(self, alert_id, message):
         """Create new alert."""
 
         alert = self.alerts[alert_id]
+        old_message = alert.message
 
         try:
             alert.message = message
-            alert.save()
-        finally:
-            alert.refresh_from_db()
+            future = self.persistence.save(alert)
+        except ValidationError:
+            alert.message = old_message
+            raise
 
-        return self.alerts[alert.alert_id]
+        self.index(alert)
+
+        return chain([future], alert)
 
     def remove_all(self):
         """Remove all alerts."""
 
-        for alert_id in list(self.alerts):
-            self.remove(alert_id)
+        return chain([self.remove(alert_id) for alert_id in list(self.alerts)])
 
     def remove(self, alert_id):
         """Remove alert."""
@@ -195,9 +361,12 @@ class AlertsManager(EService):
 
         alert = self.alerts[alert_id]
 
-        alert.delete()
+        future = self.persistence.delete(alert)
 
         del self.alerts[alert_id]
+        self.unindex(alert_id)
+
+        return future
 
 
 def launch(context, service_id):
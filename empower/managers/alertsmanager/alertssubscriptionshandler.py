@@ -23,6 +23,8 @@ import empower_core.apimanager.apimanager as apimanager
 
 from empower_core.etheraddress import EtherAddress
 
+import empower.managers.asyncapi as asyncapi
+
 
 # pylint: disable=W0223
 class AlertsSubscriptionsHandler(apimanager.APIHandler):
@@ -56,40 +58,83 @@ class AlertsSubscriptionsHandler(apimanager.APIHandler):
 
         raise KeyError()
 
-    @apimanager.validate(returncode=201, min_args=2, max_args=2)
-    def post(self, *args, **kwargs):
-        """Add a subscription.
+    @asyncapi.validate(returncode=201, min_args=1, max_args=2)
+    async def post(self, *args, **kwargs):
+        """Add one or more subscriptions.
 
         Args:
 
             [0], the alert id (mandatory)
-            [1], the sub
+            [1], the sub (optional)
+
+        Request:
+
+            version: the protocol version (1.0)
+            subs: the list of subs (mandatory if the sub is not specified)
+
+        Example URLs:
+
+            POST /api/v1/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/subs/
+                00:0D:B9:2F:56:64
+
+            POST /api/v1/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/subs
+
+            {
+                "version": "1.0",
+                "subs": ["00:0D:B9:2F:56:64", "00:0D:B9:2F:56:65"]
+            }
         """
 
         alert_id = uuid.UUID(args[0])
+
+        if len(args) == 1:
+
+            await self.service.add_subs(alert_id=alert_id, subs=kwargs['subs'])
+
+            self.set_header("Location", "/api/v1/alerts/%s/subs" % alert_id)
+
+            return
+
         sub = EtherAddress(args[1])
 
-        self.service.add_sub(alert_id=alert_id, sub=sub)
+        await self.service.add_sub(alert_id=alert_id, sub=sub)
 
         self.set_header("Location",
                         "/api/v1/alerts/%s/subs/%s" % (alert_id, sub))
 
-    @apimanager.validate(returncode=204, min_args=2, max_args=2)
-    def delete(self, *args, **kwargs):
-        """Delete one sub.
+    @asyncapi.validate(returncode=204, min_args=1, max_args=2)
+    async def delete(self, *args, **kwargs):
+        """Delete one or more subs.
 
         Args:
 
             [0], the alert id
-            [1], the sub
+            [1], the sub (optional)
+
+        Request:
+
+            version: the protocol version (1.0)
+            subs: the list of subs (mandatory if the sub is not specified)
 
         Example URLs:
 
             DELETE /api/v1/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/subs/
                 00:0D:B9:2F:56:64
+
+            DELETE /api/v1/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/subs
+
+            {
+                "version": "1.0",
+                "subs": ["00:0D:B9:2F:56:64", "00:0D:B9:2F:56:65"]
+            }
         """
 
         alert_id = uuid.UUID(args[0])
+
+        if len(args) == 1:
+            await self.service.del_subs(alert_id=alert_id, subs=kwargs['subs'])
+            return
+
         sub = EtherAddress(args[1])
 
-        self.service.del_sub(alert_id=alert_id, sub=sub)
+        await self.service.del_sub(alert_id=alert_id, sub=sub)
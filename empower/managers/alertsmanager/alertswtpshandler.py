@@ -23,6 +23,8 @@ import empower_core.apimanager.apimanager as apimanager
 
 from empower_core.etheraddress import EtherAddress
 
+import empower.managers.asyncapi as asyncapi
+
 
 # pylint: disable=W0223
 class AlertsWTPsHandler(apimanager.APIHandler):
@@ -58,40 +60,83 @@ class AlertsWTPsHandler(apimanager.APIHandler):
 
         raise KeyError()
 
-    @apimanager.validate(returncode=201, min_args=2, max_args=2)
-    def post(self, *args, **kwargs):
-        """Add a WTP.
+    @asyncapi.validate(returncode=201, min_args=1, max_args=2)
+    async def post(self, *args, **kwargs):
+        """Add one or more WTPs.
 
         Args:
 
             [0], the alert id (mandatory)
-            [1], the wtp id
+            [1], the wtp id (optional)
+
+        Request:
+
+            version: the protocol version (1.0)
+            wtps: the list of wtps (mandatory if the wtp is not specified)
+
+        Example URLs:
+
+            POST /api/v1/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/wtps/
+                00:0D:B9:54:27:F8
+
+            POST /api/v1/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/wtps
+
+            {
+                "version": "1.0",
+                "wtps": ["00:0D:B9:54:27:F8", "00:0D:B9:54:27:F9"]
+            }
         """
 
         alert_id = uuid.UUID(args[0])
+
+        if len(args) == 1:
+
+            await self.service.add_wtps(alert_id=alert_id, wtps=kwargs['wtps'])
+
+            self.set_header("Location", "/api/v1/alerts/%s/wtps" % alert_id)
+
+            return
+
         wtp = EtherAddress(args[1])
 
-        self.service.add_wtp(alert_id=alert_id, wtp=wtp)
+        await self.service.add_wtp(alert_id=alert_id, wtp=wtp)
 
         self.set_header("Location",
                         "/api/v1/alerts/%s/wtps/%s" % (alert_id, wtp))
 
-    @apimanager.validate(returncode=204, min_args=2, max_args=2)
-    def delete(self, *args, **kwargs):
-        """Delete one wtp.
+    @asyncapi.validate(returncode=204, min_args=1, max_args=2)
+    async def delete(self, *args, **kwargs):
+        """Delete one or more wtps.
 
         Args:
 
             [0], the alert id
-            [1], the wtp id
+            [1], the wtp id (optional)
+
+        Request:
+
+            version: the protocol version (1.0)
+            wtps: the list of wtps (mandatory if the wtp is not specified)
 
         Example URLs:
 
-            DELETE /api/v1/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/subs/
-                00:0D:B9:2F:56:64
+            DELETE /api/v1/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/wtps/
+                00:0D:B9:54:27:F8
+
+            DELETE /api/v1/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/wtps
+
+            {
+                "version": "1.0",
+                "wtps": ["00:0D:B9:54:27:F8", "00:0D:B9:54:27:F9"]
+            }
         """
 
         alert_id = uuid.UUID(args[0])
+
+        if len(args) == 1:
+            await self.service.del_wtps(alert_id=alert_id, wtps=kwargs['wtps'])
+            return
+
         wtp = EtherAddress(args[1])
 
-        self.service.del_wtp(alert_id=alert_id, wtp=wtp)
+        await self.service.del_wtp(alert_id=alert_id, wtp=wtp)
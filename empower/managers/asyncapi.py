@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Asynchronous REST methods."""
+
+import json
+
+from pymodm.errors import ValidationError
+from pymongo.errors import PyMongoError
+
+
+def validate(returncode=200, min_args=0, max_args=0):
+    """Validate asynchronous REST method.
+
+    Same as apimanager.validate, but the method is a coroutine (e.g. it
+    waits for a database write). Failed writes are reported with a 500.
+    """
+
+    def decorator(func):
+
+        async def magic(self, *args):
+
+            try:
+
+                if len(args) < min_args or len(args) > max_args:
+                    msg = "Invalid url (%u, %u)" % (min_args, max_args)
+                    raise ValueError(msg)
+
+                params = {}
+
+                if self.request.body and json.loads(self.request.body):
+                    params = json.loads(self.request.body)
+
+                if "version" in params:
+                    del params["version"]
+
+                output = await func(self, *args, **params)
+
+                if returncode == 200:
+                    self.write_as_json(output)
+
+            except KeyError as ex:
+                self.send_error(404, message=str(ex))
+
+            except ValueError as ex:
+                self.send_error(400, message=str(ex))
+
+            except AttributeError as ex:
+                self.send_error(400, message=str(ex))
+
+            except TypeError as ex:
+                self.send_error(400, message=str(ex))
+
+            except ValidationError as ex:
+                self.send_error(400, message=ex.message)
+
+            except PyMongoError as ex:
+                self.send_error(500, message=str(ex))
+
+            self.set_status(returncode, None)
+
+        magic.__doc__ = func.__doc__
+
+        return magic
+
+    return decorator
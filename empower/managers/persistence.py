@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Persistence helpers.
+
+Saving a document with pymodm blocks the IOLoop for a full round trip to
+MongoDB. Persistence validates the document and converts it to SON on the
+IOLoop (so that it is never accessed by two threads at the same time) and
+only runs the write in a worker thread, returning a Future. Persistence
+can also load the documents of a model in batches, without blocking the
+IOLoop. WriteBehind collects the documents to be saved and writes them
+later, at most once per flush.
+"""
+
+import itertools
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.gen
+import tornado.ioloop
+
+from tornado.concurrent import Future
+
+# Max time (in ms) a modified document can wait before being written
+DEFAULT_MAX_STALENESS = 1000
+
+# Number of threads writing to the database
+DEFAULT_MAX_WORKERS = 1
+
+# Number of documents fetched at a time when loading a model
+DEFAULT_BATCH_SIZE = 500
+
+
+def locate(doc):
+    """Return the collection and the filter of the document."""
+
+    meta = doc._mongometa
+
+    return meta.collection, {'_id': meta.pk.to_mongo(doc.pk)}
+
+
+def snapshot(doc):
+    """Return the collection, the filter and the SON of the document."""
+
+    collection, flt = locate(doc)
+
+    return collection, flt, doc.to_son()
+
+
+def write(snapshots):
+    """Write the snapshots (blocking)."""
+
+    for collection, flt, son in snapshots:
+        collection.replace_one(flt, son, upsert=True)
+
+
+def remove(collection, flt):
+    """Delete a document (blocking)."""
+
+    collection.delete_one(flt)
+
+
+def modify(collection, flt, update):
+    """Update a document in place (blocking)."""
+
+    collection.update_one(flt, update)
+
+
+def fetch(cursor, size):
+    """Return the next size documents of the cursor (blocking)."""
+
+    return list(itertools.islice(cursor, size))
+
+
+def projection(model, names=None):
+    """Return the database names of the fields of the model.
+
+    If names is specified only the fields with those attribute names are
+    returned.
+    """
+
+    return [field.mongo_name for field in model._mongometa.get_fields()
+            if names is None or field.attname in names]
+
+
+def find(model, query, fields=None):
+    """Return the documents of a model matching the query (blocking).
+
+    As in Persistence.load, only the specified fields (by default all the
+    fields of the model) are fetched and the documents are returned as
+    dictionaries.
+    """
+
+    fields = fields or projection(model)
+
+    return list(model.objects.raw(query).only(*fields).values())
+
+
+def resolved(result=None):
+    """Return a Future already resolved with result."""
+
+    future = Future()
+    future.set_result(result)
+
+    return future
+
+
+def chain(futures, result=None):
+    """Return a Future resolved with result once all the futures are done.
+
+    The Future fails with the first exception raised by the futures.
+    """
+
+    chained = Future()
+
+    def on_done(future):
+
+        if future.exception():
+            chained.set_exception(future.exception())
+        else:
+            chained.set_result(result)
+
+    tornado.gen.multi(futures).add_done_callback(on_done)
+
+    return chained
+
+
+def to_bool(value):
+    """Parse a boolean parameter (e.g. from the configuration file)."""
+
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes", "on")
+
+    return bool(value)
+
+
+class Persistence:
+    """Save and delete pymodm documents without blocking the IOLoop.
+
+    Documents are validated on the IOLoop, so validation errors are raised
+    to the caller, then written by a bounded pool of worker threads. With
+    a single worker (the default) operations hit the database in the same
+    order they are issued. Every method returns a Future.
+
+    Managers apply their changes in memory and return the Future of the
+    write, resolved with the value of the change (see chain). The REST
+    handlers await it, so a reply is sent only once the write is durable
+    and failed writes are reported to the client.
+
+    The latency of each operation (from the call to the end of the write)
+    is recorded per document class and operation, e.g. "Alert.save".
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+
+        self.log = logging.getLogger("%s" % self.__class__.__module__)
+
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        # operation -> latency stats
+        self.stats = {}
+
+    def save(self, doc):
+        """Validate the document and write it."""
+
+        doc.full_clean()
+
+        return self.submit("%s.save" % doc.__class__.__name__, write,
+                           [snapshot(doc)])
+
+    def update(self, doc, update):
+        """Apply an update (e.g. $addToSet) to the stored document.
+
+        The document is not validated, nor converted to SON.
+        """
+
+        collection, flt = locate(doc)
+
+        return self.submit("%s.update" % doc.__class__.__name__, modify,
+                           collection, flt, update)
+
+    def delete(self, doc):
+        """Delete the document."""
+
+        collection, flt = locate(doc)
+
+        return self.submit("%s.delete" % doc.__class__.__name__, remove,
+                           collection, flt)
+
+    async def load(self, model, batch_size=DEFAULT_BATCH_SIZE, fields=None):
+        """Yield the documents of a model, a batch at a time.
+
+        Only the specified fields (by default all the fields of the model)
+        are fetched. Documents are yielded as dictionaries, use
+        model.from_document() to build the instances.
+        """
+
+        fields = fields or projection(model)
+
+        cursor = iter(model.objects.only(*fields).values())
+        cursor.batch_size(batch_size)
+
+        operation = "%s.load" % model.__name__
+
+        while True:
+
+            batch = await self.submit(operation, fetch, cursor, batch_size)
+
+            if not batch:
+                return
+
+            yield batch
+
+    def submit(self, operation, func, *args):
+        """Run func in the executor and record its latency."""
+
+        start = time.time()
+
+        future = tornado.ioloop.IOLoop.current().run_in_executor(
+            self.executor, func, *args)
+
+        def on_done(future):
+
+            latency = (time.time() - start) * 1000
+
+            stats = self.stats.setdefault(operation, {
+                "count": 0,
+                "errors": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0
+            })
+
+            stats["count"] += 1
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+
+            if future.exception():
+                stats["errors"] += 1
+                self.log.error("%s failed: %s", operation, future.exception())
+
+        future.add_done_callback(on_done)
+
+        return future
+
+    def shutdown(self):
+        """Wait for the pending operations."""
+
+        self.executor.shutdown(wait=True)
+
+    def to_dict(self):
+        """Return JSON-serializable representation of the object."""
+
+        operations = {}
+
+        for operation, stats in self.stats.items():
+            operations[operation] = dict(stats)
+            operations[operation]["avg_latency"] = \
+                stats["total_latency"] / stats["count"]
+
+        return {
+            "max_workers": self.max_workers,
+            "operations": operations
+        }
+
+
+class WriteBehind:
+    """Coalesce and delay the saves of pymodm documents.
+
+    Documents marked as dirty are written at most max_staleness ms later,
+    every document is written once per flush no matter how many times it
+    has been marked. Failed writes are retried at the next flush, unless
+    the document has been discarded in the meantime.
+
+    Writes are performed by a single worker thread, so they hit the
+    database in the same order they are flushed.
+    """
+
+    def __init__(self, max_staleness=DEFAULT_MAX_STALENESS,
+                 flush_on_shutdown=True, executor=None):
+
+        self.log = logging.getLogger("%s" % self.__class__.__module__)
+
+        self.max_staleness = max_staleness
+        self.flush_on_shutdown = flush_on_shutdown
+
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+
+        # pk -> document, in marking order
+        self.dirty = {}
+
+        # pks discarded while a flush is in progress, never retried
+        self.discarded = set()
+        self.flushing = 0
+
+        self.timer = None
+
+        self.marks = 0
+        self.writes = 0
+        self.errors = 0
+
+    def mark(self, doc):
+        """Schedule a save of the document."""
+
+        self.marks += 1
+        self.dirty[doc.pk] = doc
+        self.discarded.discard(doc.pk)
+
+        self.schedule()
+
+    def schedule(self):
+        """Arm the flush timer (if not armed)."""
+
+        if not self.timer:
+            self.timer = tornado.ioloop.IOLoop.current().call_later(
+                self.max_staleness / 1000, self.on_timer)
+
+    def on_timer(self):
+        """Flush the dirty documents."""
+
+        self.timer = None
+        self.flush()
+
+    def discard(self, doc):
+        """Forget a pending save (e.g. the document has been deleted)."""
+
+        self.dirty.pop(doc.pk, None)
+
+        if self.flushing:
+            self.discarded.add(doc.pk)
+
+    def cancel_timer(self):
+        """Cancel the pending flush."""
+
+        if self.timer:
+            tornado.ioloop.IOLoop.current().remove_timeout(self.timer)
+            self.timer = None
+
+    def flush(self):
+        """Write the dirty documents, return a Future (or None)."""
+
+        self.cancel_timer()
+
+        if not self.dirty:
+            return None
+
+        docs = list(self.dirty.values())
+        self.dirty.clear()
+
+        snapshots = [snapshot(doc) for doc in docs]
+
+        self.flushing += 1
+
+        future = tornado.ioloop.IOLoop.current().run_in_executor(
+            self.executor, write, snapshots)
+
+        def on_done(future):
+
+            self.flushing -= 1
+
+            if not future.exception():
+                self.writes += len(docs)
+            else:
+                self.retry(docs, future.exception())
+
+            if not self.flushing:
+                self.discarded.clear()
+
+        future.add_done_callback(on_done)
+
+        return future
+
+    def retry(self, docs, error):
+        """Schedule the documents of a failed flush again."""
+
+        self.errors += 1
+        self.log.error("Unable to save %u documents: %s", len(docs), error)
+
+        # Skip the documents marked again or discarded
+        docs = [doc for doc in docs
+                if doc.pk not in self.dirty and doc.pk not in self.discarded]
+
+        if not docs:
+            return
+
+        for doc in docs:
+            self.dirty[doc.pk] = doc
+
+        self.schedule()
+
+    def shutdown(self):
+        """Wait for the pending writes, then flush synchronously."""
+
+        self.cancel_timer()
+        self.executor.shutdown(wait=True)
+
+        if not self.dirty:
+            return
+
+        if not self.flush_on_shutdown:
+            self.log.warning("Dropping %u unsaved documents",
+                             len(self.dirty))
+            self.dirty.clear()
+            return
+
+        write([snapshot(doc) for doc in self.dirty.values()])
+
+        self.writes += len(self.dirty)
+        self.dirty.clear()
+
+    def to_dict(self):
+        """Return JSON-serializable representation of the object."""
+
+        return {
+            "max_staleness": self.max_staleness,
+            "flush_on_shutdown": self.flush_on_shutdown,
+            "dirty": len(self.dirty),
+            "marks": self.marks,
+            "writes": self.writes,
+            "errors": self.errors
+        }
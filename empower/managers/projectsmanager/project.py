@@ -33,6 +33,7 @@ from empower_core.launcher import srv_or_die
 from empower_core.serialize import serializable_dict
 from empower_core.app import EApp
 
+from empower.managers.persistence import chain
 from empower.managers.ranmanager.lvapp.wifislice import WiFiSlice
 from empower.managers.ranmanager.vbsp.lteslice import LTESlice
 
@@ -288,49 +289,43 @@ class EmpowerProject(Env):
     def vbses(self):
         """Return the VBSes."""
 
-        return srv_or_die("vbspmanager").devices
+        return srv_or_die("vbspmanager").get_devices()
 
     @property
     def wtps(self):
         """Return the WTPs."""
 
-        return srv_or_die("lvappmanager").devices
+        return srv_or_die("lvappmanager").get_devices()
 
     @property
     def users(self):
-        """Return the UEs."""
+        """Return the UEs (a live view of the VBSP manager users)."""
 
         if not self.lte_props:
             return {}
 
-        users = {k: v for k, v in srv_or_die("vbspmanager").users.items()
-                 if v.plmnid == self.lte_props.plmnid}
-
-        return users
+        return srv_or_die("vbspmanager").users.lookup("plmnid",
+                                                      self.lte_props.plmnid)
 
     @property
     def lvaps(self):
-        """Return the LVAPs."""
+        """Return the LVAPs (a live view of the LVAPP manager LVAPs)."""
 
         if not self.wifi_props:
             return {}
 
-        lvaps = {k: v for k, v in srv_or_die("lvappmanager").lvaps.items()
-                 if v.ssid == self.wifi_props.ssid}
-
-        return lvaps
+        return srv_or_die("lvappmanager").lvaps.lookup("ssid",
+                                                       self.wifi_props.ssid)
 
     @property
     def vaps(self):
-        """Return the VAPs."""
+        """Return the VAPs (a live view of the LVAPP manager VAPs)."""
 
         if not self.wifi_props:
             return {}
 
-        vaps = {k: v for k, v in srv_or_die("lvappmanager").vaps.items()
-                if v.ssid == self.wifi_props.ssid}
-
-        return vaps
+        return srv_or_die("lvappmanager").vaps.lookup("ssid",
+                                                      self.wifi_props.ssid)
 
     def load_service(self, service_id, name, params):
         """Load a service instance."""
@@ -343,59 +338,84 @@ class EmpowerProject(Env):
 
         return service
 
+    def save_later(self):
+        """Save the project in the background (see WriteBehind)."""
+
+        self.manager.write_behind.mark(self)
+
+    def save_or_restore(self, mapping, old):
+        """Save the project, restoring mapping to old if it is not valid.
+
+        Must be called after changing mapping and before sending anything
+        to the devices, so that invalid changes are never applied. Returns
+        the Future of the write.
+        """
+
+        try:
+            return self.manager.persistence.save(self)
+        except ValidationError:
+            mapping.clear()
+            mapping.update(old)
+            raise
+
     def upsert_acl(self, addr, desc):
         """Upsert ACL."""
 
         acl = ACL(addr=addr, desc=desc)
 
+        old = dict(self.wifi_props.allowed)
         self.wifi_props.allowed[str(acl.addr)] = acl
+        future = self.save_or_restore(self.wifi_props.allowed, old)
 
-        self.save()
+        self.manager.update_indexes()
 
-        return acl
+        return chain([future], acl)
 
     def remove_acl(self, addr=None):
         """Upsert new slice."""
 
+        old = dict(self.wifi_props.allowed)
+
         if addr:
             del self.wifi_props.allowed[str(addr)]
         else:
-            for k in list(self.wifi_props.allowed.keys()):
-                del self.wifi_props.allowed[k]
+            self.wifi_props.allowed.clear()
+
+        future = self.save_or_restore(self.wifi_props.allowed, old)
 
-        self.save()
+        self.manager.update_indexes()
+
+        return future
 
     def upsert_wifi_slice(self, **kwargs):
         """Upsert new slice."""
 
         slc = WiFiSlice(**kwargs)
 
+        old = dict(self.wifi_slices)
+        self.wifi_slices[str(slc.slice_id)] = slc
+        future = self.save_or_restore(self.wifi_slices, old)
+
         for wtp in self.wtps.values():
             for block in wtp.blocks.values():
                 wtp.connection.send_set_slice(self, slc, block)
 
-        self.wifi_slices[str(slc.slice_id)] = slc
-
-        self.save()
-        self.refresh_from_db()
-
-        return slc.slice_id
+        return chain([future], slc.slice_id)
 
     def upsert_lte_slice(self, **kwargs):
         """Upsert new slice."""
 
         slc = LTESlice(**kwargs)
 
+        old = dict(self.lte_slices)
+        self.lte_slices[str(slc.slice_id)] = slc
+        future = self.save_or_restore(self.lte_slices, old)
+
         for vbs in self.vbses.values():
             for cell in vbs.cells.values():
                 vbs.connection.send_set_slice(self, slc, cell)
 
-        self.lte_slices[str(slc.slice_id)] = slc
-
-        self.save()
-        self.refresh_from_db()
-
-        return slc.slice_id
+        return chain([future], slc.slice_id)
 
     def delete_wifi_slice(self, slice_id):
         """Delete slice."""
@@ -405,14 +425,15 @@ class EmpowerProject(Env):
 
         slc = self.wifi_slices[slice_id]
 
+        old = dict(self.wifi_slices)
+        del self.wifi_slices[slice_id]
+        future = self.save_or_restore(self.wifi_slices, old)
+
         for wtp in self.wtps.values():
             for block in wtp.blocks.values():
                 wtp.connection.send_del_slice(self, slc.slice_id, block)
 
-        del self.wifi_slices[slice_id]
-
-        self.save()
-        self.refresh_from_db()
+        return future
 
     def delete_lte_slice(self, slice_id):
         """Delete slice."""
@@ -422,14 +443,15 @@ class EmpowerProject(Env):
 
         slc = self.lte_slices[slice_id]
 
+        old = dict(self.lte_slices)
+        del self.lte_slices[slice_id]
+        future = self.save_or_restore(self.lte_slices, old)
+
         for vbs in self.vbses.values():
             for cell in vbs.cells.values():
                 vbs.connection.send_del_slice(self, slc.slice_id, cell)
 
-        del self.lte_slices[slice_id]
-
-        self.save()
-        self.refresh_from_db()
+        return future
 
     def to_dict(self):
         """Return JSON-serializable representation of the object."""
@@ -460,14 +482,16 @@ class EmpowerProject(Env):
         tokens = [self.project_id.hex[0:12][i:i + 2] for i in range(0, 12, 2)]
         return EtherAddress(':'.join(tokens))
 
+    def get_bssid_prefix(self):
+        """Return the first three bytes of the BSSIDs as an integer."""
+
+        # Same as the tenant prefix but with the multicast bit cleared
+        return int(self.project_id.hex[0:6], 16) & 0xFEFFFF
+
     def generate_bssid(self, mac):
         """ Generate a new BSSID address. """
 
-        base_mac = self.get_prefix()
-
-        base = str(base_mac).split(":")[0:3]
-        unicast_addr_mask = int(base[0], 16) & 0xFE
-        base[0] = str(format(unicast_addr_mask, 'X'))
-        suffix = str(mac).split(":")[3:6]
+        prefix = self.get_bssid_prefix().to_bytes(3, "big")
+        suffix = EtherAddress(mac).to_raw()[3:6]
 
-        return EtherAddress(":".join(base + suffix))
+        return EtherAddress(prefix + suffix)
@@ -21,6 +21,8 @@ import uuid
 
 import empower_core.apimanager.apimanager as apimanager
 
+import empower.managers.asyncapi as asyncapi
+
 
 # pylint: disable=W0223
 class ProjectsHandler(apimanager.APIHandler):
@@ -187,8 +189,8 @@ class ProjectsHandler(apimanager.APIHandler):
         return self.service.projects \
             if not args else self.service.projects[uuid.UUID(args[0])]
 
-    @apimanager.validate(returncode=201, min_args=0, max_args=1)
-    def post(self, *args, **kwargs):
+    @asyncapi.validate(returncode=201, min_args=0, max_args=1)
+    async def post(self, *args, **kwargs):
         """Create a new project.
 
         Args:
@@ -212,24 +214,24 @@ class ProjectsHandler(apimanager.APIHandler):
         wifi_slcs = kwargs['wifi_slices'] if 'wifi_slices' in kwargs else None
         lte_slcs = kwargs['lte_slices'] if 'lte_slices' in kwargs else None
 
-        project = self.service.create(project_id=project_id,
-                                      desc=kwargs['desc'],
-                                      owner=kwargs['owner'],
-                                      wifi_props=wifi_props,
-                                      lte_props=lte_props)
+        project = await self.service.create(project_id=project_id,
+                                            desc=kwargs['desc'],
+                                            owner=kwargs['owner'],
+                                            wifi_props=wifi_props,
+                                            lte_props=lte_props)
 
         if wifi_slcs:
             for wifi_slice in wifi_slcs:
-                project.upsert_wifi_slice(**wifi_slice)
+                await project.upsert_wifi_slice(**wifi_slice)
 
         if lte_slcs:
             for lte_slice in lte_slcs:
-                project.upsert_lte_slice(**lte_slice)
+                await project.upsert_lte_slice(**lte_slice)
 
         self.set_header("Location", "/api/v1/projects/%s" % project.project_id)
 
-    @apimanager.validate(returncode=204, min_args=1, max_args=1)
-    def put(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=1, max_args=1)
+    async def put(self, *args, **kwargs):
         """Update a project.
 
         Args:
@@ -244,10 +246,10 @@ class ProjectsHandler(apimanager.APIHandler):
 
         project_id = uuid.UUID(args[0])
 
-        self.service.update(project_id=project_id, desc=kwargs['desc'])
+        await self.service.update(project_id=project_id, desc=kwargs['desc'])
 
-    @apimanager.validate(returncode=204, min_args=0, max_args=1)
-    def delete(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=0, max_args=1)
+    async def delete(self, *args, **kwargs):
         """Delete one or all projects.
 
         Args:
@@ -261,6 +263,6 @@ class ProjectsHandler(apimanager.APIHandler):
         """
 
         if args:
-            self.service.remove(uuid.UUID(args[0]))
+            await self.service.remove(uuid.UUID(args[0]))
         else:
-            self.service.remove_all()
+            await self.service.remove_all()
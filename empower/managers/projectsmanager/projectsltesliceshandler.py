@@ -21,6 +21,8 @@ import uuid
 
 import empower_core.apimanager.apimanager as apimanager
 
+import empower.managers.asyncapi as asyncapi
+
 
 # pylint: disable=W0223
 class ProjectsLTESlicesHandler(apimanager.APIHandler):
@@ -45,8 +47,8 @@ class ProjectsLTESlicesHandler(apimanager.APIHandler):
         return project.lte_slices \
             if len(args) == 1 else project.lte_slices[str(args[1])]
 
-    @apimanager.validate(returncode=201, min_args=0, max_args=1)
-    def post(self, *args, **kwargs):
+    @asyncapi.validate(returncode=201, min_args=0, max_args=1)
+    async def post(self, *args, **kwargs):
         """Create a new slice.
 
         Args:
@@ -63,15 +65,13 @@ class ProjectsLTESlicesHandler(apimanager.APIHandler):
 
         project_id = uuid.UUID(args[0])
         project = self.service.projects[project_id]
-        slice_id = project.upsert_lte_slice(**kwargs)
-        project.save()
-        project.refresh_from_db()
+        slice_id = await project.upsert_lte_slice(**kwargs)
 
         self.set_header("Location", "/api/v1/projects/%s/lte_slices/%s" %
                         (project_id, slice_id))
 
-    @apimanager.validate(returncode=204, min_args=2, max_args=2)
-    def put(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=2, max_args=2)
+    async def put(self, *args, **kwargs):
         """Update slice.
 
         Args:
@@ -91,10 +91,10 @@ class ProjectsLTESlicesHandler(apimanager.APIHandler):
         slice_id = str(args[1])
         kwargs['slice_id'] = slice_id
         project = self.service.projects[project_id]
-        project.upsert_lte_slice(**kwargs)
+        await project.upsert_lte_slice(**kwargs)
 
-    @apimanager.validate(returncode=204, min_args=2, max_args=2)
-    def delete(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=2, max_args=2)
+    async def delete(self, *args, **kwargs):
         """Delete a slice.
 
         Args:
@@ -111,4 +111,4 @@ class ProjectsLTESlicesHandler(apimanager.APIHandler):
         project_id = uuid.UUID(args[0])
         slice_id = str(args[1])
         project = self.service.projects[project_id]
-        project.delete_lte_slice(slice_id)
+        await project.delete_lte_slice(slice_id)
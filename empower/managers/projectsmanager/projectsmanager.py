@@ -19,6 +19,8 @@
 
 from pymodm.errors import ValidationError
 
+from empower_core.etheraddress import EtherAddress
+from empower_core.launcher import srv_or_die
 from empower_core.projectsmanager.projectsmanager import ProjectsManager
 
 from empower_core.projectsmanager.appcallbackhandler import \
@@ -26,6 +28,8 @@ from empower_core.projectsmanager.appcallbackhandler import \
 from empower_core.projectsmanager.cataloghandler import CatalogHandler
 from empower_core.projectsmanager.appshandler import AppsHandler
 
+from empower.managers.persistence import Persistence, WriteBehind, chain, \
+    to_bool, DEFAULT_MAX_STALENESS
 from empower.managers.projectsmanager.projectshandler import ProjectsHandler
 from empower.managers.projectsmanager.project import EmpowerProject
 from empower.managers.projectsmanager.project import EmbeddedWiFiProps
@@ -44,8 +48,26 @@ from empower.managers.projectsmanager.projectsusershandler import \
     ProjectsUsersHandler
 
 
+def mac_to_int(addr):
+    """Return the Ethernet address as an integer."""
+
+    return int.from_bytes(EtherAddress(addr).to_raw(), "big")
+
+
 class EmpowerProjectsManager(ProjectsManager):
-    """Projects manager."""
+    """Projects manager.
+
+    Parameters:
+        catalog_packages: the packages where apps are looked for
+        max_staleness: max time (in ms) a project modified by the
+            southbound can wait before being saved (optional, default: 1000)
+        flush_on_shutdown: save the modified projects on shutdown
+            (optional, default: True)
+
+    The methods modifying the projects (as well as the ACL and slice
+    methods of the projects) return the Future of the write (see
+    Persistence), resolved with the project (the ACL or the slice id).
+    """
 
     HANDLERS = [CatalogHandler, AppsHandler, ProjectsLVAPsHandler,
                 ProjectsHandler, ProjectsWiFiACLHandler,
@@ -54,44 +76,190 @@ class EmpowerProjectsManager(ProjectsManager):
 
     PROJECT_IMPL = EmpowerProject
 
-    def load_project_by_ssid(self, ssid):
-        """Find a project by SSID."""
+    def __init__(self, context, service_id, catalog_packages,
+                 max_staleness=DEFAULT_MAX_STALENESS, flush_on_shutdown=True):
+
+        super().__init__(context=context, service_id=service_id,
+                         catalog_packages=catalog_packages,
+                         max_staleness=max_staleness,
+                         flush_on_shutdown=flush_on_shutdown)
+
+        # Projects are saved without blocking the IOLoop. All the writes
+        # share the same worker, so they hit the database in order
+        self.persistence = Persistence()
+
+        # Projects saved in the background (see EmpowerProject.save_later)
+        self.write_behind = WriteBehind(self.max_staleness,
+                                        self.flush_on_shutdown,
+                                        self.persistence.executor)
+
+        # SSID -> project
+        self.ssids = {}
+
+        # PLMNID -> project
+        self.plmnids = {}
+
+        # BSSID prefix (first three bytes as an integer) -> [projects]
+        self.bssid_prefixes = {}
+
+        # Station (as an integer) -> [projects with the station in the ACL]
+        self.stations = {}
+
+        # (station, block hwaddr) -> available networks (see
+        # get_available_ssids), only for stations in some ACL
+        self.networks = {}
+
+    @property
+    def max_staleness(self):
+        """Return max_staleness."""
+
+        return self.params["max_staleness"]
+
+    @max_staleness.setter
+    def max_staleness(self, value):
+        """Set max_staleness."""
+
+        self.params["max_staleness"] = int(value)
+
+    @property
+    def flush_on_shutdown(self):
+        """Return flush_on_shutdown."""
+
+        return self.params["flush_on_shutdown"]
+
+    @flush_on_shutdown.setter
+    def flush_on_shutdown(self, value):
+        """Set flush_on_shutdown."""
+
+        self.params["flush_on_shutdown"] = to_bool(value)
+
+    def start(self):
+        """Start projects manager."""
+
+        super().start()
+
+        self.update_indexes()
+
+    def stop(self):
+        """Stop projects manager."""
+
+        super().stop()
+
+        # Waits for the pending writes (the executor is shared) first
+        self.write_behind.shutdown()
+
+    def to_dict(self):
+        """Return JSON-serializable representation of the object."""
+
+        out = super().to_dict()
+        out["persistence"] = self.persistence.to_dict()
+        out["write_behind"] = self.write_behind.to_dict()
+
+        return out
+
+    def update_indexes(self):
+        """Rebuild the indexes and drop the cached networks.
+
+        Must be called every time a project is created or removed or when
+        its ACL, wifi_props or lte_props change.
+        """
+
+        self.ssids = {}
+        self.plmnids = {}
+        self.bssid_prefixes = {}
+        self.stations = {}
+        self.networks = {}
 
         for project in self.projects.values():
-            if not project.wifi_props:
-                continue
-            if project.wifi_props.ssid == ssid:
-                break
-        else:
-            project = None
 
-        return project
+            # In case of duplicates the first project wins
+            if project.wifi_props:
+                self.ssids.setdefault(project.wifi_props.ssid, project)
+                self.bssid_prefixes.setdefault(project.get_bssid_prefix(),
+                                               []).append(project)
+
+                for addr in project.wifi_props.allowed:
+                    self.stations.setdefault(mac_to_int(addr),
+                                             []).append(project)
+
+            if project.lte_props:
+                self.plmnids.setdefault(project.lte_props.plmnid, project)
+
+    def load_project_by_ssid(self, ssid):
+        """Find a project by SSID."""
+
+        return self.ssids.get(ssid)
 
     def load_project_by_plmnid(self, plmnid):
         """Find a project by PLMNID."""
 
-        for project in self.projects.values():
-            if not project.lte_props:
+        return self.plmnids.get(plmnid)
+
+    def load_project_by_bssid(self, bssid, sta, ssid=None):
+        """Find the project serving the BSSID to the specified station.
+
+        Unique BSSIDs are made of the project prefix followed by the last
+        three bytes of the station address, shared BSSIDs are the ones of
+        the project VAPs. Projects with unique BSSIDs are checked first. If
+        the SSID is specified only projects with that SSID are matched.
+        """
+
+        value = mac_to_int(bssid)
+        projects = self.bssid_prefixes.get(value >> 24, [])
+
+        for project in projects:
+
+            if project.wifi_props.bssid_type != T_BSSID_TYPE_UNIQUE:
+                continue
+
+            if value & 0xFFFFFF != mac_to_int(sta) & 0xFFFFFF:
+                continue
+
+            if ssid is None or project.wifi_props.ssid == ssid:
+                return project
+
+        for project in projects:
+
+            if project.wifi_props.bssid_type == T_BSSID_TYPE_UNIQUE:
                 continue
-            if project.lte_props.plmnid == plmnid:
-                break
-        else:
-            project = None
 
-        return project
+            if bssid not in project.vaps:
+                continue
+
+            if ssid is None or project.wifi_props.ssid == ssid:
+                return project
+
+        return None
+
+    def is_allowed(self, sta):
+        """Return True if the station is in the ACL of some project."""
+
+        return mac_to_int(sta) in self.stations
 
     def get_available_ssids(self, sta, block):
         """Return the list of available networks for the specified sta."""
 
-        networks = list()
+        station = mac_to_int(sta)
 
-        for project in self.projects.values():
+        # The station is not in any ACL
+        if station not in self.stations:
+            return []
 
-            if not project.wifi_props:
-                continue
+        key = (station, mac_to_int(block.hwaddr))
 
-            if str(sta) not in project.wifi_props.allowed:
-                continue
+        if key not in self.networks:
+            self.networks[key] = \
+                self.compute_available_ssids(self.stations[station], sta,
+                                             block)
+
+        return list(self.networks[key])
+
+    def compute_available_ssids(self, projects, sta, block):
+        """Return the networks available at block from the projects."""
+
+        networks = list()
+
+        for project in projects:
 
             if project.wifi_props.bssid_type == T_BSSID_TYPE_SHARED:
 
@@ -115,7 +283,17 @@ class EmpowerProjectsManager(ProjectsManager):
     def create(self, desc, project_id, owner, wifi_props=None, lte_props=None):
         """Create new project."""
 
-        project = super().create(desc=desc, project_id=project_id, owner=owner)
+        if project_id in self.projects:
+            raise ValueError("Project %s already defined" % project_id)
+
+        accounts_manager = srv_or_die("accountsmanager")
+
+        if owner not in accounts_manager.accounts:
+            raise KeyError("Username %s not found" % owner)
+
+        project = self.PROJECT_IMPL(project_id=project_id,
+                                    desc=desc,
+                                    owner=owner)
 
         try:
 
@@ -125,10 +303,21 @@ class EmpowerProjectsManager(ProjectsManager):
             if lte_props:
                 project.lte_props = EmbeddedLTEProps(**lte_props)
 
-            project.save()
+            project.full_clean()
+
+        except ValidationError as ex:
+            raise ValueError(ex)
 
-            project.upsert_wifi_slice(slice_id=0)
-            project.upsert_lte_slice(slice_id=0)
+        self.projects[project_id] = project
+        self.projects[project_id].start_services()
+
+        self.update_indexes()
+
+        # Default slices, each upsert saves the project
+        try:
+
+            futures = [project.upsert_wifi_slice(slice_id=0),
+                       project.upsert_lte_slice(slice_id=0)]
 
         except ValueError as ex:
             self.remove(project.project_id)
@@ -138,7 +327,28 @@ class EmpowerProjectsManager(ProjectsManager):
             self.remove(project.project_id)
             raise ValueError(ex)
 
-        return self.projects[project_id]
+        return chain(futures, project)
+
+    def update(self, project_id, desc):
+        """Update project."""
+
+        project = self.projects[project_id]
+        old_desc = project.desc
+
+        try:
+            project.desc = desc
+            future = self.persistence.save(project)
+        except ValidationError:
+            project.desc = old_desc
+            raise
+
+        return chain([future], project)
+
+    def remove_all(self):
+        """Remove all projects."""
+
+        return chain([self.remove(project_id)
+                      for project_id in list(self.projects)])
 
     def remove(self, project_id):
         """Remove project."""
@@ -178,12 +388,25 @@ class EmpowerProjectsManager(ProjectsManager):
             del vap.wtp.connection.manager.vaps[vap.bssid]
             vap.clear_block()
 
+        # Do not resurrect the project
+        self.write_behind.discard(project)
+
         # Remove project
-        super().remove(project_id)
+        project.stop_services()
+
+        future = self.persistence.delete(project)
+        del self.projects[project_id]
+
+        self.update_indexes()
+
+        return future
 
 
-def launch(context, service_id, catalog_packages):
+def launch(context, service_id, catalog_packages,
+           max_staleness=DEFAULT_MAX_STALENESS, flush_on_shutdown=True):
     """ Initialize the module. """
 
     return EmpowerProjectsManager(context=context, service_id=service_id,
-                                  catalog_packages=catalog_packages)
+                                  catalog_packages=catalog_packages,
+                                  max_staleness=max_staleness,
+                                  flush_on_shutdown=flush_on_shutdown)
@@ -23,6 +23,8 @@ import empower_core.apimanager.apimanager as apimanager
 
 from empower_core.etheraddress import EtherAddress
 
+import empower.managers.asyncapi as asyncapi
+
 
 # pylint: disable=W0223
 class ProjectsWiFiACLHandler(apimanager.APIHandler):
@@ -76,8 +78,8 @@ class ProjectsWiFiACLHandler(apimanager.APIHandler):
 
         return allowed if not args else allowed[str(EtherAddress(args[1]))]
 
-    @apimanager.validate(returncode=204, min_args=2, max_args=2)
-    def put(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=2, max_args=2)
+    async def put(self, *args, **kwargs):
         """Update entry in ACL.
 
         Args:
@@ -101,10 +103,10 @@ class ProjectsWiFiACLHandler(apimanager.APIHandler):
         desc = "Generic Station" if 'desc' not in kwargs else kwargs['desc']
         addr = EtherAddress(args[1])
 
-        project.upsert_acl(addr, desc)
+        await project.upsert_acl(addr, desc)
 
-    @apimanager.validate(returncode=201, min_args=1, max_args=1)
-    def post(self, *args, **kwargs):
+    @asyncapi.validate(returncode=201, min_args=1, max_args=1)
+    async def post(self, *args, **kwargs):
         """Add entry in ACL.
 
         Args:
@@ -128,14 +130,14 @@ class ProjectsWiFiACLHandler(apimanager.APIHandler):
         desc = "Generic Station" if 'desc' not in kwargs else kwargs['desc']
         addr = EtherAddress(kwargs['addr'])
 
-        acl = project.upsert_acl(addr, desc)
+        acl = await project.upsert_acl(addr, desc)
 
         url = "/api/v1/projects/%s/wifi_acl/%s" % (project_id, acl.addr)
 
         self.set_header("Location", url)
 
-    @apimanager.validate(returncode=204, min_args=1, max_args=2)
-    def delete(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=1, max_args=2)
+    async def delete(self, *args, **kwargs):
         """Delete an entry in ACL.
 
         Args:
@@ -153,6 +155,6 @@ class ProjectsWiFiACLHandler(apimanager.APIHandler):
         project = self.service.projects[project_id]
 
         if len(args) == 2:
-            project.remove_acl(EtherAddress(args[1]))
+            await project.remove_acl(EtherAddress(args[1]))
         else:
-            project.remove_acl()
+            await project.remove_acl()
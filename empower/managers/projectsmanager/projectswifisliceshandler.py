@@ -21,6 +21,8 @@ import uuid
 
 import empower_core.apimanager.apimanager as apimanager
 
+import empower.managers.asyncapi as asyncapi
+
 
 # pylint: disable=W0223
 class ProjectsWiFiSlicesHandler(apimanager.APIHandler):
@@ -102,8 +104,8 @@ class ProjectsWiFiSlicesHandler(apimanager.APIHandler):
         return project.wifi_slices \
             if len(args) == 1 else project.wifi_slices[str(args[1])]
 
-    @apimanager.validate(returncode=201, min_args=0, max_args=1)
-    def post(self, *args, **kwargs):
+    @asyncapi.validate(returncode=201, min_args=0, max_args=1)
+    async def post(self, *args, **kwargs):
         """Create a new slice.
 
         Args:
@@ -120,15 +122,13 @@ class ProjectsWiFiSlicesHandler(apimanager.APIHandler):
 
         project_id = uuid.UUID(args[0])
         project = self.service.projects[project_id]
-        slice_id = project.upsert_wifi_slice(**kwargs)
-        project.save()
-        project.refresh_from_db()
+        slice_id = await project.upsert_wifi_slice(**kwargs)
 
         self.set_header("Location", "/api/v1/projects/%s/wifi_slices/%s" %
                         (project_id, slice_id))
 
-    @apimanager.validate(returncode=204, min_args=2, max_args=2)
-    def put(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=2, max_args=2)
+    async def put(self, *args, **kwargs):
         """Update a slice.
 
         Args:
@@ -148,10 +148,10 @@ class ProjectsWiFiSlicesHandler(apimanager.APIHandler):
         slice_id = str(args[1])
         kwargs['slice_id'] = slice_id
         project = self.service.projects[project_id]
-        project.upsert_wifi_slice(**kwargs)
+        await project.upsert_wifi_slice(**kwargs)
 
-    @apimanager.validate(returncode=204, min_args=2, max_args=2)
-    def delete(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=2, max_args=2)
+    async def delete(self, *args, **kwargs):
         """Delete a slice.
 
         Args:
@@ -168,4 +168,4 @@ class ProjectsWiFiSlicesHandler(apimanager.APIHandler):
         project_id = uuid.UUID(args[0])
         slice_id = str(args[1])
         project = self.service.projects[project_id]
-        project.delete_wifi_slice(slice_id)
+        await project.delete_wifi_slice(slice_id)
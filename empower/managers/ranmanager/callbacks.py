@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Registry of the app callbacks for southbound messages."""
+
+
+class CallbackRegistry:
+    """Registry of the app callbacks for southbound messages.
+
+    Callbacks for each packet type are kept in an insertion-ordered dict
+    (used as an ordered set), so that adding and removing a callback is O(1)
+    and callbacks are invoked in registration order.
+
+    Dispatching uses immutable tuple snapshots of the callbacks which are
+    rebuilt lazily after a change. The version is bumped every time packet
+    types or callbacks change so that connections can refresh their
+    dispatch tables.
+
+    Apps are registered through a per-class manifest listing the handlers
+    the class actually defines, so registration does not probe every packet
+    type. Handlers set on the app instance are looked up at registration.
+
+    Apps can also subscribe to the items of a message matching a key (e.g.
+    the reports for a certain UE). A demultiplexer registered for the packet
+    type splits each message into (key, item) pairs, the message is thus
+    decoded once and every item is delivered only to the callbacks
+    subscribed to its key.
+    """
+
+    def __init__(self):
+
+        # pt_type -> {callback: None}
+        self.handlers = {}
+
+        # message name -> {pt_type: None} (several types can share a name)
+        self.names = {}
+
+        # pt_type -> message name
+        self.types = {}
+
+        # pt_type -> tuple of callbacks
+        self.snapshots = {}
+
+        # (class, prefix) -> ((pt_type, attribute), ...)
+        self.manifests = {}
+
+        # pt_type -> demux(msg, device), returning (key, item) pairs
+        self.demuxers = {}
+
+        # pt_type -> {key: {callback: None}}
+        self.subscribers = {}
+
+        self.version = 0
+
+    def add_type(self, pt_type, name):
+        """Add a new packet type."""
+
+        if pt_type in self.handlers and self.types.get(pt_type) == name:
+            return
+
+        # The packet type is being renamed
+        if pt_type in self.types:
+
+            pt_types = self.names[self.types[pt_type]]
+            del pt_types[pt_type]
+
+            if not pt_types:
+                del self.names[self.types[pt_type]]
+
+        self.handlers.setdefault(pt_type, {})
+        self.names.setdefault(name, {})[pt_type] = None
+        self.types[pt_type] = name
+
+        self.snapshots.pop(pt_type, None)
+        self.manifests.clear()
+        self.version += 1
+
+    def add(self, pt_type, callback):
+        """Add a callback for the packet type."""
+
+        if pt_type not in self.handlers:
+            raise KeyError("Packet type %s undefined" % pt_type)
+
+        self.handlers[pt_type][callback] = None
+
+        self.snapshots.pop(pt_type, None)
+        self.version += 1
+
+    def remove(self, pt_type, callback):
+        """Remove a callback for the packet type."""
+
+        if pt_type not in self.handlers:
+            raise KeyError("Packet type %s undefined" % pt_type)
+
+        if callback not in self.handlers[pt_type]:
+            raise ValueError("Callback %s not registered" % callback)
+
+        del self.handlers[pt_type][callback]
+
+        self.snapshots.pop(pt_type, None)
+        self.version += 1
+
+    def callbacks(self, pt_type):
+        """Return the tuple of callbacks for the packet type."""
+
+        if pt_type in self.snapshots:
+            return self.snapshots[pt_type]
+
+        snapshot = tuple(self.handlers.get(pt_type, ()))
+        self.snapshots[pt_type] = snapshot
+
+        return snapshot
+
+    def entries(self, attrs, prefix):
+        """Return the (pt_type, attribute) pairs matching the attributes."""
+
+        entries = []
+
+        for attr in attrs:
+
+            if not attr.startswith(prefix):
+                continue
+
+            for pt_type in self.names.get(attr[len(prefix):], ()):
+                entries.append((pt_type, attr))
+
+        return tuple(entries)
+
+    def manifest(self, app, prefix):
+        """Return the (pt_type, attribute) pairs of the app handlers."""
+
+        key = (app.__class__, prefix)
+
+        if key not in self.manifests:
+            self.manifests[key] = self.entries(dir(app.__class__), prefix)
+
+        # Handlers set on the instance (not cached)
+        attrs = [attr for attr in getattr(app, "__dict__", ())
+                 if not hasattr(app.__class__, attr)]
+
+        if not attrs:
+            return self.manifests[key]
+
+        return self.manifests[key] + self.entries(attrs, prefix)
+
+    def register_app(self, app, prefix):
+        """Register all the handlers defined by the app."""
+
+        for pt_type, attr in self.manifest(app, prefix):
+            self.add(pt_type, getattr(app, attr))
+
+    def unregister_app(self, app, prefix):
+        """Unregister all the handlers defined by the app."""
+
+        for pt_type, attr in self.manifest(app, prefix):
+            self.remove(pt_type, getattr(app, attr))
+
+    def set_demux(self, pt_type, demux):
+        """Set the demultiplexer for the packet type."""
+
+        if pt_type not in self.handlers:
+            raise KeyError("Packet type %s undefined" % pt_type)
+
+        if self.demuxers.get(pt_type) == demux:
+            return
+
+        self.demuxers[pt_type] = demux
+        self.subscribers.setdefault(pt_type, {})
+        self.version += 1
+
+    def subscribe(self, pt_type, key, callback):
+        """Subscribe to the items of the packet type matching the key.
+
+        The callback is invoked as callback(item, device).
+        """
+
+        if pt_type not in self.demuxers:
+            raise KeyError("Packet type %s has no demultiplexer" % pt_type)
+
+        self.subscribers[pt_type].setdefault(key, {})[callback] = None
+
+    def unsubscribe(self, pt_type, key, callback):
+        """Remove a subscription."""
+
+        if pt_type not in self.demuxers:
+            raise KeyError("Packet type %s has no demultiplexer" % pt_type)
+
+        callbacks = self.subscribers[pt_type].get(key)
+
+        if not callbacks or callback not in callbacks:
+            raise ValueError("Callback %s not subscribed" % callback)
+
+        del callbacks[callback]
+
+        if not callbacks:
+            del self.subscribers[pt_type][key]
+
+    def publish(self, pt_type, msg, device):
+        """Deliver the items of the message to the matching subscribers."""
+
+        subscribers = self.subscribers.get(pt_type)
+
+        # Nobody is interested, do not even demultiplex
+        if not subscribers:
+            return
+
+        for key, item in self.demuxers[pt_type](msg, device):
+
+            callbacks = subscribers.get(key)
+
+            if not callbacks:
+                continue
+
+            for callback in tuple(callbacks):
+                callback(item, device)
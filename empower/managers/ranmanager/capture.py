@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Southbound traffic capture and replay.
+
+A capture file starts with MAGIC followed by a sequence of records. Every
+record has a fixed size header (kind, connection id, arrival timestamp,
+payload length and device address) followed by the payload:
+
+  OPEN:  a new connection, the payload is the peer address ("ip:port")
+  FRAME: a frame received from the device, the payload is the frame
+  CLOSE: the connection has been closed, no payload
+
+Captures are written by the RAN managers when the capture parameter is set
+(e.g. capture=/var/log/empower/lvapp.cap in the manager section of the
+configuration file) and are read through a memory map.
+
+Captures can be fed back to a RAN manager with Replay, either at the
+original pace or as fast as possible. Connections are emulated with
+ReplayStreams, so no sockets are needed, and the frames sent by the
+runtime are counted and dropped. Devices must be known to the manager.
+"""
+
+import collections
+import logging
+import mmap
+import struct
+import time
+
+import tornado.gen
+import tornado.ioloop
+
+from tornado.iostream import StreamClosedError
+
+MAGIC = b"EMPCAP01"
+
+RECORD_OPEN = 0
+RECORD_FRAME = 1
+RECORD_CLOSE = 2
+
+# kind, connection id, timestamp, payload length, device
+RECORD = struct.Struct(">BIdI6s")
+
+# Frames replayed before yielding to the IOLoop (fast mode)
+REPLAY_BATCH = 64
+
+CaptureRecord = collections.namedtuple(
+    "CaptureRecord", ["kind", "conn_id", "ts", "device", "payload"])
+
+
+class CaptureWriter:
+    """Append-only capture file."""
+
+    def __init__(self, path, device_offset):
+
+        self.path = path
+        self.device_offset = device_offset
+
+        self.file = open(path, "ab")
+
+        if not self.file.tell():
+            self.file.write(MAGIC)
+
+        self.last_id = 0
+        self.frames = 0
+
+    def write(self, kind, conn_id, payload=b"", device=bytes(6)):
+        """Append a record."""
+
+        # Connections can outlive the capture (see shutdown)
+        if self.file.closed:
+            return
+
+        self.file.write(RECORD.pack(kind, conn_id, time.time(), len(payload),
+                                    device))
+        self.file.write(payload)
+
+    def open(self, address):
+        """Record a new connection and return its id."""
+
+        self.last_id += 1
+
+        self.write(RECORD_OPEN, self.last_id,
+                   ("%s:%u" % tuple(address[:2])).encode())
+
+        if not self.file.closed:
+            self.file.flush()
+
+        return self.last_id
+
+    def frame(self, conn_id, frame):
+        """Record a frame."""
+
+        device = bytes(frame[self.device_offset:self.device_offset + 6])
+
+        self.write(RECORD_FRAME, conn_id, frame, device)
+        self.frames += 1
+
+    def close(self, conn_id):
+        """Record the end of a connection."""
+
+        self.write(RECORD_CLOSE, conn_id)
+
+        if not self.file.closed:
+            self.file.flush()
+
+    def shutdown(self):
+        """Close the capture file."""
+
+        self.file.close()
+
+    def to_dict(self):
+        """Return a JSON-serializable dictionary."""
+
+        return {
+            "path": self.path,
+            "connections": self.last_id,
+            "frames": self.frames
+        }
+
+
+class CaptureReader:
+    """Memory mapped capture file."""
+
+    def __init__(self, path):
+
+        self.path = path
+
+        with open(path, "rb") as capture:
+
+            if capture.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a capture file" % path)
+
+            self.map = mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+
+        data = self.map
+        offset = len(MAGIC)
+        end = len(data)
+
+        while offset + RECORD.size <= end:
+
+            kind, conn_id, ts, length, device = \
+                RECORD.unpack_from(data, offset)
+
+            offset += RECORD.size
+
+            # Truncated record (e.g. the runtime was killed)
+            if offset + length > end:
+                break
+
+            # Slicing the map copies just the payload, no views are
+            # exported so the map can always be closed
+            yield CaptureRecord(kind, conn_id, ts, device,
+                                data[offset:offset + length])
+
+            offset += length
+
+    def close(self):
+        """Unmap the capture file."""
+
+        self.map.close()
+
+
+class ReplayFuture:
+    """The result of a read on a ReplayStream.
+
+    Callbacks are invoked synchronously, so replays are deterministic.
+    """
+
+    def __init__(self):
+
+        self.callbacks = []
+        self.value = None
+        self.error = None
+        self.resolved = False
+
+    def add_done_callback(self, callback):
+        """Invoke callback(self) when the read completes."""
+
+        if self.resolved:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def done(self):
+        """Return True if the read completed."""
+
+        return self.resolved
+
+    def result(self):
+        """Return the number of bytes read."""
+
+        if self.error:
+            raise self.error
+
+        return self.value
+
+    def resolve(self, value=None, error=None):
+        """Complete the read."""
+
+        self.value = value
+        self.error = error
+        self.resolved = True
+
+        callbacks, self.callbacks = self.callbacks, []
+
+        for callback in callbacks:
+            callback(self)
+
+
+class ReplaySocket:
+    """The socket of a ReplayStream."""
+
+    def __init__(self, address):
+        self.address = address
+
+    def getpeername(self):
+        """Return the address of the (original) peer."""
+
+        return self.address
+
+
+class ReplayStream:
+    """A stand-in for IOStream fed with captured frames."""
+
+    def __init__(self, address):
+
+        self.socket = ReplaySocket(address)
+
+        self.pending = bytearray()
+        self.read = None
+
+        self.is_closed = False
+        self.close_callback = None
+
+        self.tx_messages = 0
+        self.tx_bytes = 0
+
+    def set_nodelay(self, value):
+        """Nothing to do."""
+
+    def set_close_callback(self, callback):
+        """Set the callback invoked when the stream is closed."""
+
+        self.close_callback = callback
+
+    def read_into(self, buf, partial=False):
+        """Read the fed data into buf."""
+
+        future = ReplayFuture()
+
+        if self.is_closed:
+            future.resolve(error=StreamClosedError())
+            return future
+
+        self.read = (buf, future)
+
+        if self.pending:
+            self.deliver()
+
+        return future
+
+    def feed(self, data):
+        """Append data to the stream."""
+
+        if self.is_closed:
+            return
+
+        self.pending += data
+
+        if self.read:
+            self.deliver()
+
+    def deliver(self):
+        """Complete the pending read."""
+
+        buf, future = self.read
+        self.read = None
+
+        count = min(len(buf), len(self.pending))
+
+        buf[:count] = self.pending[:count]
+        del self.pending[:count]
+
+        future.resolve(count)
+
+    def write(self, data):
+        """Count and drop the data sent by the runtime."""
+
+        if self.is_closed:
+            raise StreamClosedError()
+
+        self.tx_messages += 1
+        self.tx_bytes += len(data)
+
+    def closed(self):
+        """Return True if the stream is closed."""
+
+        return self.is_closed
+
+    def close(self):
+        """Close the stream."""
+
+        if self.is_closed:
+            return
+
+        self.is_closed = True
+
+        if self.read:
+            _, future = self.read
+            self.read = None
+            future.resolve(error=StreamClosedError())
+
+        # Like IOStream, the close callback is invoked asynchronously
+        if self.close_callback:
+            tornado.ioloop.IOLoop.current().add_callback(self.close_callback)
+
+
+class Replay:
+    """Feed a capture to a RAN manager.
+
+    If realtime is True frames are replayed at the original pace, otherwise
+    they are replayed as fast as possible (yielding to the IOLoop every
+    REPLAY_BATCH frames so that timers and queued writes are processed).
+    """
+
+    def __init__(self, manager, path, realtime=False):
+
+        self.log = logging.getLogger("%s" % self.__class__.__module__)
+
+        self.manager = manager
+        self.path = path
+        self.realtime = realtime
+
+        # conn_id -> ReplayStream (open connections)
+        self.streams = {}
+
+        self.frames = 0
+        self.connections = 0
+        self.tx_messages = 0
+        self.elapsed = 0
+
+    async def run(self):
+        """Replay the capture."""
+
+        reader = CaptureReader(self.path)
+
+        start = time.time()
+        origin = None
+        count = 0
+
+        try:
+
+            for record in reader:
+
+                if origin is None:
+                    origin = record.ts
+
+                if self.realtime:
+                    delay = (record.ts - origin) - (time.time() - start)
+                    if delay > 0:
+                        await tornado.gen.sleep(delay)
+                elif count % REPLAY_BATCH == 0:
+                    await tornado.gen.sleep(0)
+
+                count += 1
+
+                self.replay(record)
+
+        finally:
+            reader.close()
+
+        # Let the pending callbacks run
+        await tornado.gen.sleep(0)
+
+        self.elapsed = time.time() - start
+
+        return self.to_dict()
+
+    def replay(self, record):
+        """Replay a single record."""
+
+        if record.kind == RECORD_OPEN:
+
+            host, port = record.payload.decode().rsplit(":", 1)
+            stream = ReplayStream((host, int(port)))
+
+            self.streams[record.conn_id] = stream
+            self.connections += 1
+
+            self.manager.handle_stream(stream, stream.socket.address)
+
+            return
+
+        stream = self.streams.get(record.conn_id)
+
+        if not stream:
+            self.log.warning("Unknown connection %u", record.conn_id)
+            return
+
+        if record.kind == RECORD_FRAME:
+            self.frames += 1
+            stream.feed(record.payload)
+        elif record.kind == RECORD_CLOSE:
+            stream.close()
+            self.tx_messages += stream.tx_messages
+            del self.streams[record.conn_id]
+
+    def to_dict(self):
+        """Return a JSON-serializable dictionary."""
+
+        tx_messages = self.tx_messages + \
+            sum(stream.tx_messages for stream in self.streams.values())
+
+        return {
+            "connections": self.connections,
+            "open_connections": len(self.streams),
+            "frames": self.frames,
+            "tx_messages": tx_messages,
+            "elapsed": self.elapsed
+        }
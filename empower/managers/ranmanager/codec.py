@@ -0,0 +1,1134 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Precompiled codecs for the southbound protocols.
+
+Messages are described with construct Structs. A Struct is compiled once
+into a codec in which consecutive fixed size fields (integers, fixed length
+byte strings, paddings and bit structs) are merged into a single
+struct.Struct. Variable size fields (arrays, greedy ranges and byte strings
+whose length depends on other fields) are handled by dedicated operations.
+
+Parsed messages are returned as records: light-weight objects with one slot
+per field that support both attribute and item access. Structs that use
+constructs not supported by the compiler are wrapped in a codec that falls
+back to construct.
+"""
+
+import struct
+import keyword
+
+from operator import attrgetter
+
+from construct import Struct, FormatField, Bytes, Array, GreedyRange, \
+    Transformed, Renamed, Padded, BitsInteger, Flag, Pass
+from construct.lib import bytes2bits
+
+# Names that cannot be used as fields since they are record methods
+RESERVED = ("get", "keys", "values", "items")
+
+# Struct format characters for bit structs of the given size (in bytes)
+BITS_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+# Segment fields kinds
+VALUE = 0
+BYTES = 1
+BITS = 2
+NONE = 3
+FLAG = 4
+
+
+class CodecError(ValueError):
+    """Raised when a message cannot be parsed or built."""
+
+
+class Unsupported(Exception):
+    """Raised when a Struct cannot be compiled."""
+
+
+class Context(dict):
+    """The context passed to construct expressions and lambdas."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class Record:
+    """A parsed message.
+
+    Fields can be accessed both as attributes and as items, so that records
+    can be used wherever a construct Container was used. When compared with
+    a mapping, keys starting with an underscore (e.g. '_io') are ignored.
+    """
+
+    __slots__ = ()
+
+    _fields = ()
+
+    def __getitem__(self, key):
+
+        if key not in self._fields:
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+
+        if key not in self._fields:
+            raise KeyError(key)
+
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+
+        if not hasattr(other, "keys"):
+            return NotImplemented
+
+        keys = [k for k in other.keys() if not str(k).startswith("_")]
+
+        if sorted(keys) != sorted(self._fields):
+            return False
+
+        for key in self._fields:
+            if getattr(self, key) != other[key]:
+                return False
+
+        return True
+
+    __hash__ = None
+
+    def __repr__(self):
+
+        fields = ", ".join("%s=%r" % (k, getattr(self, k))
+                           for k in self._fields)
+
+        return "%s(%s)" % (self.__class__.__name__, fields)
+
+    def get(self, key, default=None):
+        """Return the value of the field or default."""
+
+        if key not in self._fields:
+            return default
+
+        return getattr(self, key)
+
+    def keys(self):
+        """Return the fields names."""
+
+        return list(self._fields)
+
+    def values(self):
+        """Return the fields values."""
+
+        return [getattr(self, k) for k in self._fields]
+
+    def items(self):
+        """Return the (name, value) pairs."""
+
+        return [(k, getattr(self, k)) for k in self._fields]
+
+
+def make_record(name, fields):
+    """Generate a new record class with the specified fields."""
+
+    args = "".join(", %s" % field for field in fields)
+    body = "".join("\n    _self.%s = %s" % (field, field) for field in fields)
+
+    namespace = {}
+    exec("def __init__(_self%s):%s\n    pass" % (args, body), namespace)
+
+    attrs = {
+        "__slots__": tuple(fields),
+        "_fields": tuple(fields),
+        "__init__": namespace["__init__"],
+    }
+
+    return type(str(name), (Record,), attrs)
+
+
+def to_bytes(value, length):
+    """Convert the value to a bytes string of the specified length."""
+
+    if isinstance(value, int):
+        try:
+            value = value.to_bytes(length, "big")
+        except OverflowError:
+            raise CodecError("%u does not fit in %u bytes" % (value, length))
+    elif not isinstance(value, bytes):
+        value = bytes(value)
+
+    if len(value) != length:
+        raise CodecError("expected %u bytes, got %u" % (length, len(value)))
+
+    return value
+
+
+class BitsSpec:
+    """A bit struct packed in a single integer."""
+
+    def __init__(self, name, fields, size):
+
+        self.size = size
+        self.fmt = BITS_FORMATS.get(size, "%ds" % size)
+        self.fields = fields
+        self.buildnone = all(kind is NONE for _, kind, _, _, _ in fields)
+        self.record = make_record(name, [f[0] for f in fields if f[0]])
+
+    def parse(self, value):
+        """Split the integer into a record."""
+
+        if isinstance(value, bytes):
+            value = int.from_bytes(value, "big")
+
+        values = []
+
+        for name, kind, shift, width, signed in self.fields:
+
+            if not name:
+                continue
+
+            if kind is NONE:
+                values.append(None)
+                continue
+
+            field = (value >> shift) & ((1 << width) - 1)
+
+            if kind is FLAG:
+                field = bool(field)
+            elif signed and field >> (width - 1):
+                field -= 1 << width
+
+            values.append(field)
+
+        return self.record(*values)
+
+    def build(self, obj):
+        """Pack the record into an integer."""
+
+        value = 0
+
+        for name, kind, shift, width, signed in self.fields:
+
+            if kind is NONE:
+                continue
+
+            field = obj[name]
+
+            if kind is FLAG:
+                value |= (1 if field else 0) << shift
+                continue
+
+            if not isinstance(field, int):
+                raise CodecError("value %r is not an integer" % field)
+
+            low = -(1 << (width - 1)) if signed else 0
+            high = (1 << (width - 1 if signed else width)) - 1
+
+            if not low <= field <= high:
+                raise CodecError("%d does not fit in %u bits" % (field, width))
+
+            value |= (field & ((1 << width) - 1)) << shift
+
+        if self.fmt[-1] == "s":
+            return value.to_bytes(self.size, "big")
+
+        return value
+
+
+class Segment:
+    """A run of fixed size fields parsed with a single struct.Struct."""
+
+    dynamic = False
+
+    def __init__(self, order):
+
+        self.order = order
+        self.fmt = []
+        self.fields = []
+        self.struct = None
+        self.size = 0
+        self.simple = True
+
+    def add(self, order, fmt, name=None, kind=VALUE, arg=None):
+        """Add a field to the segment."""
+
+        if order:
+            self.order = order
+
+        self.fmt.append(fmt)
+
+        if name:
+            self.fields.append((name, kind, arg))
+
+        if kind is not VALUE:
+            self.simple = False
+
+    def accepts(self, order):
+        """Check if a field with the specified byte order can be added."""
+
+        return not order or not self.order or order == self.order
+
+    def finalize(self):
+        """Compile the segment."""
+
+        self.struct = struct.Struct((self.order or ">") + "".join(self.fmt))
+        self.size = self.struct.size
+
+    def convert(self, raw):
+        """Convert the values unpacked by the struct."""
+
+        values = []
+        index = 0
+
+        for _, kind, arg in self.fields:
+
+            if kind is NONE:
+                values.append(None)
+                continue
+
+            if kind is BITS:
+                values.append(arg.parse(raw[index]))
+            else:
+                values.append(raw[index])
+
+            index += 1
+
+        return values
+
+    def parse(self, data, offset, values, codec, parent):
+        """Parse the segment."""
+
+        raw = self.struct.unpack_from(data, offset)
+
+        if self.simple:
+            values.extend(raw)
+        else:
+            values.extend(self.convert(raw))
+
+        return offset + self.size
+
+    def build(self, obj, chunks, codec, parent):
+        """Build the segment."""
+
+        args = []
+
+        for name, kind, arg in self.fields:
+
+            if kind is VALUE:
+                args.append(obj[name])
+            elif kind is BYTES:
+                args.append(to_bytes(obj[name], arg))
+            elif kind is BITS:
+                args.append(arg.build(obj.get(name) if arg.buildnone
+                                      else obj[name]))
+
+        chunks.append(self.struct.pack(*args))
+
+
+class BytesOp:
+    """A bytes string whose length depends on other fields."""
+
+    dynamic = True
+
+    def __init__(self, name, length):
+
+        self.name = name
+        self.length = length
+
+    def parse(self, data, offset, values, codec, parent):
+        """Parse the field."""
+
+        length = self.length(codec.context(values, parent))
+
+        if length < 0 or offset + length > len(data):
+            raise CodecError("%s: invalid length %d" % (self.name, length))
+
+        values.append(bytes(data[offset:offset + length]))
+
+        return offset + length
+
+    def build(self, obj, chunks, codec, parent):
+        """Build the field."""
+
+        length = self.length(codec.build_context(obj, parent))
+        chunks.append(to_bytes(obj[self.name], length))
+
+
+class ArrayOp:
+    """An array of elements."""
+
+    dynamic = True
+
+    def __init__(self, name, count, item):
+
+        self.name = name
+        self.count = count
+        self.item = item
+
+    def parse(self, data, offset, values, codec, parent):
+        """Parse the field."""
+
+        ctx = codec.context(values, parent)
+        count = self.count(ctx) if callable(self.count) else self.count
+
+        if count < 0:
+            raise CodecError("%s: invalid count %d" % (self.name, count))
+
+        value, offset = self.item.parse_many(data, offset, count, ctx)
+        values.append(value)
+
+        return offset
+
+    def build(self, obj, chunks, codec, parent):
+        """Build the field."""
+
+        ctx = codec.build_context(obj, parent)
+        count = self.count(ctx) if callable(self.count) else self.count
+        value = obj[self.name]
+
+        if len(value) != count:
+            raise CodecError("%s: expected %d elements, got %d" %
+                             (self.name, count, len(value)))
+
+        self.item.build_many(value, chunks, ctx)
+
+
+class GreedyRangeOp:
+    """As many elements as possible."""
+
+    dynamic = True
+
+    def __init__(self, name, item):
+
+        self.name = name
+        self.item = item
+
+    def parse(self, data, offset, values, codec, parent):
+        """Parse the field."""
+
+        ctx = codec.context(values, parent)
+        value, offset = self.item.parse_greedy(data, offset, ctx)
+        values.append(value)
+
+        return offset
+
+    def build(self, obj, chunks, codec, parent):
+        """Build the field."""
+
+        ctx = codec.build_context(obj, parent)
+        self.item.build_many(obj[self.name], chunks, ctx)
+
+
+class StructOp:
+    """A nested struct."""
+
+    dynamic = True
+
+    def __init__(self, name, item):
+
+        self.name = name
+        self.item = item
+
+    def parse(self, data, offset, values, codec, parent):
+        """Parse the field."""
+
+        ctx = codec.context(values, parent)
+        value, offset = self.item.parse_from(data, offset, ctx)
+        values.append(value)
+
+        return offset
+
+    def build(self, obj, chunks, codec, parent):
+        """Build the field."""
+
+        ctx = codec.build_context(obj, parent)
+        self.item.build_into(obj[self.name], chunks, ctx)
+
+
+class ScalarItem:
+    """The elements of an array of integers."""
+
+    def __init__(self, fmtstr):
+
+        self.order = fmtstr[0]
+        self.char = fmtstr[1:]
+        self.size = struct.calcsize(fmtstr)
+
+    def parse_many(self, data, offset, count, parent):
+        """Parse count elements."""
+
+        fmt = "%s%u%s" % (self.order, count, self.char)
+        values = list(struct.unpack_from(fmt, data, offset))
+
+        return values, offset + count * self.size
+
+    def parse_greedy(self, data, offset, parent):
+        """Parse as many elements as possible."""
+
+        count = max(len(data) - offset, 0) // self.size
+
+        return self.parse_many(data, offset, count, parent)
+
+    def build_many(self, values, chunks, parent):
+        """Build the elements."""
+
+        fmt = "%s%u%s" % (self.order, len(values), self.char)
+        chunks.append(struct.pack(fmt, *values))
+
+
+class StructCodec:
+    """A compiled Struct."""
+
+    def __init__(self, name, fields, ops, fmt=None):
+
+        self.name = name
+        self.fmt = fmt
+        self.fields = tuple(fields)
+        self.ops = ops
+        self.record = make_record(name or "record", fields)
+
+        # The header codec and the operations parsing what follows it
+        self.header = None
+        self.header_values = None
+        self.body = None
+        self.body_segment = None
+
+        dynamic = [op for op in ops if op.dynamic]
+
+        self.size = None if dynamic else sum(op.size for op in ops)
+
+        # Structs made of a single segment can be parsed in bulk
+        self.segment = ops[0] if len(ops) == 1 and not dynamic else None
+
+        # stride -> struct.Struct skipping stride bytes before each element
+        self.strided = {}
+
+    def sizeof(self):
+        """Return the size of the message."""
+
+        if self.size is None:
+            raise CodecError("%s has no fixed size" % self.name)
+
+        return self.size
+
+    def context(self, values, parent):
+        """Return the parsing context."""
+
+        ctx = Context(zip(self.fields, values))
+        ctx["_"] = parent
+
+        return ctx
+
+    def layout(self):
+        """Return the layout of a fixed size codec."""
+
+        if self.size is None:
+            return None
+
+        return [(op.struct.format,
+                 [(name, kind, getattr(arg, "fields", arg))
+                  for name, kind, arg in op.fields]) for op in self.ops]
+
+    def set_header(self, header):
+        """Enable single pass decoding for messages starting with header.
+
+        Nothing is done if the first fields of the message do not have the
+        same layout of the header.
+        """
+
+        if self.header is header or not isinstance(header, StructCodec):
+            return
+
+        count = len(header.fmt.subcons)
+
+        if len(header.fields) < 2 or \
+                self.fields[:len(header.fields)] != header.fields:
+            return
+
+        try:
+            prefix = compile_fields(None, self.fmt, 0, count)
+            body = compile_fields(None, self.fmt, count)
+        except Unsupported:
+            return
+
+        if header.layout() is None or prefix.layout() != header.layout():
+            return
+
+        self.header = header
+        self.header_values = attrgetter(*header.fields)
+        self.body = body.ops
+
+        # Fixed size bodies with no conversions are parsed in one go
+        if body.segment and body.segment.simple:
+            self.body_segment = body.segment.struct
+
+    @classmethod
+    def build_context(cls, obj, parent):
+        """Return the building context."""
+
+        ctx = Context(obj)
+        ctx["_"] = parent
+
+        return ctx
+
+    def parse(self, data):
+        """Parse a message."""
+
+        try:
+            return self.parse_from(data, 0, None)[0]
+        except struct.error as ex:
+            raise CodecError("%s: %s" % (self.name, ex))
+
+    def build(self, obj):
+        """Build a message."""
+
+        chunks = []
+
+        try:
+            self.build_into(obj, chunks, None)
+        except struct.error as ex:
+            raise CodecError("%s: %s" % (self.name, ex))
+
+        return b"".join(chunks)
+
+    def parse_body(self, data, hdr):
+        """Parse a message whose header has already been parsed.
+
+        The header fields are taken from hdr (as returned by the header
+        codec) and decoding starts right after the header.
+        """
+
+        if self.body is None:
+            return self.parse(data)
+
+        offset = self.header.size
+
+        try:
+
+            if self.body_segment:
+                body = self.body_segment.unpack_from(data, offset)
+                return self.record(*self.header_values(hdr), *body)
+
+            values = list(self.header_values(hdr))
+
+            for op in self.body:
+                offset = op.parse(data, offset, values, self, None)
+
+        except struct.error as ex:
+            raise CodecError("%s: %s" % (self.name, ex))
+
+        return self.record(*values)
+
+    def parse_from(self, data, offset, parent):
+        """Parse a message starting from offset."""
+
+        values = []
+
+        for op in self.ops:
+            offset = op.parse(data, offset, values, self, parent)
+
+        return self.record(*values), offset
+
+    def build_into(self, obj, chunks, parent):
+        """Build a message appending the output to chunks."""
+
+        for op in self.ops:
+            op.build(obj, chunks, self, parent)
+
+    def parse_many(self, data, offset, count, parent):
+        """Parse count elements."""
+
+        if self.segment:
+            return self.unpack_records(self.segment.struct, data, offset,
+                                       count)
+
+        values = []
+
+        for _ in range(count):
+            value, offset = self.parse_from(data, offset, parent)
+            values.append(value)
+
+        return values, offset
+
+    def parse_strided(self, data, offset, count, stride):
+        """Parse count elements each one preceded by stride bytes to skip
+        (e.g. the type and length of a TLV). Only for fixed size codecs."""
+
+        if not self.segment:
+            raise CodecError("%s has no fixed layout" % self.name)
+
+        if stride not in self.strided:
+            self.strided[stride] = \
+                struct.Struct("%s%ux%s" % (self.segment.order or ">", stride,
+                                           "".join(self.segment.fmt)))
+
+        return self.unpack_records(self.strided[stride], data, offset,
+                                   count)[0]
+
+    def unpack_records(self, packer, data, offset, count):
+        """Unpack count records in a single pass using packer."""
+
+        end = offset + count * packer.size
+
+        if end > len(data):
+            raise CodecError("%s: not enough data" % self.name)
+
+        raw = packer.iter_unpack(memoryview(data)[offset:end])
+        record = self.record
+
+        if self.segment.simple:
+            return [record(*values) for values in raw], end
+
+        convert = self.segment.convert
+
+        return [record(*convert(values)) for values in raw], end
+
+    def parse_greedy(self, data, offset, parent):
+        """Parse as many elements as possible."""
+
+        if self.segment:
+            count = max(len(data) - offset, 0) // self.size
+            return self.parse_many(data, offset, count, parent)
+
+        values = []
+
+        while offset < len(data):
+
+            try:
+                value, end = self.parse_from(data, offset, parent)
+            except Exception:
+                break
+
+            values.append(value)
+            offset = end
+
+        return values, offset
+
+    def build_many(self, values, chunks, parent):
+        """Build the elements."""
+
+        for value in values:
+            self.build_into(value, chunks, parent)
+
+
+class ConstructCodec:
+    """A codec falling back to construct."""
+
+    def __init__(self, fmt):
+
+        self.fmt = fmt
+        self.name = getattr(fmt, "name", None)
+
+    def sizeof(self):
+        """Return the size of the message."""
+
+        return self.fmt.sizeof()
+
+    def parse(self, data):
+        """Parse a message."""
+
+        return self.fmt.parse(data)
+
+    def parse_body(self, data, hdr):
+        """Parse a message (the header is parsed again)."""
+
+        return self.fmt.parse(data)
+
+    def set_header(self, header):
+        """Single pass decoding is not supported."""
+
+    def build(self, obj):
+        """Build a message."""
+
+        return self.fmt.build(obj)
+
+
+TLV = make_record("tlv", ("type", "length", "value"))
+
+# Type and length of a TLV (the length includes these 4 bytes)
+TLV_HEADER = struct.Struct(">HH")
+
+
+class TLVIndex:
+    """The TLVs of a message, indexed but not decoded.
+
+    The TLVs area of the frame is copied once and the index records the
+    type, offset and length of every TLV. Consecutive TLVs with the same
+    type and length are grouped in runs. Values are decoded lazily (and only
+    once) when a handler asks for a certain type: runs of fixed size values
+    are decoded with a single struct.iter_unpack.
+
+    Iterating over the index returns TLV records (type, length, value), so
+    that it can be used wherever a list of TLVs was used.
+    """
+
+    __slots__ = ("data", "runs", "count", "decoders", "decoded")
+
+    def __init__(self, data, offset, decoders):
+
+        self.data = data = bytes(data[offset:])
+        self.decoders = decoders
+        self.decoded = {}
+
+        # [type, value offset, value length, count]
+        self.runs = runs = []
+        self.count = 0
+
+        offset = 0
+        end = len(data)
+        unpack = TLV_HEADER.unpack_from
+        last = None
+
+        while offset + 4 <= end:
+
+            tlv_type, length = unpack(data, offset)
+
+            if length < 4 or offset + length > end:
+                break
+
+            if last and last[0] == tlv_type and last[2] == length - 4:
+                last[3] += 1
+            else:
+                last = [tlv_type, offset + 4, length - 4, 1]
+                runs.append(last)
+
+            offset += length
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+
+        data = self.data
+
+        for tlv_type, offset, length, count in self.runs:
+            for _ in range(count):
+                yield TLV(tlv_type, length + 4, data[offset:offset + length])
+                offset += length + 4
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __eq__(self, other):
+
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__,
+                           ", ".join("%u*%u" % (run[0], run[3])
+                                     for run in self.runs))
+
+    def types(self):
+        """Return the set of TLV types in the message."""
+
+        return {run[0] for run in self.runs}
+
+    def unknown(self):
+        """Return the TLV types that have no decoder."""
+
+        return {run[0] for run in self.runs if run[0] not in self.decoders}
+
+    def decode(self, tlv_type):
+        """Return the decoded values of all the TLVs of the specified type.
+
+        Raise KeyError if there is no decoder for the type.
+        """
+
+        if tlv_type in self.decoded:
+            return self.decoded[tlv_type]
+
+        codec = self.decoders[tlv_type]
+        data = self.data
+        values = []
+
+        for run_type, offset, length, count in self.runs:
+
+            if run_type != tlv_type:
+                continue
+
+            if getattr(codec, "segment", None) and codec.size == length:
+                values.extend(codec.parse_strided(data, offset - 4, count, 4))
+                continue
+
+            for _ in range(count):
+                values.append(codec.parse(data[offset:offset + length]))
+                offset += length + 4
+
+        self.decoded[tlv_type] = values
+
+        return values
+
+
+class TLVCodec:
+    """A message made of a header followed by a list of TLVs.
+
+    Messages are built with the compiled codec of the whole message, while
+    parsed messages have a TLVIndex (instead of a list of TLVs) as last
+    field. Decoders maps the TLV types to their codecs.
+    """
+
+    def __init__(self, codec, header, decoders):
+
+        if not isinstance(codec, StructCodec) or \
+                codec.fields[:-1] != header.fields or header.size is None:
+            raise Unsupported("%s is not header + TLVs" % codec.name)
+
+        self.codec = codec
+        self.header = header
+        self.decoders = decoders
+
+        self.fmt = codec.fmt
+        self.name = codec.name
+        self.header_values = attrgetter(*header.fields)
+
+    def sizeof(self):
+        """Messages with TLVs have no fixed size."""
+
+        raise CodecError("%s has no fixed size" % self.name)
+
+    def parse(self, data):
+        """Parse a message."""
+
+        return self.parse_body(data, self.header.parse(data))
+
+    def parse_body(self, data, hdr):
+        """Parse a message whose header has already been parsed."""
+
+        tlvs = TLVIndex(data, self.header.size, self.decoders)
+
+        return self.codec.record(*self.header_values(hdr), tlvs)
+
+    def set_header(self, header):
+        """The header is set when the codec is created."""
+
+    def build(self, obj):
+        """Build a message."""
+
+        return self.codec.build(obj)
+
+
+def unwrap(subcon):
+    """Return the (name, subcon) tuple."""
+
+    name = subcon.name
+
+    while isinstance(subcon, Renamed):
+        subcon = subcon.subcon
+
+    if name is not None:
+
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise Unsupported("invalid field name %s" % name)
+
+        if name.startswith("_") or name in RESERVED:
+            raise Unsupported("reserved field name %s" % name)
+
+    return name, subcon
+
+
+def is_padding(subcon):
+    """Check if the subcon is a padding."""
+
+    return isinstance(subcon, Padded) and subcon.subcon is Pass and \
+        isinstance(subcon.length, int) and subcon.pattern == b"\x00"
+
+
+def compile_bits(name, subcon):
+    """Compile a bit struct."""
+
+    fields = []
+    offset = 0
+
+    for field in subcon.subcon.subcons:
+
+        field_name, field = unwrap(field)
+
+        if isinstance(field, type(Flag)):
+            kind, width, signed = FLAG, 1, False
+        elif isinstance(field, BitsInteger) and \
+                isinstance(field.length, int) and not field.swapped:
+            kind, width, signed = VALUE, field.length, field.signed
+        elif is_padding(field):
+            kind, width, signed = NONE, field.length, False
+        else:
+            raise Unsupported("unsupported bit field %s" % field)
+
+        if not field_name and kind is not NONE:
+            raise Unsupported("unnamed bit field")
+
+        fields.append([field_name, kind, offset, width, signed])
+        offset += width
+
+    if offset % 8 or offset // 8 != subcon.decodeamount:
+        raise Unsupported("bit struct is not byte aligned")
+
+    # bits are numbered starting from the most significant one
+    for field in fields:
+        field[2] = offset - field[2] - field[3]
+
+    return BitsSpec(name, [tuple(f) for f in fields], offset // 8)
+
+
+def compile_item(name, subcon):
+    """Compile the elements of an array."""
+
+    if isinstance(subcon, FormatField) and subcon.fmtstr[0] in "<>=!":
+        return ScalarItem(subcon.fmtstr)
+
+    if isinstance(subcon, Struct):
+        return compile_fields(subcon.name or name, subcon)
+
+    raise Unsupported("unsupported array element %s" % subcon)
+
+
+def compile_fields(name, fmt, start=0, stop=None):
+    """Compile (the subcons from start to stop of) a Struct."""
+
+    if not isinstance(fmt, Struct):
+        raise Unsupported("%s is not a Struct" % fmt)
+
+    ops = []
+    fields = []
+    segment = None
+
+    def current(order):
+
+        nonlocal segment
+
+        if not segment or not segment.accepts(order):
+            segment = Segment(order)
+            ops.append(segment)
+
+        return segment
+
+    for subcon in fmt.subcons[start:stop]:
+
+        field_name, subcon = unwrap(subcon)
+
+        if field_name in fields:
+            raise Unsupported("duplicate field %s" % field_name)
+
+        if is_padding(subcon):
+
+            kind = NONE if field_name else VALUE
+            current(None).add(None, "%ux" % subcon.length, field_name, kind)
+
+        elif not field_name:
+
+            raise Unsupported("unnamed field %s" % subcon)
+
+        elif isinstance(subcon, FormatField):
+
+            order = subcon.fmtstr[0]
+
+            if order not in "<>=!":
+                raise Unsupported("native byte order not supported")
+
+            current(order).add(order, subcon.fmtstr[1:], field_name)
+
+        elif isinstance(subcon, Bytes) and isinstance(subcon.length, int):
+
+            current(None).add(None, "%us" % subcon.length, field_name, BYTES,
+                              subcon.length)
+
+        elif isinstance(subcon, Bytes) and callable(subcon.length):
+
+            ops.append(BytesOp(field_name, subcon.length))
+            segment = None
+
+        elif isinstance(subcon, Transformed) and \
+                subcon.decodefunc is bytes2bits and \
+                isinstance(subcon.subcon, Struct):
+
+            bits = compile_bits(field_name, subcon)
+            current(">").add(">", bits.fmt, field_name, BITS, bits)
+
+        elif isinstance(subcon, Array) and not subcon.discard:
+
+            item = compile_item(field_name, subcon.subcon)
+            ops.append(ArrayOp(field_name, subcon.count, item))
+            segment = None
+
+        elif isinstance(subcon, GreedyRange) and not subcon.discard:
+
+            item = compile_item(field_name, subcon.subcon)
+            ops.append(GreedyRangeOp(field_name, item))
+            segment = None
+
+        elif isinstance(subcon, Struct):
+
+            item = compile_fields(field_name, subcon)
+            ops.append(StructOp(field_name, item))
+            segment = None
+
+        else:
+
+            raise Unsupported("unsupported field %s" % subcon)
+
+        if field_name:
+            fields.append(field_name)
+
+    for op in ops:
+        if not op.dynamic:
+            op.finalize()
+
+    return StructCodec(fmt.name or name, fields, ops, fmt)
+
+
+COMPILED = {}
+
+
+def compile_struct(fmt, header=None):
+    """Return the codec for the specified Struct.
+
+    Codecs are cached, so compiling the same Struct twice returns the same
+    codec. Structs that cannot be compiled fall back to construct. If the
+    header codec is specified, messages can be decoded with parse_body.
+    """
+
+    if id(fmt) in COMPILED and COMPILED[id(fmt)][0] is fmt:
+        codec = COMPILED[id(fmt)][1]
+    else:
+        try:
+            codec = compile_fields(None, fmt)
+        except Unsupported:
+            codec = ConstructCodec(fmt)
+        COMPILED[id(fmt)] = (fmt, codec)
+
+    if header is not None:
+        codec.set_header(header)
+
+    return codec
@@ -51,6 +51,10 @@ class Device(MongoModel):
     addr = EtherAddressField(primary_key=True)
     desc = fields.CharField(required=True)
 
+    # Fields read when the devices are loaded, the others are read when the
+    # device connects (see RANManager)
+    HYDRATE_FIELDS = ("addr", "desc")
+
     def __init__(self, **kwargs):
 
         super().__init__(**kwargs)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Dictionaries with secondary indexes."""
+
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from empower_core.serialize import serializable_dict
+
+EMPTY = MappingProxyType({})
+
+
+@serializable_dict
+class IndexView(Mapping):
+    """A live, read-only view of the entries with a given index key.
+
+    The view always reflects the current content of the dictionary, so it
+    can be kept around instead of being rebuilt at every access. Membership
+    tests and lookups are O(1), iterations only visit the matching entries.
+    """
+
+    def __init__(self, indexed, name, index_key):
+
+        self.index = indexed.buckets[name]
+        self.index_key = index_key
+
+    def entries(self):
+        """Return the current entries (do not modify)."""
+
+        return self.index.get(self.index_key, EMPTY)
+
+    def __getitem__(self, key):
+        return self.entries()[key]
+
+    def __contains__(self, key):
+        return key in self.entries()
+
+    def __iter__(self):
+        return iter(list(self.entries()))
+
+    def __len__(self):
+        return len(self.entries())
+
+    # Iterations work on a copy of the matching entries only, so entries
+    # can be modified (and reindexed) while iterating
+    def keys(self):
+        return list(self.entries().keys())
+
+    def values(self):
+        return list(self.entries().values())
+
+    def items(self):
+        return list(self.entries().items())
+
+    def to_dict(self):
+        """Return JSON-serializable representation of the object."""
+
+        return dict(self.entries())
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.to_dict())
+
+
+class IndexedDict(dict):
+    """A dictionary with secondary indexes on its values.
+
+    Every index is defined by a function returning the (possibly empty)
+    list of index keys of a value. For each index key the dictionary keeps
+    the entries (primary key -> value) having that key, so that lookups
+    are O(1) regardless of the number of entries.
+
+    Index keys are computed when an entry is added. If a value changes in a
+    way that affects its index keys, then reindex() must be called.
+
+    Example:
+
+        lvaps = IndexedDict(wtp=lambda lvap: [lvap.wtp.addr])
+        lvaps[lvap.addr] = lvap
+        lvaps.lookup("wtp", wtp.addr)
+    """
+
+    def __init__(self, **indexes):
+
+        super().__init__()
+
+        # name -> function returning the index keys of a value
+        self.indexes = indexes
+
+        # name -> index key -> primary key -> value
+        self.buckets = {name: {} for name in indexes}
+
+        # primary key -> name -> index keys (as computed when indexed)
+        self.index_keys = {}
+
+    def __setitem__(self, key, value):
+
+        if key in self:
+            self.unindex(key)
+
+        super().__setitem__(key, value)
+
+        self.index(key, value)
+
+    def __delitem__(self, key):
+
+        super().__delitem__(key)
+
+        self.unindex(key)
+
+    def pop(self, key, *default):
+        """Remove key and return its value."""
+
+        if key not in self:
+            return super().pop(key, *default)
+
+        value = super().pop(key)
+        self.unindex(key)
+
+        return value
+
+    def popitem(self):
+        """Remove and return a (key, value) pair."""
+
+        key, value = super().popitem()
+        self.unindex(key)
+
+        return key, value
+
+    def setdefault(self, key, default=None):
+        """Insert key with a value of default if key is not present."""
+
+        if key not in self:
+            self[key] = default
+
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        """Update the dictionary."""
+
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        """Remove all the entries."""
+
+        super().clear()
+
+        self.index_keys.clear()
+
+        for bucket in self.buckets.values():
+            bucket.clear()
+
+    def add(self, name, key, value, index_keys):
+        """Add an entry to the buckets of an index."""
+
+        bucket = self.buckets[name]
+
+        for index_key in index_keys:
+            bucket.setdefault(index_key, {})[key] = value
+
+    def remove(self, name, key, index_keys):
+        """Remove an entry from the buckets of an index."""
+
+        bucket = self.buckets[name]
+
+        for index_key in index_keys:
+
+            entries = bucket.get(index_key)
+
+            if entries is None:
+                continue
+
+            entries.pop(key, None)
+
+            if not entries:
+                del bucket[index_key]
+
+    def index(self, key, value):
+        """Add an entry to the indexes."""
+
+        keys = {}
+
+        for name, func in self.indexes.items():
+            keys[name] = tuple(func(value))
+            self.add(name, key, value, keys[name])
+
+        self.index_keys[key] = keys
+
+    def unindex(self, key):
+        """Remove an entry from the indexes."""
+
+        keys = self.index_keys.pop(key, None)
+
+        if not keys:
+            return
+
+        for name, index_keys in keys.items():
+            self.remove(name, key, index_keys)
+
+    def reindex(self, key):
+        """Recompute the index keys of an entry.
+
+        Only the indexes whose keys changed are updated.
+        """
+
+        if key not in self:
+            return
+
+        value = self[key]
+        keys = self.index_keys[key]
+
+        for name, func in self.indexes.items():
+
+            index_keys = tuple(func(value))
+
+            if index_keys == keys[name]:
+                continue
+
+            self.remove(name, key, keys[name])
+            self.add(name, key, value, index_keys)
+
+            keys[name] = index_keys
+
+    def lookup(self, name, index_key):
+        """Return a live view of the entries with the index key."""
+
+        return IndexView(self, name, index_key)
@@ -21,6 +21,10 @@ from construct import Struct, Int8ub, Int16ub, Int32ub, Bytes, Array, \
     BitStruct, Padding, Flag, GreedyRange, BitsInteger
 
 from empower_core.ssid import WIFI_NWID_MAXSIZE
+from empower_core.etheraddress import EtherAddress
+
+from empower.managers.ranmanager.codec import compile_struct
+from empower.managers.ranmanager.callbacks import CallbackRegistry
 
 
 PT_VERSION = 0x00
@@ -82,6 +86,12 @@ HEADER = Struct(
 )
 HEADER.name = "header"
 
+# Offset of the length field in HEADER (used for framing)
+HEADER_LENGTH_OFFSET = 2
+
+# Offset of the device field in HEADER (used for captures)
+HEADER_DEVICE_OFFSET = 14
+
 HELLO_REQUEST = Struct(
     "version" / Int8ub,
     "type" / Int8ub,
@@ -147,6 +157,23 @@ CAPS_RESPONSE = Struct(
 )
 CAPS_RESPONSE.name = "caps_response"
 
+HT_CAPS_INFO = BitStruct(
+    "L_SIG_TXOP_Protection_Support" / Flag,
+    "Forty_MHz_Intolerant" / Flag,
+    "Reserved" / Flag,
+    "DSSS_CCK_Mode_in_40_MHz" / Flag,
+    "Maximum_AMSDU_Length" / Flag,
+    "HT_Delayed_Block_Ack" / Flag,
+    "Rx_STBC" / BitsInteger(2),
+    "Tx_STBC" / Flag,
+    "Short_GI_for_40_MHz" / Flag,
+    "Short_GI_for_20_MHz" / Flag,
+    "HT_Greenfield" / Flag,
+    "SM_Power_Save" / BitsInteger(2),
+    "Supported_Channel_Width_Set" / Flag,
+    "LDPC_Coding_Capability" / Flag,
+)
+
 PROBE_REQUEST = Struct(
     "version" / Int8ub,
     "type" / Int8ub,
@@ -160,22 +187,7 @@ PROBE_REQUEST = Struct(
         "padding" / Padding(7),
         "ht_caps" / Flag
     ),
-    "ht_caps_info" / BitStruct(
-        "L_SIG_TXOP_Protection_Support" / Flag,
-        "Forty_MHz_Intolerant" / Flag,
-        "Reserved" / Flag,
-        "DSSS_CCK_Mode_in_40_MHz" / Flag,
-        "Maximum_AMSDU_Length" / Flag,
-        "HT_Delayed_Block_Ack" / Flag,
-        "Rx_STBC" / BitsInteger(2),
-        "Tx_STBC" / Flag,
-        "Short_GI_for_40_MHz" / Flag,
-        "Short_GI_for_20_MHz" / Flag,
-        "HT_Greenfield" / Flag,
-        "SM_Power_Save" / BitsInteger(2),
-        "Supported_Channel_Width_Set" / Flag,
-        "LDPC_Coding_Capability" / Flag,
-    ),
+    "ht_caps_info" / HT_CAPS_INFO,
     "ssid" / Bytes(WIFI_NWID_MAXSIZE + 1)
 )
 PROBE_REQUEST.name = "probe_request"
@@ -227,22 +239,7 @@ ASSOC_REQUEST = Struct(
         "padding" / Padding(7),
         "ht_caps" / Flag
     ),
-    "ht_caps_info" / BitStruct(
-        "L_SIG_TXOP_Protection_Support" / Flag,
-        "Forty_MHz_Intolerant" / Flag,
-        "Reserved" / Flag,
-        "DSSS_CCK_Mode_in_40_MHz" / Flag,
-        "Maximum_AMSDU_Length" / Flag,
-        "HT_Delayed_Block_Ack" / Flag,
-        "Rx_STBC" / BitsInteger(2),
-        "Tx_STBC" / Flag,
-        "Short_GI_for_40_MHz" / Flag,
-        "Short_GI_for_20_MHz" / Flag,
-        "HT_Greenfield" / Flag,
-        "SM_Power_Save" / BitsInteger(2),
-        "Supported_Channel_Width_Set" / Flag,
-        "LDPC_Coding_Capability" / Flag,
-    ),
+    "ht_caps_info" / HT_CAPS_INFO,
     "bssid" / Bytes(6),
     "ssid" / Bytes(WIFI_NWID_MAXSIZE + 1)
 )
@@ -275,22 +272,7 @@ ADD_LVAP_REQUEST = Struct(
         "authenticated" / Flag
     ),
     "assoc_id" / Int16ub,
-    "ht_caps_info" / BitStruct(
-        "L_SIG_TXOP_Protection_Support" / Flag,
-        "Forty_MHz_Intolerant" / Flag,
-        "Reserved" / Flag,
-        "DSSS_CCK_Mode_in_40_MHz" / Flag,
-        "Maximum_AMSDU_Length" / Flag,
-        "HT_Delayed_Block_Ack" / Flag,
-        "Rx_STBC" / BitsInteger(2),
-        "Tx_STBC" / Flag,
-        "Short_GI_for_40_MHz" / Flag,
-        "Short_GI_for_20_MHz" / Flag,
-        "HT_Greenfield" / Flag,
-        "SM_Power_Save" / BitsInteger(2),
-        "Supported_Channel_Width_Set" / Flag,
-        "LDPC_Coding_Capability" / Flag,
-    ),
+    "ht_caps_info" / HT_CAPS_INFO,
     "sta" / Bytes(6),
     "encap" / Bytes(6),
     "bssid" / Bytes(6),
@@ -368,22 +350,7 @@ LVAP_STATUS_RESPONSE = Struct(
         "authenticated" / Flag
     ),
     "assoc_id" / Int16ub,
-    "ht_caps_info" / BitStruct(
-        "L_SIG_TXOP_Protection_Support" / Flag,
-        "Forty_MHz_Intolerant" / Flag,
-        "Reserved" / Flag,
-        "DSSS_CCK_Mode_in_40_MHz" / Flag,
-        "Maximum_AMSDU_Length" / Flag,
-        "HT_Delayed_Block_Ack" / Flag,
-        "Rx_STBC" / BitsInteger(2),
-        "Tx_STBC" / Flag,
-        "Short_GI_for_40_MHz" / Flag,
-        "Short_GI_for_20_MHz" / Flag,
-        "HT_Greenfield" / Flag,
-        "SM_Power_Save" / BitsInteger(2),
-        "Supported_Channel_Width_Set" / Flag,
-        "LDPC_Coding_Capability" / Flag,
-    ),
+    "ht_caps_info" / HT_CAPS_INFO,
     "sta" / Bytes(6),
     "encap" / Bytes(6),
     "bssid" / Bytes(6),
@@ -655,10 +622,31 @@ PT_TYPES = {
 }
 
 
-PT_TYPES_HANDLERS = {}
+def message_name(pt_type):
+    """Return the name of the message type."""
+
+    if not PT_TYPES[pt_type]:
+        return pt_type
+
+    return PT_TYPES[pt_type].name
+
+
+# App callbacks (see empower.managers.ranmanager.callbacks)
+CALLBACKS = CallbackRegistry()
+
+for k in PT_TYPES:
+    CALLBACKS.add_type(k, message_name(k))
+
+PT_TYPES_HANDLERS = CALLBACKS.handlers
+
+# Precompiled codecs (see empower.managers.ranmanager.codec)
+HEADER_CODEC = compile_struct(HEADER)
+
+CODECS = {}
 
 for k in PT_TYPES:
-    PT_TYPES_HANDLERS[k] = []
+    if PT_TYPES[k]:
+        CODECS[k] = compile_struct(PT_TYPES[k], HEADER_CODEC)
 
 
 def register_message(pt_type, parser):
@@ -667,38 +655,23 @@ def register_message(pt_type, parser):
     if pt_type not in PT_TYPES:
         PT_TYPES[pt_type] = parser
 
-    if pt_type not in PT_TYPES_HANDLERS:
-        PT_TYPES_HANDLERS[pt_type] = []
+    CALLBACKS.add_type(pt_type, message_name(pt_type))
+
+    if pt_type not in CODECS and PT_TYPES[pt_type]:
+        CODECS[pt_type] = compile_struct(PT_TYPES[pt_type],
+                                         HEADER_CODEC)
 
 
 def register_callbacks(app, callback_str='handle_'):
     """Register callbacks."""
 
-    for pt_type in PT_TYPES_HANDLERS:
-
-        if not PT_TYPES[pt_type]:
-            handler_name = callback_str + pt_type
-        else:
-            handler_name = callback_str + PT_TYPES[pt_type].name
-
-        if hasattr(app, handler_name):
-            handler = getattr(app, handler_name)
-            PT_TYPES_HANDLERS[pt_type].append(handler)
+    CALLBACKS.register_app(app, callback_str)
 
 
 def unregister_callbacks(app, callback_str='handle_'):
     """Unregister callbacks."""
 
-    for pt_type in PT_TYPES_HANDLERS:
-
-        if not PT_TYPES[pt_type]:
-            handler_name = callback_str + pt_type
-        else:
-            handler_name = callback_str + PT_TYPES[pt_type].name
-
-        if hasattr(app, handler_name):
-            handler = getattr(app, handler_name)
-            PT_TYPES_HANDLERS[pt_type].remove(handler)
+    CALLBACKS.unregister_app(app, callback_str)
 
 
 def register_callback(pt_type, handler):
@@ -707,10 +680,7 @@ def register_callback(pt_type, handler):
     if pt_type not in PT_TYPES:
         raise KeyError("Packet type %u undefined")
 
-    if pt_type not in PT_TYPES_HANDLERS:
-        PT_TYPES_HANDLERS[pt_type] = []
-
-    PT_TYPES_HANDLERS[pt_type].append(handler)
+    CALLBACKS.add(pt_type, handler)
 
 
 def unregister_callback(pt_type, handler):
@@ -722,4 +692,35 @@ def unregister_callback(pt_type, handler):
     if pt_type not in PT_TYPES_HANDLERS:
         return
 
-    PT_TYPES_HANDLERS[pt_type].remove(handler)
+    CALLBACKS.remove(pt_type, handler)
+
+
+def register_demux(pt_type, demux):
+    """Register the demultiplexer for keyed subscriptions.
+
+    The demultiplexer is invoked as demux(msg, device) and must return the
+    (key, item) pairs of the message.
+    """
+
+    if pt_type not in PT_TYPES:
+        raise KeyError("Packet type %u undefined")
+
+    CALLBACKS.set_demux(pt_type, demux)
+
+
+def subscribe(pt_type, key, callback):
+    """Subscribe to the items of a message matching the key."""
+
+    CALLBACKS.subscribe(pt_type, key, callback)
+
+
+def unsubscribe(pt_type, key, callback):
+    """Remove a subscription."""
+
+    CALLBACKS.unsubscribe(pt_type, key, callback)
+
+
+def demux_sta(msg, device):
+    """Demultiplex per-station messages, key is (device, sta)."""
+
+    return [((device.addr, EtherAddress(msg.sta)), msg)]
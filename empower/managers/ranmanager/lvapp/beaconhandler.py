@@ -52,7 +52,11 @@ class BeaconHandler(apimanager.APIHandler):
             }
         """
 
-        wtp = self.service.devices[EtherAddress(args[0])]
+        wtp = self.service.get_device(EtherAddress(args[0]))
+
+        if not wtp:
+            raise KeyError("WTP %s not registered" % args[0])
+
         block = wtp.blocks[int(args[1])]
 
         dst = EtherAddress(kwargs['dst'])
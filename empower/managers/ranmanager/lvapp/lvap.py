@@ -22,7 +22,7 @@ import logging
 
 import empower.managers.projectsmanager.project as prj
 
-from empower_core.launcher import srv_or_die
+from empower_core.launcher import srv, srv_or_die
 from empower.managers.ranmanager.lvapp.resourcepool import ResourceBlock
 from empower.managers.ranmanager.lvapp.resourcepool import ResourcePool
 from empower.managers.ranmanager.lvapp.txpolicy import TxPolicy
@@ -150,6 +150,9 @@ class LVAP:
         # pending module ids (transions happen when list is empty)
         self.pending = []
 
+        # last activity (IOLoop time), used for evicting idle LVAPs
+        self.last_seen = 0
+
         # logger :)
         self.log = logging.getLogger(self.__class__.__module__)
 
@@ -169,6 +172,7 @@ class LVAP:
         """Set the downlink."""
 
         self._downlink = downlink
+        self.reindex()
 
     @property
     def uplink(self):
@@ -176,6 +180,17 @@ class LVAP:
 
         return self._uplink
 
+    def reindex(self):
+        """Update the LVAP entry in the LVAPP manager indexes.
+
+        Must be called every time the blocks or the SSID change.
+        """
+
+        manager = srv("lvappmanager")
+
+        if manager:
+            manager.lvaps.reindex(self.addr)
+
     def handle_del_lvap_response(self, response, *_):
         """Received as result of a del lvap command."""
 
@@ -320,6 +335,7 @@ class LVAP:
         # reset uplink and downlink
         self._downlink = None
         self._uplink = []
+        self.reindex()
 
     def _running_running(self):
 
@@ -373,6 +389,8 @@ class LVAP:
         else:
             self._ssid = ssid
 
+        self.reindex()
+
     @property
     def encap(self):
         """Get the encap."""
@@ -519,6 +537,7 @@ class LVAP:
 
         # save block
         self._downlink = dl_block
+        self.reindex()
 
     def __assign_uplink(self, ul_blocks):
         """Set the downlink blocks."""
@@ -534,6 +553,8 @@ class LVAP:
             # save block into the list
             self._uplink.append(block)
 
+        self.reindex()
+
     @property
     def wtp(self):
         """Return the wtp on which this LVAP is scheduled on."""
@@ -572,6 +593,7 @@ class LVAP:
 
         self._downlink = None
         self._uplink = []
+        self.reindex()
 
     def to_dict(self):
         """Return JSON-serializable representation of the object."""
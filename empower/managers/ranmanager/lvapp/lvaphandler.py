@@ -155,7 +155,11 @@ class LVAPHandler(apimanager.APIHandler):
         if "blocks" in kwargs:
 
             addr = EtherAddress(kwargs['wtp'])
-            wtp = self.service.devices[addr]
+            wtp = self.service.get_device(addr)
+
+            if not wtp:
+                raise KeyError("WTP %s not registered" % addr)
+
             pool = ResourcePool()
 
             for block_id in kwargs["blocks"]:
@@ -165,7 +169,12 @@ class LVAPHandler(apimanager.APIHandler):
 
         elif "wtp" in kwargs:
 
-            wtp = self.service.devices[EtherAddress(kwargs['wtp'])]
+            addr = EtherAddress(kwargs['wtp'])
+            wtp = self.service.get_device(addr)
+
+            if not wtp:
+                raise KeyError("WTP %s not registered" % addr)
+
             lvap.wtp = wtp
 
         if "encap" in kwargs:
@@ -22,7 +22,6 @@ import time
 from random import randint
 
 from construct import Container
-from tornado.iostream import StreamClosedError
 
 from empower_core.launcher import srv_or_die
 from empower_core.ssid import SSID, WIFI_NWID_MAXSIZE
@@ -31,77 +30,74 @@ from empower.managers.ranmanager.lvapp.txpolicy import TxPolicy
 from empower.managers.ranmanager.lvapp.resourcepool import ResourceBlock
 from empower.managers.ranmanager.lvapp.lvap import LVAP, PROCESS_RUNNING
 from empower.managers.ranmanager.lvapp.vap import VAP
-from empower.managers.projectsmanager.project import T_BSSID_TYPE_SHARED
 from empower.managers.projectsmanager.project import T_BSSID_TYPE_UNIQUE
 from empower.managers.ranmanager.ranconnection import RANConnection
+from empower.managers.ranmanager.transactions import NO_TIMEOUT
 
 HELLO_PERIOD = 2000
-HB_PERIOD = 500
 
 
 class LVAPPConnection(RANConnection):
     """A persistent connection to a RAN device."""
 
-    def on_read(self, future):
-        """Assemble message from agent.
+    def on_frame(self, frame):
+        """Handle a complete frame from the agent.
 
-        Appends bytes read from socket to a buffer. Once the full packet
-        has been read the parser is invoked and the buffers is cleared. The
-        parsed packet is then passed to the suitable method or dropped if the
-        packet type in unknown.
+        The frame is parsed and passed to the suitable method or dropped if
+        the packet type in unknown.
         """
 
-        try:
-            self.buffer = self.buffer + future.result()
-        except StreamClosedError as stream_ex:
-            self.log.error(stream_ex)
-            return
-
-        hdr = self.proto.HEADER.parse(self.buffer)
+        hdr = self.proto.HEADER_CODEC.parse(frame)
 
         if hdr.version != 0:
             self.log.warning("Invalid version, expected 0 got %u", hdr.version)
             self.stream.close()
             return
 
-        if len(self.buffer) < hdr.length:
-            remaining = hdr.length - len(self.buffer)
-            future = self.stream.read_bytes(remaining)
-            future.add_done_callback(self.on_read)
-            return
-
         # Check if we know the message type
-        if hdr.type not in self.proto.PT_TYPES:
+        if hdr.type not in self.proto.CODECS:
             self.log.warning("Unknown message type %u, ignoring.", hdr.type)
             return
 
-        # Check if the Device is among the ones we known
-        addr = EtherAddress(hdr.device)
+        # Fast path, the connection is already bound to the device
+        if self.device and hdr.device == self.device_raw:
 
-        if addr not in self.manager.devices:
-            self.log.warning("Unknown Device %s, closing connection.", addr)
-            self.stream.close()
-            return
+            device = self.device
+
+        else:
 
-        device = self.manager.devices[addr]
+            # Check if the Device is among the ones we known
+            addr = EtherAddress(hdr.device)
+
+            device = self.manager.get_device(addr)
+
+            if not device and self.manager.loading:
+                # Not read yet, the device will be found at its next hello
+                self.manager.read_device(addr)
+                return
+
+            if not device:
+                self.log.warning("Unknown Device %s, closing connection.",
+                                 addr)
+                self.stream.close()
+                return
 
         # Log message informations
-        parser = self.proto.PT_TYPES[hdr.type]
-        msg = parser.parse(self.buffer)
+        parser = self.proto.CODECS[hdr.type]
+        msg = parser.parse_body(frame, hdr)
         self.log.debug("Got %s message from %s seq %u", parser.name,
-                       EtherAddress(addr), hdr.seq)
+                       device.addr, hdr.seq)
 
         # If Device is not online and is not connected, then the only message
         # type we can accept is HELLO_RESPONSE
         if not device.is_connected():
 
-            if msg.type != self.proto.PT_HELLO_REQUEST:
-                if not self.stream.closed():
-                    self.wait()
+            if hdr.type != self.proto.PT_HELLO_REQUEST:
                 return
 
             # This is a new connection, set pointer to the device
             self.device = device
+            self.device_raw = hdr.device
 
             # The set pointer from device connection to this object
             device.connection = self
@@ -109,8 +105,11 @@ class LVAPPConnection(RANConnection):
             # Transition to connected state
             device.set_connected()
 
-            # Start hb worker
-            self.hb_worker.start()
+            # Start tracking the device liveness
+            self.manager.watch(device)
+
+            # Read the fields not read when the devices were loaded
+            self.manager.complete_device(device)
 
             # Send caps request
             self.send_caps_request()
@@ -119,43 +118,31 @@ class LVAPPConnection(RANConnection):
         # HELLO_RESPONSE and CAP_RESPONSE message
         if device.is_connected() and not device.is_online():
             valid = (self.proto.PT_HELLO_REQUEST, self.proto.PT_CAPS_RESPONSE)
-            if msg.type not in valid:
-                if not self.stream.closed():
-                    self.wait()
+            if hdr.type not in valid:
                 return
 
         # Otherwise handle message
         try:
-            method = self.proto.PT_TYPES[msg.type].name
-            self.handle_message(method, msg)
+            self.handle_message(msg, hdr)
         except Exception as ex:
             self.log.exception(ex)
             self.stream.close()
 
-        if not self.stream.closed():
-            self.wait()
+    def handle_message(self, msg, hdr=None):
+        """Handle incoming message.
 
-    def handle_message(self, method, msg):
-        """Handle incoming message."""
+        The header (if already decoded) is used for dispatching, otherwise
+        the header fields are taken from the message.
+        """
 
-        # If the default handler is defined then call it
-        handler_name = "_handle_%s" % method
-        if hasattr(self, handler_name):
-            handler = getattr(self, handler_name)
-            handler(msg)
+        if hdr is None:
+            hdr = msg
 
-        # Call registered callbacks
-        if msg.type in self.proto.PT_TYPES_HANDLERS:
-            for handler in self.proto.PT_TYPES_HANDLERS[msg.type]:
-                handler(msg, self.device)
+        # Call the default handler and the registered callbacks
+        self.dispatch_message(hdr.type, msg)
 
         # Check if there are pending XIDs
-        if msg.xid in self.xids:
-            request = self.xids[msg.xid][0]
-            callback = self.xids[msg.xid][1]
-            if callback:
-                callback(msg, self.device, request)
-            del self.xids[msg.xid]
+        self.complete_transaction(hdr.xid, msg)
 
     def on_disconnect(self):
         """Handle device disconnection."""
@@ -166,21 +153,25 @@ class LVAPPConnection(RANConnection):
         self.log.warning("Device disconnected: %s", self.device.addr)
 
         # Remove hosted LVAPs
-        lvaps = [lvap for lvap in self.manager.lvaps.values()
-                 if lvap.wtp.addr == self.device.addr]
+        lvaps = self.manager.lvaps.lookup("wtp", self.device.addr)
 
-        for lvap in list(lvaps):
+        for lvap in list(lvaps.values()):
             del self.manager.lvaps[lvap.addr]
             lvap.clear_blocks()
 
         # remove hosted VAPs
-        vaps = [vap for vap in self.manager.vaps.values()
-                if vap.block.wtp.addr == self.device.addr]
+        vaps = self.manager.vaps.lookup("wtp", self.device.addr)
 
-        for vap in list(vaps):
+        for vap in list(vaps.values()):
             del self.manager.vaps[vap.bssid]
             vap.clear_block()
 
+        # Stop tracking the device liveness
+        self.manager.unwatch(self.device)
+
+        # Forget the entries restored from the snapshot
+        self.manager.cancel_reconcile(self.device)
+
         # reset state
         self.device.set_disconnected()
         self.device.last_seen = 0
@@ -188,13 +179,18 @@ class LVAPPConnection(RANConnection):
         self.device.blocks = {}
         self.device = None
 
-        # Stop hb worker
-        self.hb_worker.stop()
+        # Drop pending transactions
+        self.xids.clear()
 
-    def send_message(self, msg_type, msg, callback=None):
-        """Send message and set common parameters."""
+    def send_message(self, msg_type, msg, callback=None, on_timeout=None,
+                     timeout=None):
+        """Send message and set common parameters.
 
-        parser = self.proto.PT_TYPES[msg_type]
+        If a callback or an on_timeout callback is specified the request is
+        tracked until the response arrives or the timeout (in ms) expires.
+        """
+
+        parser = self.proto.CODECS[msg_type]
 
         if self.stream.closed():
             self.log.warning("Stream closed, unabled to send %s message to %s",
@@ -216,10 +212,9 @@ class LVAPPConnection(RANConnection):
         self.log.debug("Sending %s message to %s seq %u",
                        parser.name, addr[0], msg.seq)
 
-        self.stream.write(parser.build(msg))
+        self.write(parser.build(msg))
 
-        if callback:
-            self.xids[msg.xid] = (msg, callback)
+        self.add_transaction(msg, callback, on_timeout, timeout)
 
         return msg.xid
 
@@ -267,9 +262,12 @@ class LVAPPConnection(RANConnection):
     def _handle_hello_request(self, hello):
         """Handle an incoming HELLO_RESPONSE message."""
 
+        self.device.period = hello.period
         self.device.last_seen = hello.seq
         self.device.last_seen_ts = time.time()
 
+        self.manager.refresh_liveness(self.device)
+
         self.send_hello_response(hello.period)
 
     def _handle_caps_response(self, caps):
@@ -284,6 +282,10 @@ class LVAPPConnection(RANConnection):
                               block.channel,
                               block.band)
 
+        # restore the state from the snapshot (if any), the status reports
+        # requested below confirm it
+        self.manager.preload(self.device)
+
         # set state to online
         self.device.set_online()
 
@@ -311,14 +313,19 @@ class LVAPPConnection(RANConnection):
         # Get station
         sta = EtherAddress(request.sta)
 
+        block = self.device.blocks[request.iface_id]
+
         # Incoming
         incoming_ssid = SSID(request.ssid)
+
+        # Drop unknown randomised addresses and repeated probes
+        if not self.manager.admit_probe(sta, block, incoming_ssid):
+            return
+
         iface_id = request.iface_id
         ht_caps = request.flags.ht_caps
         ht_caps_info = dict(request.ht_caps_info)
-        del ht_caps_info['_io']
-
-        block = self.device.blocks[request.iface_id]
+        ht_caps_info.pop('_io', None)
 
         msg = "Probe request from %s ssid %s iface_id %u ht_caps %u"
 
@@ -369,6 +376,7 @@ class LVAPPConnection(RANConnection):
 
             # save LVAP in the runtime
             self.manager.lvaps[sta] = lvap
+            self.manager.touch(lvap)
 
             # Send probe response
             self.send_probe_response(lvap, incoming_ssid)
@@ -382,13 +390,16 @@ class LVAPPConnection(RANConnection):
         if lvap.blocks[0] != block:
             return
 
+        self.manager.touch(lvap)
+
         # If LVAP is not running then ignore
         if not lvap.is_running():
             return
 
-        # Update list of available networks
-        lvap.networks = networks
-        lvap.commit()
+        # Update list of available networks (if changed)
+        if lvap.networks != networks:
+            lvap.networks = networks
+            lvap.commit()
 
         # Send probe response
         self.send_probe_response(lvap, incoming_ssid)
@@ -403,6 +414,7 @@ class LVAPPConnection(RANConnection):
             return
 
         lvap = self.manager.lvaps[sta]
+        self.manager.touch(lvap)
 
         incoming_bssid = EtherAddress(request.bssid)
 
@@ -416,43 +428,18 @@ class LVAPPConnection(RANConnection):
             self.send_auth_response(lvap)
             return
 
-        # Otherwise check if the requested BSSID belongs to a unique tenant
-        for project in srv_or_die("projectsmanager").projects.values():
-
-            if not project.wifi_props:
-                continue
-
-            if project.wifi_props.bssid_type == T_BSSID_TYPE_SHARED:
-                continue
-
-            bssid = project.generate_bssid(lvap.addr)
+        # Otherwise check if the requested BSSID belongs to a project
+        project = srv_or_die("projectsmanager").\
+            load_project_by_bssid(incoming_bssid, lvap.addr)
 
-            if bssid == incoming_bssid:
-                lvap.bssid = incoming_bssid
-                lvap.authentication_state = True
-                lvap.association_state = False
-                lvap.ssid = None
-                lvap.commit()
-                self.send_auth_response(lvap)
-                return
-
-        # Finally check if this is a shared bssid
-        for project in srv_or_die("projectsmanager").projects.values():
-
-            if not project.wifi_props:
-                continue
-
-            if project.wifi_props.bssid_type == T_BSSID_TYPE_UNIQUE:
-                continue
-
-            if incoming_bssid in project.vaps:
-                lvap.bssid = incoming_bssid
-                lvap.authentication_state = True
-                lvap.association_state = False
-                lvap.ssid = None
-                lvap.commit()
-                self.send_auth_response(lvap)
-                return
+        if project:
+            lvap.bssid = incoming_bssid
+            lvap.authentication_state = True
+            lvap.association_state = False
+            lvap.ssid = None
+            lvap.commit()
+            self.send_auth_response(lvap)
+            return
 
         self.log.info("Auth request from unknown BSSID %s", incoming_bssid)
 
@@ -463,13 +450,14 @@ class LVAPPConnection(RANConnection):
 
         ht_caps = request.flags.ht_caps
         ht_caps_info = dict(request.ht_caps_info)
-        del ht_caps_info['_io']
+        ht_caps_info.pop('_io', None)
 
         if sta not in self.manager.lvaps:
             self.log.info("Assoc request from unknown LVAP %s", sta)
             return
 
         lvap = self.manager.lvaps[sta]
+        self.manager.touch(lvap)
 
         incoming_bssid = EtherAddress(request.bssid)
 
@@ -479,55 +467,20 @@ class LVAPPConnection(RANConnection):
 
         incoming_ssid = SSID(request.ssid)
 
-        # Check if the requested SSID is from a unique project
-        for project in srv_or_die("projectsmanager").projects.values():
-
-            if not project.wifi_props:
-                continue
-
-            if project.wifi_props.bssid_type == T_BSSID_TYPE_SHARED:
-                continue
-
-            bssid = project.generate_bssid(lvap.addr)
-
-            if bssid != incoming_bssid:
-                self.log.info("Invalid BSSID %s", incoming_bssid)
-                continue
-
-            if project.wifi_props.ssid == incoming_ssid:
-                lvap.bssid = incoming_bssid
-                lvap.authentication_state = True
-                lvap.association_state = True
-                lvap.ssid = incoming_ssid
-                lvap.ht_caps = ht_caps
-                lvap.ht_caps_info = ht_caps_info
-                lvap.commit()
-                self.send_assoc_response(lvap)
-                return
-
-        # Check if the requested SSID is from a unique project
-        for project in srv_or_die("projectsmanager").projects.values():
-
-            if not project.wifi_props:
-                continue
-
-            if project.wifi_props.bssid_type == T_BSSID_TYPE_UNIQUE:
-                continue
-
-            if incoming_bssid not in project.vaps:
-                self.log.info("Invalid BSSID %s", incoming_bssid)
-                continue
+        # Check if the requested SSID is served on the BSSID
+        project = srv_or_die("projectsmanager").\
+            load_project_by_bssid(incoming_bssid, lvap.addr, incoming_ssid)
 
-            if project.wifi_props.ssid == incoming_ssid:
-                lvap.bssid = incoming_bssid
-                lvap.authentication_state = True
-                lvap.association_state = True
-                lvap.ssid = incoming_ssid
-                lvap.ht_caps = ht_caps
-                lvap.ht_caps_info = ht_caps_info
-                lvap.commit()
-                self.send_assoc_response(lvap)
-                return
+        if project:
+            lvap.bssid = incoming_bssid
+            lvap.authentication_state = True
+            lvap.association_state = True
+            lvap.ssid = incoming_ssid
+            lvap.ht_caps = ht_caps
+            lvap.ht_caps_info = ht_caps_info
+            lvap.commit()
+            self.send_assoc_response(lvap)
+            return
 
         self.log.info("Unable to find SSID %s", incoming_ssid)
 
@@ -542,6 +495,8 @@ class LVAPPConnection(RANConnection):
                 LVAP(sta, assoc_id=status.assoc_id, state=PROCESS_RUNNING)
 
         lvap = self.manager.lvaps[sta]
+        self.manager.touch(lvap)
+        self.manager.confirm(self.device, ("lvap", sta))
 
         # update LVAP params
         lvap.encap = EtherAddress(status.encap)
@@ -549,7 +504,7 @@ class LVAPPConnection(RANConnection):
         lvap.association_state = bool(status.flags.associated)
         lvap.ht_caps = bool(status.flags.ht_caps)
         lvap.ht_caps_info = dict(status.ht_caps_info)
-        del lvap.ht_caps_info['_io']
+        lvap.ht_caps_info.pop('_io', None)
 
         ssid = SSID(status.ssid)
         if ssid == SSID():
@@ -565,7 +520,8 @@ class LVAPPConnection(RANConnection):
 
         if status.flags.set_mask:
             lvap.downlink = incoming
-        else:
+        elif incoming not in lvap.uplink:
+            # may have been restored from the snapshot
             lvap.uplink.append(incoming)
 
         # if this is not a DL+UL block then stop here
@@ -604,6 +560,7 @@ class LVAPPConnection(RANConnection):
             block.tx_policies[addr] = TxPolicy(addr, block)
 
         txp = block.tx_policies[addr]
+        self.manager.confirm(self.device, ("txp", status.iface_id, addr))
 
         txp.set_mcs([float(x) / 2 for x in status.mcs])
         txp.set_ht_mcs([int(x) for x in status.mcs_ht])
@@ -635,26 +592,24 @@ class LVAPPConnection(RANConnection):
 
         slc = project.wifi_slices[slice_id]
 
+        updates = {}
+
         if slc.properties['quantum'] != status.quantum:
-            if self.device.addr not in slc.devices:
-                slc.devices[self.device.addr] = dict()
-            slc.devices[self.device.addr]['quantum'] = status.quantum
+            updates['quantum'] = status.quantum
 
         amsdu_aggregation = bool(status.flags.amsdu_aggregation)
         if slc.properties['amsdu_aggregation'] != amsdu_aggregation:
-            if self.device.addr not in slc.devices:
-                slc.devices[self.device.addr] = dict()
-            slc.devices[self.device.addr]['amsdu_aggregation'] = \
-                amsdu_aggregation
+            updates['amsdu_aggregation'] = amsdu_aggregation
 
         if slc.properties['sta_scheduler'] != status.sta_scheduler:
-            if self.device.addr not in slc.devices:
-                slc.devices[self.device.addr] = dict()
-            slc.devices[self.device.addr]['sta_scheduler'] = \
-                status.sta_scheduler
+            updates['sta_scheduler'] = status.sta_scheduler
+
+        device = slc.devices.get(self.device.addr, {})
 
-        project.save()
-        project.refresh_from_db()
+        # Saves are coalesced and performed in the background
+        if any(device.get(key) != value for key, value in updates.items()):
+            slc.devices.setdefault(self.device.addr, {}).update(updates)
+            project.save_later()
 
         self.log.info("Slice status: %s", slc)
 
@@ -680,6 +635,7 @@ class LVAPPConnection(RANConnection):
                                            project.wifi_props.ssid)
 
         vap = self.manager.vaps[bssid]
+        self.manager.confirm(self.device, ("vap", bssid))
 
         self.log.info("VAP status: %s", vap)
 
@@ -832,8 +788,10 @@ class LVAPPConnection(RANConnection):
             msg.networks.append(Container(bssid=network[0].to_raw(),
                                           ssid=network[1].to_raw()))
 
+        # The LVAP state machine waits for the response, never expire it
         return self.send_message(self.proto.PT_ADD_LVAP_REQUEST, msg,
-                                 lvap.handle_add_lvap_response)
+                                 lvap.handle_add_lvap_response,
+                                 timeout=NO_TIMEOUT)
 
     def send_del_lvap_request(self, lvap, csa_switch_channel=0):
         """Send a DEL_LVAP message."""
@@ -844,8 +802,10 @@ class LVAPPConnection(RANConnection):
                         csa_switch_count=3,
                         csa_switch_channel=csa_switch_channel)
 
+        # The LVAP state machine waits for the response, never expire it
         return self.send_message(self.proto.PT_DEL_LVAP_REQUEST, msg,
-                                 lvap.handle_del_lvap_response)
+                                 lvap.handle_del_lvap_response,
+                                 timeout=NO_TIMEOUT)
 
     def send_set_slice(self, project, slc, block):
         """Send an SET_SLICE message."""
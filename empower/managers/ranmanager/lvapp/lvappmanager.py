@@ -17,9 +17,22 @@
 
 """LVAPP RAN Manager."""
 
+import os
+
+from collections import OrderedDict
+
+import tornado.ioloop
+
 import empower.managers.ranmanager.lvapp as lvapp
+import empower.managers.ranmanager.lvapp.snapshot as snapshot
+
+from empower_core.launcher import srv_or_die
 
 from empower.managers.ranmanager.ranmanager import RANManager
+from empower.managers.ranmanager.index import IndexedDict
+from empower.managers.ranmanager.lvapp.lvap import LVAP, PROCESS_RUNNING
+from empower.managers.ranmanager.lvapp.vap import VAP
+from empower.managers.ranmanager.lvapp.txpolicy import TxPolicy
 from empower.managers.ranmanager.lvapp.beaconhandler import BeaconHandler
 from empower.managers.ranmanager.lvapp.wtphandler import WTPHandler
 from empower.managers.ranmanager.lvapp.lvaphandler import LVAPHandler
@@ -28,6 +41,57 @@ from empower.managers.ranmanager.lvapp.wtp import WTP
 
 DEFAULT_PORT = 4433
 
+# LVAPs that are not associated are evicted after this many seconds
+# without activity (0 disables)
+DEFAULT_IDLE_TIMEOUT = 60
+
+# Max number of LVAPs that are not associated on a single block, the least
+# recently seen ones are evicted first (0 disables)
+DEFAULT_MAX_IDLE_LVAPS = 256
+
+# Eviction sweep period (in ms)
+DEFAULT_EVERY = 2000
+
+# Probes from the same station on the same block within this many ms are
+# dropped (0 disables)
+DEFAULT_PROBE_WINDOW = 500
+
+# Snapshot period (in ms)
+DEFAULT_SNAPSHOT_EVERY = 10000
+
+# Time (in s) the WTP has to confirm the state restored from the snapshot
+RECONCILE_TIMEOUT = 10
+
+
+def lvap_wtp(lvap):
+    """Return the address of the WTP hosting the LVAP downlink."""
+
+    return [lvap.wtp.addr] if lvap.wtp else []
+
+
+def lvap_blocks(lvap):
+    """Return the blocks assigned to the LVAP."""
+
+    return [block for block in lvap.blocks if block]
+
+
+def lvap_ssid(lvap):
+    """Return the SSID the LVAP is associated to."""
+
+    return [lvap.ssid] if lvap.ssid else []
+
+
+def vap_wtp(vap):
+    """Return the address of the WTP hosting the VAP."""
+
+    return [vap.wtp.addr] if vap.wtp else []
+
+
+def vap_ssid(vap):
+    """Return the SSID of the VAP."""
+
+    return [vap.ssid] if vap.ssid else []
+
 
 class LVAPPManager(RANManager):
     """LVAPP RAN Manager
@@ -35,24 +99,452 @@ class LVAPPManager(RANManager):
     Parameters:
         port: the port on which the TCP server should listen (optional,
             default: 4433)
+        capture: the file where southbound frames are recorded (optional,
+            default: None)
+        idle_timeout: seconds after which an LVAP that is not associated
+            and shows no activity is evicted (optional, default: 60)
+        max_idle_lvaps: max number of LVAPs that are not associated on a
+            single block (optional, default: 256)
+        every: the eviction sweep period in ms (optional, default: 2000)
+        probe_window: probes from the same station for the same SSID on the
+            same block within this many ms are dropped (optional, default:
+            500)
+        snapshot: the file where the state of the WTPs is saved (optional,
+            default: None, see empower.managers.ranmanager.lvapp.snapshot)
+        snapshot_every: the snapshot period in ms (optional, default: 10000)
+
+    When a snapshot is available at startup, the LVAPs, VAPs and TX policies
+    of a WTP are restored as soon as the WTP reports the same blocks it had
+    when the snapshot was taken. The status reports of the WTP confirm (and
+    correct) the restored entries. Entries that are not confirmed within
+    RECONCILE_TIMEOUT seconds are dropped, except the VAPs, which are sent
+    again to the WTP.
     """
 
     HANDLERS = [LVAPHandler, WTPHandler, BeaconHandler]
 
-    def __init__(self, context, service_id, port):
+    def __init__(self, context, service_id, port, capture=None,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_idle_lvaps=DEFAULT_MAX_IDLE_LVAPS,
+                 every=DEFAULT_EVERY, probe_window=DEFAULT_PROBE_WINDOW,
+                 snapshot=None, snapshot_every=DEFAULT_SNAPSHOT_EVERY):
 
         super().__init__(context=context,
                          service_id=service_id,
                          device_type=WTP,
                          connection_type=LVAPPConnection,
                          proto=lvapp,
-                         port=port)
+                         port=port,
+                         capture=capture,
+                         idle_timeout=idle_timeout,
+                         max_idle_lvaps=max_idle_lvaps,
+                         every=every,
+                         probe_window=probe_window,
+                         snapshot=snapshot,
+                         snapshot_every=snapshot_every)
+
+        # LVAPs indexed by WTP, block and SSID (see LVAP.reindex)
+        self.lvaps = IndexedDict(wtp=lvap_wtp, block=lvap_blocks,
+                                 ssid=lvap_ssid)
+
+        # VAPs indexed by WTP and SSID
+        self.vaps = IndexedDict(wtp=vap_wtp, ssid=vap_ssid)
+
+        # LVAPs from the least to the most recently seen (see touch)
+        self.activity = OrderedDict()
+
+        # Evicted LVAPs, by reason
+        self.evictions = {"idle": 0, "max_idle_lvaps": 0}
+
+        # (sta, block, ssid) -> last admitted probe, oldest first
+        self.probes = OrderedDict()
+
+        # Probe admission counters
+        self.admission = {"admitted": 0, "local": 0, "duplicate": 0}
+
+        # WTP -> state read from the snapshot, not restored yet
+        self.restored = {}
+
+        # WTP -> [restored entries not confirmed yet, reconcile timeout]
+        self.unconfirmed = {}
+
+        # IOLoop time of the last snapshot and pending write (if any)
+        self.last_snapshot = 0
+        self.snapshot_future = None
+
+        self.reconciliation = {"restored": 0, "confirmed": 0, "dropped": 0,
+                               "resent": 0}
+
+    @property
+    def idle_timeout(self):
+        """Return idle_timeout."""
+
+        return self.params["idle_timeout"]
+
+    @idle_timeout.setter
+    def idle_timeout(self, value):
+        """Set idle_timeout."""
+
+        self.params["idle_timeout"] = int(value)
+
+    @property
+    def max_idle_lvaps(self):
+        """Return max_idle_lvaps."""
+
+        return self.params["max_idle_lvaps"]
+
+    @max_idle_lvaps.setter
+    def max_idle_lvaps(self, value):
+        """Set max_idle_lvaps."""
+
+        self.params["max_idle_lvaps"] = int(value)
+
+    @property
+    def probe_window(self):
+        """Return probe_window."""
+
+        return self.params["probe_window"]
+
+    @probe_window.setter
+    def probe_window(self, value):
+        """Set probe_window."""
+
+        self.params["probe_window"] = int(value)
+
+    @property
+    def snapshot(self):
+        """Return the snapshot file."""
+
+        return self.params["snapshot"]
+
+    @snapshot.setter
+    def snapshot(self, value):
+        """Set the snapshot file."""
+
+        if "snapshot" in self.params and self.params["snapshot"]:
+            raise ValueError("Param snapshot can not be changed")
+
+        self.params["snapshot"] = value
+
+    @property
+    def snapshot_every(self):
+        """Return snapshot_every."""
+
+        return self.params["snapshot_every"]
+
+    @snapshot_every.setter
+    def snapshot_every(self, value):
+        """Set snapshot_every."""
+
+        self.params["snapshot_every"] = int(value)
+
+    def start(self):
+        """Start the manager."""
+
+        super().start()
+
+        if not self.snapshot or not os.path.exists(self.snapshot):
+            return
+
+        try:
+            self.restored = snapshot.read(self.snapshot)
+        except (OSError, ValueError) as ex:
+            self.log.error("Unable to read snapshot %s: %s", self.snapshot,
+                           ex)
+            return
+
+        self.log.info("Read snapshot %s (%u WTPs)", self.snapshot,
+                      len(self.restored))
+
+    def stop(self):
+        """Stop the manager."""
+
+        super().stop()
+
+        if self.snapshot:
+            snapshot.write(self.snapshot, self.encode_snapshot())
+
+    def encode_snapshot(self):
+        """Return the snapshot of the current state."""
+
+        return snapshot.encode(self.devices.values(), self.lvaps.values(),
+                               self.vaps.values())
+
+    def save_snapshot(self):
+        """Write the snapshot in the background."""
+
+        # The previous write is still in progress
+        if self.snapshot_future and not self.snapshot_future.done():
+            return
+
+        self.last_snapshot = self.now()
+
+        self.snapshot_future = tornado.ioloop.IOLoop.current().run_in_executor(
+            None, snapshot.write, self.snapshot, self.encode_snapshot())
+
+    def preload(self, wtp):
+        """Restore the state of a WTP that just reported its blocks."""
+
+        state = self.restored.pop(wtp.addr, None)
+
+        if not state:
+            return
+
+        blocks = {(block.block_id, block.hwaddr, block.channel, block.band)
+                  for block in wtp.blocks.values()}
+
+        if blocks != set(state.blocks):
+            self.log.info("Blocks of %s changed, snapshot ignored", wtp.addr)
+            return
+
+        unconfirmed = set()
+
+        for entry in state.txps:
+
+            block = wtp.blocks[entry.block_id]
+
+            txp = TxPolicy(entry.addr, block)
+            txp.set_mcs(entry.mcs)
+            txp.set_ht_mcs(entry.ht_mcs)
+            txp.set_rts_cts(entry.rts_cts)
+            txp.set_max_amsdu_len(entry.max_amsdu_len)
+            txp.set_mcast(entry.mcast)
+            txp.set_no_ack(entry.no_ack)
+            txp.set_ur_count(entry.ur_count)
+
+            block.tx_policies[entry.addr] = txp
+            unconfirmed.add(("txp", entry.block_id, entry.addr))
+
+        projects_manager = srv_or_die("projectsmanager")
+
+        for entry in state.vaps:
+
+            # Gone or already there
+            if not projects_manager.load_project_by_ssid(entry.ssid) or \
+                    entry.bssid in self.vaps:
+                continue
+
+            self.vaps[entry.bssid] = \
+                VAP(entry.bssid, wtp.blocks[entry.block_id], entry.ssid)
+            unconfirmed.add(("vap", entry.bssid))
+
+        for entry in state.lvaps:
+
+            if entry.sta in self.lvaps:
+                continue
+
+            lvap = LVAP(entry.sta, assoc_id=entry.assoc_id,
+                        state=PROCESS_RUNNING)
+
+            lvap.encap = entry.encap
+            lvap.authentication_state = entry.authenticated
+            lvap.association_state = entry.associated
+            lvap.ht_caps = entry.ht_caps
+            lvap.ht_caps_info = entry.ht_caps_info
+            lvap.networks = entry.networks
+            lvap.bssid = entry.bssid
+            lvap.ssid = entry.ssid
+            lvap.downlink = wtp.blocks[entry.downlink]
+            lvap.uplink.extend(wtp.blocks[block_id]
+                               for block_id in entry.uplink)
+
+            self.lvaps[entry.sta] = lvap
+            self.touch(lvap)
+
+            unconfirmed.add(("lvap", entry.sta))
+
+        if not unconfirmed:
+            return
+
+        self.log.info("Restored %u entries on %s", len(unconfirmed),
+                      wtp.addr)
+
+        self.reconciliation["restored"] += len(unconfirmed)
+
+        timeout = tornado.ioloop.IOLoop.current().call_later(
+            RECONCILE_TIMEOUT, self.reconcile, wtp)
+
+        self.unconfirmed[wtp.addr] = [unconfirmed, timeout]
+
+    def confirm(self, wtp, key):
+        """Confirm a restored entry (on status reports)."""
+
+        if wtp.addr not in self.unconfirmed:
+            return
+
+        unconfirmed = self.unconfirmed[wtp.addr][0]
+
+        if key in unconfirmed:
+            unconfirmed.discard(key)
+            self.reconciliation["confirmed"] += 1
+
+    def cancel_reconcile(self, wtp):
+        """Forget the entries restored on a WTP (e.g. on disconnection)."""
+
+        if wtp.addr not in self.unconfirmed:
+            return
+
+        _, timeout = self.unconfirmed.pop(wtp.addr)
+        tornado.ioloop.IOLoop.current().remove_timeout(timeout)
+
+    def reconcile(self, wtp):
+        """Fix the restored entries that the WTP did not confirm."""
+
+        unconfirmed, _ = self.unconfirmed.pop(wtp.addr)
+
+        for key in unconfirmed:
+
+            if key[0] == "txp":
+                _, block_id, addr = key
+                wtp.blocks[block_id].tx_policies.pop(addr, None)
+                self.reconciliation["dropped"] += 1
+
+            elif key[0] == "vap":
+                vap = self.vaps.get(key[1])
+                if vap:
+                    wtp.connection.send_add_vap(vap)
+                    self.reconciliation["resent"] += 1
+
+            elif key[0] == "lvap":
+                lvap = self.lvaps.get(key[1])
+                if lvap and lvap.wtp == wtp:
+                    del self.lvaps[lvap.addr]
+                    self.activity.pop(lvap.addr, None)
+                    self.reconciliation["dropped"] += 1
+
+        self.log.info("Reconciled %s (%u entries not confirmed)", wtp.addr,
+                      len(unconfirmed))
+
+    def admit_probe(self, sta, block, ssid):
+        """Return True if the probe request must be processed.
+
+        Probes from locally administered (e.g. randomised) addresses that
+        are in no ACL are dropped, as well as probes from the same station
+        for the same SSID (or wildcard) on the same block within
+        probe_window ms.
+        """
+
+        if sta.is_local() and \
+                not srv_or_die("projectsmanager").is_allowed(sta):
+            self.admission["local"] += 1
+            return False
+
+        now = self.now()
+        key = (sta, block, ssid)
+
+        last = self.probes.get(key)
+
+        if last is not None and (now - last) * 1000 < self.probe_window:
+            self.admission["duplicate"] += 1
+            return False
+
+        # Move to the end, entries are sorted by time
+        self.probes.pop(key, None)
+        self.probes[key] = now
+        self.admission["admitted"] += 1
+
+        return True
+
+    def touch(self, lvap):
+        """Record some activity from the LVAP."""
+
+        lvap.last_seen = self.now()
+
+        self.activity[lvap.addr] = lvap
+        self.activity.move_to_end(lvap.addr)
+
+    def loop(self):
+        """Evict idle LVAPs and expire the admitted probes.
+
+        LVAPs that are associated or in the middle of a transition are
+        never evicted. The others are evicted if they have been idle for
+        more than idle_timeout seconds or if they exceed max_idle_lvaps on
+        their block (least recently seen first).
+        """
+
+        now = self.now()
+
+        if self.snapshot and \
+                (now - self.last_snapshot) * 1000 >= self.snapshot_every:
+            self.save_snapshot()
+
+        # Forget the probes outside the admission window
+        while self.probes:
+            key, last = next(iter(self.probes.items()))
+            if (now - last) * 1000 < self.probe_window:
+                break
+            del self.probes[key]
+
+        # block -> LVAPs that are not associated (most recent first)
+        idle = {}
+
+        for addr, lvap in reversed(list(self.activity.items())):
+
+            # Removed or replaced by someone else
+            if self.lvaps.get(addr) is not lvap:
+                del self.activity[addr]
+                continue
+
+            if lvap.association_state or lvap.pending:
+                continue
+
+            block = lvap.blocks[0]
+
+            if not block or not block.wtp.connection:
+                continue
+
+            if self.idle_timeout and \
+                    now - lvap.last_seen > self.idle_timeout:
+                self.evict(lvap, "idle")
+                continue
+
+            idle[block] = idle.get(block, 0) + 1
+
+            if self.max_idle_lvaps and idle[block] > self.max_idle_lvaps:
+                self.evict(lvap, "max_idle_lvaps")
+
+    def evict(self, lvap, reason):
+        """Remove the LVAP and release its blocks and tx policies."""
+
+        self.log.info("Evicting LVAP %s (%s)", lvap.addr, reason)
+
+        blocks = lvap.blocks
+
+        del self.lvaps[lvap.addr]
+        del self.activity[lvap.addr]
+
+        lvap.clear_blocks()
+
+        # Release the tx policies on the WTPs as well
+        for block in blocks:
+
+            txp = block.tx_policies.pop(lvap.addr, None)
+
+            if txp and block.wtp.connection:
+                block.wtp.connection.send_del_tx_policy(txp)
+
+        self.evictions[reason] += 1
+
+    def to_dict(self):
+        """Return JSON-serializable representation of the object."""
+
+        out = super().to_dict()
+        out["evictions"] = self.evictions
+        out["admission"] = self.admission
+        out["reconciliation"] = self.reconciliation
 
-        self.lvaps = {}
-        self.vaps = {}
+        return out
 
 
-def launch(context, service_id, port=DEFAULT_PORT):
+def launch(context, service_id, port=DEFAULT_PORT, capture=None,
+           idle_timeout=DEFAULT_IDLE_TIMEOUT,
+           max_idle_lvaps=DEFAULT_MAX_IDLE_LVAPS, every=DEFAULT_EVERY,
+           probe_window=DEFAULT_PROBE_WINDOW, snapshot=None,
+           snapshot_every=DEFAULT_SNAPSHOT_EVERY):
     """ Initialize the module. """
 
-    return LVAPPManager(context=context, service_id=service_id, port=port)
+    return LVAPPManager(context=context, service_id=service_id, port=port,
+                        capture=capture, idle_timeout=idle_timeout,
+                        max_idle_lvaps=max_idle_lvaps, every=every,
+                        probe_window=probe_window, snapshot=snapshot,
+                        snapshot_every=snapshot_every)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Snapshots of the LVAPP RAN state.
+
+A snapshot file starts with MAGIC followed by a sequence of records. Every
+record has a fixed size header (kind and payload length) followed by the
+payload:
+
+  BLOCK: a resource block of a WTP (as reported in the caps response)
+  LVAP:  an LVAP, its blocks are referenced by block id
+  VAP:   a VAP
+  TXP:   a TX policy
+
+Snapshots are written periodically by the LVAPP manager when the snapshot
+parameter is set and are used after a restart to restore the state of the
+WTPs as soon as they report their capabilities (see LVAPPManager.preload).
+"""
+
+import collections
+import os
+import struct
+
+from empower_core.etheraddress import EtherAddress
+from empower_core.ssid import SSID
+
+from empower.managers.ranmanager.lvapp import HT_CAPS_INFO
+
+MAGIC = b"EMPSNP02"
+
+SNAP_BLOCK = 0
+SNAP_LVAP = 1
+SNAP_VAP = 2
+SNAP_TXP = 3
+
+# kind, payload length
+RECORD = struct.Struct(">BH")
+
+# wtp, block id, hwaddr, channel, band
+BLOCK = struct.Struct(">6sB6sBB")
+
+# sta, wtp, downlink, assoc id, encap, flags, bssid, ht caps info, number
+# of uplinks and of networks, followed by the uplinks, by the networks and
+# by the ssid
+LVAP = struct.Struct(">6s6sBH6sB6s2sBB")
+
+# bssid, ssid length, followed by the ssid
+NETWORK = struct.Struct(">6sB")
+
+# bssid, wtp, block id, followed by the ssid
+VAP = struct.Struct(">6s6sB")
+
+# wtp, block id, addr, rts/cts, max amsdu len, mcast, no ack, ur count,
+# number of mcs and ht mcs, followed by the mcs (x2) and by the ht mcs
+TXP = struct.Struct(">6sB6sHHBBBBB")
+
+LVAP_AUTHENTICATED = 0x1
+LVAP_ASSOCIATED = 0x2
+LVAP_HT_CAPS = 0x4
+
+NO_ADDR = bytes(6)
+
+SnapBlock = collections.namedtuple(
+    "SnapBlock", ["block_id", "hwaddr", "channel", "band"])
+
+SnapLVAP = collections.namedtuple(
+    "SnapLVAP", ["sta", "downlink", "uplink", "assoc_id", "encap",
+                 "authenticated", "associated", "ht_caps", "ht_caps_info",
+                 "networks", "bssid", "ssid"])
+
+SnapVAP = collections.namedtuple("SnapVAP", ["bssid", "block_id", "ssid"])
+
+SnapTxPolicy = collections.namedtuple(
+    "SnapTxPolicy", ["block_id", "addr", "rts_cts", "max_amsdu_len",
+                     "mcast", "no_ack", "ur_count", "mcs", "ht_mcs"])
+
+
+class WTPSnapshot:
+    """The state of a WTP."""
+
+    def __init__(self):
+
+        self.blocks = []
+        self.lvaps = []
+        self.vaps = []
+        self.txps = []
+
+
+def to_raw(addr):
+    """Return the address as bytes (zeros if None)."""
+
+    return addr.to_raw() if addr else NO_ADDR
+
+
+def from_raw(raw):
+    """Return the address (None if zeros)."""
+
+    return EtherAddress(raw) if raw != NO_ADDR else None
+
+
+def ht_caps_info_to_raw(ht_caps_info):
+    """Return the HT capabilities as bytes (zeros if not known)."""
+
+    if not ht_caps_info:
+        return bytes(HT_CAPS_INFO.sizeof())
+
+    return HT_CAPS_INFO.build(ht_caps_info)
+
+
+def ht_caps_info_from_raw(raw):
+    """Return the HT capabilities as a dictionary."""
+
+    ht_caps_info = dict(HT_CAPS_INFO.parse(raw))
+    ht_caps_info.pop('_io', None)
+
+    return ht_caps_info
+
+
+def record(kind, payload):
+    """Return a record."""
+
+    return RECORD.pack(kind, len(payload)) + payload
+
+
+def encode(wtps, lvaps, vaps):
+    """Return the snapshot of the connected WTPs."""
+
+    out = [MAGIC]
+
+    for wtp in wtps:
+
+        if not wtp.is_online():
+            continue
+
+        wtp_raw = wtp.addr.to_raw()
+
+        for block in wtp.blocks.values():
+
+            out.append(record(SNAP_BLOCK, BLOCK.pack(
+                wtp_raw, block.block_id, block.hwaddr.to_raw(),
+                block.channel, block.band)))
+
+            for txp in block.tx_policies.values():
+
+                mcs = bytes(int(x * 2) for x in sorted(txp.mcs))
+                ht_mcs = bytes(int(x) for x in sorted(txp.ht_mcs))
+
+                out.append(record(SNAP_TXP, TXP.pack(
+                    wtp_raw, block.block_id, txp.addr.to_raw(),
+                    txp.rts_cts, txp.max_amsdu_len, txp.mcast,
+                    int(txp.no_ack), txp.ur_count, len(mcs),
+                    len(ht_mcs)) + mcs + ht_mcs))
+
+    for lvap in lvaps:
+
+        # Only the LVAPs that are running on a connected WTP
+        if not lvap.is_running() or not lvap.downlink or \
+                not lvap.wtp.is_online():
+            continue
+
+        flags = 0
+
+        if lvap.authentication_state:
+            flags |= LVAP_AUTHENTICATED
+        if lvap.association_state:
+            flags |= LVAP_ASSOCIATED
+        if lvap.ht_caps:
+            flags |= LVAP_HT_CAPS
+
+        # Uplinks on other WTPs are restored by their own status reports
+        uplink = bytes(block.block_id for block in lvap.uplink
+                       if block.wtp == lvap.wtp)
+        networks = b"".join(
+            NETWORK.pack(bssid.to_raw(), len(str(ssid).encode())) +
+            str(ssid).encode() for bssid, ssid in lvap.networks)
+        ssid = str(lvap.ssid).encode() if lvap.ssid else b""
+
+        out.append(record(SNAP_LVAP, LVAP.pack(
+            lvap.addr.to_raw(), lvap.wtp.addr.to_raw(),
+            lvap.downlink.block_id, lvap.assoc_id, to_raw(lvap.encap),
+            flags, to_raw(lvap.bssid),
+            ht_caps_info_to_raw(lvap.ht_caps_info), len(uplink),
+            len(lvap.networks)) + uplink + networks + ssid))
+
+    for vap in vaps:
+
+        if not vap.block or not vap.wtp.is_online():
+            continue
+
+        out.append(record(SNAP_VAP, VAP.pack(
+            vap.bssid.to_raw(), vap.wtp.addr.to_raw(),
+            vap.block.block_id) + str(vap.ssid).encode()))
+
+    return b"".join(out)
+
+
+def decode(data):
+    """Parse a snapshot, return a dictionary WTP -> WTPSnapshot."""
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a snapshot file")
+
+    wtps = {}
+
+    offset = len(MAGIC)
+    end = len(data)
+
+    while offset + RECORD.size <= end:
+
+        kind, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+
+        # Truncated record
+        if offset + length > end:
+            break
+
+        payload = data[offset:offset + length]
+        offset += length
+
+        if kind == SNAP_BLOCK:
+
+            wtp, block_id, hwaddr, channel, band = BLOCK.unpack(payload)
+
+            entry = wtps.setdefault(EtherAddress(wtp), WTPSnapshot())
+            entry.blocks.append(
+                SnapBlock(block_id, EtherAddress(hwaddr), channel, band))
+
+        elif kind == SNAP_TXP:
+
+            wtp, block_id, addr, rts_cts, max_amsdu_len, mcast, no_ack, \
+                ur_count, nb_mcs, nb_ht_mcs = \
+                TXP.unpack_from(payload)
+
+            mcs = payload[TXP.size:TXP.size + nb_mcs]
+            ht_mcs = payload[TXP.size + nb_mcs:TXP.size + nb_mcs + nb_ht_mcs]
+
+            entry = wtps.setdefault(EtherAddress(wtp), WTPSnapshot())
+            entry.txps.append(SnapTxPolicy(
+                block_id, EtherAddress(addr), rts_cts, max_amsdu_len, mcast,
+                bool(no_ack), ur_count, [x / 2 for x in mcs], list(ht_mcs)))
+
+        elif kind == SNAP_LVAP:
+
+            sta, wtp, downlink, assoc_id, encap, flags, bssid, ht_caps_info, \
+                nb_uplink, nb_networks = LVAP.unpack_from(payload)
+
+            uplink = list(payload[LVAP.size:LVAP.size + nb_uplink])
+            ptr = LVAP.size + nb_uplink
+
+            networks = []
+
+            for _ in range(nb_networks):
+                network, length = NETWORK.unpack_from(payload, ptr)
+                ptr += NETWORK.size
+                networks.append((EtherAddress(network),
+                                 SSID(payload[ptr:ptr + length])))
+                ptr += length
+
+            ssid = payload[ptr:]
+
+            entry = wtps.setdefault(EtherAddress(wtp), WTPSnapshot())
+            entry.lvaps.append(SnapLVAP(
+                EtherAddress(sta), downlink, uplink, assoc_id,
+                from_raw(encap), bool(flags & LVAP_AUTHENTICATED),
+                bool(flags & LVAP_ASSOCIATED), bool(flags & LVAP_HT_CAPS),
+                ht_caps_info_from_raw(ht_caps_info), networks,
+                from_raw(bssid), SSID(ssid) if ssid else None))
+
+        elif kind == SNAP_VAP:
+
+            bssid, wtp, block_id = VAP.unpack_from(payload)
+
+            entry = wtps.setdefault(EtherAddress(wtp), WTPSnapshot())
+            entry.vaps.append(SnapVAP(EtherAddress(bssid), block_id,
+                                      SSID(payload[VAP.size:])))
+
+    return wtps
+
+
+def write(path, data):
+    """Atomically replace the snapshot file (blocking)."""
+
+    tmp = path + ".tmp"
+
+    with open(tmp, "wb") as snapshot:
+        snapshot.write(data)
+
+    os.replace(tmp, path)
+
+
+def read(path):
+    """Read a snapshot file, return a dictionary WTP -> WTPSnapshot."""
+
+    with open(path, "rb") as snapshot:
+        return decode(snapshot.read())
@@ -17,16 +17,15 @@
 
 """Base Wi-Fi App class."""
 
-from empower_core.app import EApp
-
 import empower.managers.ranmanager.lvapp as lvapp
 
+from empower.managers.ranmanager.ranapp import ERANApp
 from empower.managers.ranmanager.lvapp.resourcepool import ResourcePool
 
 EVERY = 2000
 
 
-class EWiFiApp(EApp):
+class EWiFiApp(ERANApp):
     """Base Wi-Fi App class."""
 
     MODULES = [lvapp]
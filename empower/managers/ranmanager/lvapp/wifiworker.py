@@ -49,7 +49,7 @@ class EWiFiWorker(EWorker):
     def wtps(self):
         """Return the WTPs."""
 
-        return srv_or_die("lvappmanager").devices
+        return srv_or_die("lvappmanager").get_devices()
 
     @property
     def lvaps(self):
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Base RAN App class."""
+
+from empower_core.app import EApp
+
+
+class ERANApp(EApp):
+    """Base RAN App class.
+
+    Keeps the keyed subscriptions of the app to the messages of its
+    southbound protocol (the first of its MODULES) and drops them when the
+    app is stopped.
+    """
+
+    def __init__(self, context, **kwargs):
+
+        super().__init__(context=context, **kwargs)
+
+        # Keyed subscriptions, pt_type -> (key, callback)
+        self.subscriptions = {}
+
+    def stop(self):
+        """Stop app."""
+
+        for pt_type in list(self.subscriptions):
+            self.unsubscribe(pt_type)
+
+        super().stop()
+
+    def subscribe(self, pt_type, key, callback):
+        """Subscribe to the messages matching the key.
+
+        Only one subscription per message type is kept, subscribing with a
+        different key replaces the previous subscription.
+        """
+
+        if self.subscriptions.get(pt_type) == (key, callback):
+            return
+
+        self.unsubscribe(pt_type)
+
+        self.MODULES[0].subscribe(pt_type, key, callback)
+        self.subscriptions[pt_type] = (key, callback)
+
+    def unsubscribe(self, pt_type):
+        """Remove the subscription for the message type (if any)."""
+
+        if pt_type not in self.subscriptions:
+            return
+
+        key, callback = self.subscriptions.pop(pt_type)
+        self.MODULES[0].unsubscribe(pt_type, key, callback)
@@ -17,21 +17,34 @@
 
 """Base RAN Connection."""
 
-import time
+import struct
 import logging
 
+from contextlib import contextmanager
+
 import tornado.ioloop
 
+from tornado.iostream import StreamClosedError
+
 from empower_core.serialize import serializable_dict
+from empower.managers.ranmanager.transactions import TransactionTable
+
+# Initial size of the per-connection receive buffer (grows on demand)
+READ_BUFFER_SIZE = 4096
 
-HELLO_PERIOD = 2000
-HB_PERIOD = 500
+# The length field of both the LVAPP and the VBSP headers
+LENGTH = struct.Struct(">I")
 
 
 @serializable_dict
 class RANConnection:
     """A persistent connection to a RAN device."""
 
+    # Per-class dispatch table, pt_type -> (built-in handler, callbacks,
+    # publisher of keyed subscriptions)
+    dispatch = None
+    dispatch_version = None
+
     def __init__(self, stream, manager):
 
         self.log = logging.getLogger("%s" % self.__class__.__module__)
@@ -39,21 +52,40 @@ class RANConnection:
         self.manager = manager
         self.device = None
 
+        # Raw address of the bound device (used to skip the device lookup)
+        self.device_raw = None
+
         self.proto = self.manager.proto
 
         self.stream = stream
         self.stream.set_nodelay(True)
-        self.stream.set_close_callback(self.on_disconnect)
+        self.stream.set_close_callback(self.on_close)
 
         self._seq = 0
-        self._xid = 0
 
-        self.buffer = b''
+        # Receive buffer, bytes in [head, tail) have been read but not yet
+        # consumed. Frames are handed to on_frame as memoryview slices
+        self.buffer = bytearray(READ_BUFFER_SIZE)
+        self.head = 0
+        self.tail = 0
+
+        self.hdr_len = self.proto.HEADER.sizeof()
 
-        self.xids = {}
+        # Outbound queue, messages produced in the same IOLoop iteration (or
+        # inside a batch() block) are sent with a single write
+        self.out_queue = []
+        self.flush_scheduled = False
+        self.batching = 0
 
-        self.hb_worker = \
-            tornado.ioloop.PeriodicCallback(self.heartbeat_cb, HB_PERIOD)
+        # Pending transactions (requests waiting for a response)
+        self.xids = TransactionTable()
+
+        # Southbound capture (see empower.managers.ranmanager.capture)
+        self.capture = self.manager.capture_writer
+        self.capture_id = None
+
+        if self.capture:
+            self.capture_id = self.capture.open(stream.socket.getpeername())
 
         self.wait()
 
@@ -69,14 +101,15 @@ class RANConnection:
             addr = self.stream.socket.getpeername()
             out['addr'] = addr[0]
 
+        out['transactions'] = self.xids.to_dict()
+
         return out
 
     @property
     def xid(self):
         """Return new xid."""
 
-        self._xid += 1
-        return self._xid
+        return self.xids.next_xid()
 
     @property
     def seq(self):
@@ -88,19 +121,224 @@ class RANConnection:
     def wait(self):
         """ Wait for incoming packets on signalling channel """
 
-        self.buffer = b''
+        view = memoryview(self.buffer)[self.tail:]
 
-        hdr_len = self.proto.HEADER.sizeof()
-
-        future = self.stream.read_bytes(hdr_len)
+        future = self.stream.read_into(view, partial=True)
         future.add_done_callback(self.on_read)
 
+    def on_read(self, future):
+        """Assemble messages from agent.
+
+        Reads whatever is available on the socket straight into the receive
+        buffer and hands every complete frame to on_frame as a memoryview
+        slice of the buffer (no copies). Frames are only valid for the
+        duration of the on_frame call. Incomplete frames are kept in the
+        buffer until the rest of the data is received.
+        """
+
+        try:
+            self.tail += future.result()
+        except StreamClosedError as stream_ex:
+            self.log.error(stream_ex)
+            return
+
+        view = memoryview(self.buffer)
+        offset = self.proto.HEADER_LENGTH_OFFSET
+        length = 0
+
+        while self.tail - self.head >= self.hdr_len:
+
+            length = LENGTH.unpack_from(self.buffer, self.head + offset)[0]
+
+            if length < self.hdr_len:
+                self.log.warning("Invalid frame length %u, closing.", length)
+                self.stream.close()
+                return
+
+            if self.tail - self.head < length:
+                break
+
+            frame = view[self.head:self.head + length]
+            self.head += length
+            length = 0
+
+            if self.capture:
+                self.capture.frame(self.capture_id, frame)
+
+            self.on_frame(frame)
+
+            if self.stream.closed():
+                return
+
+        self.compact(length)
+
+        self.wait()
+
+    def compact(self, length=0):
+        """Move pending bytes to the head of the receive buffer.
+
+        If the pending frame (of the specified length) does not fit in the
+        buffer a new, larger, buffer is allocated.
+        """
+
+        pending = self.tail - self.head
+        size = max(len(self.buffer), length)
+
+        if size > len(self.buffer):
+            buffer = bytearray(size)
+            buffer[:pending] = self.buffer[self.head:self.tail]
+            self.buffer = buffer
+        elif self.head:
+            self.buffer[:pending] = self.buffer[self.head:self.tail]
+
+        self.head = 0
+        self.tail = pending
+
+    def write(self, data):
+        """Queue data for transmission.
+
+        The queue is flushed at the end of the current IOLoop iteration or
+        when the outermost batch() block is exited.
+        """
+
+        self.out_queue.append(data)
+
+        if self.batching or self.flush_scheduled:
+            return
+
+        self.flush_scheduled = True
+        tornado.ioloop.IOLoop.current().add_callback(self.flush)
+
+    def flush(self):
+        """Send all the queued data with a single write."""
+
+        self.flush_scheduled = False
+
+        if self.batching or not self.out_queue:
+            return
+
+        if len(self.out_queue) == 1:
+            data = self.out_queue[0]
+        else:
+            data = b"".join(self.out_queue)
+
+        self.out_queue = []
+
+        if self.stream.closed():
+            return
+
+        try:
+            self.stream.write(data)
+        except StreamClosedError as stream_ex:
+            self.log.error(stream_ex)
+
+    @contextmanager
+    def batch(self):
+        """Send all the messages generated within the block at once.
+
+        Example:
+
+            with wtp.connection.batch():
+                for block in wtp.blocks.values():
+                    wtp.connection.send_message(...)
+        """
+
+        self.batching += 1
+
+        try:
+            yield self
+        finally:
+            self.batching -= 1
+            if not self.batching:
+                self.flush()
+
+    def add_transaction(self, msg, callback=None, on_timeout=None,
+                        timeout=None):
+        """Track a request until its response arrives or it times out.
+
+        The callback is invoked as callback(response, device, request) while
+        on_timeout is invoked as on_timeout(request, device). Timeout is in ms.
+        """
+
+        if not callback and not on_timeout:
+            return
+
+        on_expired = None
+
+        if on_timeout:
+            on_expired = self.timeout_handler(on_timeout)
+
+        self.xids.add(msg.xid, msg, callback, on_expired, timeout)
+
+    def timeout_handler(self, on_timeout):
+        """Return a handler passing the current device to on_timeout."""
+
+        device = self.device
+
+        def on_expired(request):
+            on_timeout(request, device)
+
+        return on_expired
+
+    def complete_transaction(self, xid, msg):
+        """Complete the pending transaction (if any) matching the xid."""
+
+        transaction = self.xids.pop(xid)
+
+        if transaction and transaction.callback:
+            transaction.callback(msg, self.device, transaction.request)
+
+    def get_dispatch_table(self):
+        """Return the dispatch table for this connection class.
+
+        The table maps every message type to the built-in handler (an unbound
+        method, None if not defined), to the tuple of app callbacks and to
+        the publisher of keyed subscriptions (None if the message type has
+        no demultiplexer). It is built once per class and rebuilt only when
+        messages or callbacks are (un)registered.
+        """
+
+        cls = self.__class__
+        version = self.proto.CALLBACKS.version
+
+        if cls.__dict__.get("dispatch_version") == version:
+            return cls.dispatch
+
+        registry = self.proto.CALLBACKS
+        table = {}
+
+        for pt_type in self.proto.PT_TYPES:
+            handler_name = "_handle_%s" % self.proto.message_name(pt_type)
+            publish = \
+                registry.publish if pt_type in registry.demuxers else None
+            table[pt_type] = (getattr(cls, handler_name, None),
+                              registry.callbacks(pt_type),
+                              publish)
+
+        cls.dispatch = table
+        cls.dispatch_version = version
+
+        return table
+
+    def dispatch_message(self, pt_type, msg):
+        """Call the built-in handler, the app callbacks and subscribers."""
+
+        handler, callbacks, publish = self.get_dispatch_table()[pt_type]
+
+        if handler:
+            handler(self, msg)
+
+        for callback in callbacks:
+            callback(msg, self.device)
+
+        if publish:
+            publish(pt_type, msg, self.device)
+
     def send_message_to_self(self, target, pt_type):
         """Send a message to self."""
 
-        if pt_type in self.proto.PT_TYPES_HANDLERS:
-            for handler in self.proto.PT_TYPES_HANDLERS[pt_type]:
-                handler(target)
+        for handler in self.proto.CALLBACKS.callbacks(pt_type):
+            handler(target)
 
     def send_client_leave_message_to_self(self, client):
         """Send an CLIENT_LEAVE message to self."""
@@ -122,34 +360,29 @@ class RANConnection:
 
         self.send_message_to_self(self.device, self.proto.PT_DEVICE_DOWN)
 
-    def heartbeat_cb(self):
-        """Check if connection is still active."""
-
-        if self.device and not self.stream.closed():
-            timeout = HELLO_PERIOD * 3
-            if (self.device.last_seen_ts + (timeout / 1000)) < time.time():
-                self.log.warning('Client inactive %s at %r',
-                                 self.device.addr,
-                                 self.stream.socket.getpeername())
-                self.stream.close()
-
-    def handle_message(self, method, msg):
+    def handle_message(self, msg, hdr=None):
         """Handle incoming message."""
 
         raise NotImplementedError()
 
-    def on_read(self, future):
-        """Assemble message from agent.
+    def on_frame(self, frame):
+        """Handle a complete frame from the agent.
 
-        Appends bytes read from socket to a buffer. Once the full packet
-        has been read the parser is invoked and the buffers is cleared. The
-        parsed packet is then passed to the suitable method or dropped if the
-        packet type in unknown.
+        The frame is parsed and passed to the suitable method or dropped if
+        the packet type in unknown.
 
         The implementation of the method is southbound-specific."""
 
         raise NotImplementedError()
 
+    def on_close(self):
+        """Handle the stream closure."""
+
+        if self.capture:
+            self.capture.close(self.capture_id)
+
+        self.on_disconnect()
+
     def on_disconnect(self):
         """Handle device disconnection
 
@@ -157,7 +390,8 @@ class RANConnection:
 
         raise NotImplementedError()
 
-    def send_message(self, msg_type, msg, callback=None):
+    def send_message(self, msg_type, msg, callback=None, on_timeout=None,
+                     timeout=None):
         """Send message and set common parameters
 
         The implementation of the method is southbound-specific."""
@@ -17,12 +17,26 @@
 
 """Base RAN Manager."""
 
+import heapq
+import itertools
+import time
+
+import tornado.gen
+import tornado.locks
+import tornado.ioloop
+
 from tornado.tcpserver import TCPServer
+from pymodm.errors import ValidationError
 
 from empower_core.service import EService
+from empower.managers.persistence import Persistence, chain, find, \
+    projection, DEFAULT_BATCH_SIZE
+from empower.managers.ranmanager.capture import CaptureWriter
 
 HELLO_PERIOD = 2000
-HB_PERIOD = 500
+
+# A device is considered inactive after missing this many hello messages
+HELLO_MISSED = 3
 
 
 class RANManager(EService):
@@ -36,27 +50,82 @@ class RANManager(EService):
     transport protocol. Moreover all RAN devices must extend the Device base
     class and must use a 48 bits identifier (an Ethernet address).
 
+    The TCP server starts listening right away. Devices are then loaded in
+    the background: the database is read in batches and every device is
+    built on its first lookup or, at the latest, once all the batches have
+    been read. Devices must always be looked up with get_device() and
+    get_devices(), while loading they return the devices read so far. The
+    loaded event is set once all the devices have been read (the REST
+    handlers wait for it). Only the HYDRATE_FIELDS of the devices are read,
+    the other fields are read when the device connects.
+
+    The methods modifying the devices return the Future of the write (see
+    Persistence), resolved with the device.
+
     Parameters:
         port: the port on which the TCP server should listen (optional)
+        capture: the file where southbound frames are recorded (optional,
+            see empower.managers.ranmanager.capture)
     """
 
     HANDLERS = []
 
     def __init__(self, context, service_id, device_type, connection_type,
-                 proto, port):
+                 proto, port, capture=None, **kwargs):
 
-        super().__init__(context=context, service_id=service_id, port=port)
+        super().__init__(context=context, service_id=service_id, port=port,
+                         capture=capture, **kwargs)
 
         self.device_type = device_type
         self.connection_type = connection_type
         self.proto = proto
         self.devices = {}
 
+        # Devices are saved without blocking the IOLoop
+        self.persistence = Persistence()
+
+        # Devices read from the database but not built yet, addr -> document
+        self.unhydrated = {}
+
+        # Fields read when loading, None if all the fields are read
+        self.hydrate_fields = None
+
+        # Devices built from the hydrate fields only, the other fields are
+        # read when the device connects
+        self.partial = set()
+
+        # Devices read on demand (hello received while loading)
+        self.reading = set()
+
+        # True until all the devices have been read from the database
+        self.loading = False
+        self.loaded = tornado.locks.Event()
+
+        # Devices removed before the last batch was read, not to be added
+        # again by the batches read later
+        self.removed = set()
+
+        # Startup phase -> time (in ms) since the manager was started
+        self.startup = {}
+        self.start_time = None
+
         self.tcp_server = TCPServer()
         self.tcp_server.handle_stream = self.handle_stream
 
         self.connections = {}
 
+        # Set when capture is enabled
+        self.capture_writer = None
+
+        # Device liveness, addr -> [deadline, token, scheduled deadline].
+        # The heap holds one (scheduled deadline, token, addr) entry per
+        # device and a single IOLoop timeout is armed for the earliest one
+        self.liveness = {}
+        self.liveness_heap = []
+        self.liveness_tokens = itertools.count()
+        self.liveness_timer = None
+        self.liveness_timer_deadline = None
+
     @property
     def port(self):
         """Return port."""
@@ -72,17 +141,190 @@ class RANManager(EService):
 
         self.params["port"] = int(value)
 
+    @property
+    def capture(self):
+        """Return the capture file."""
+
+        return self.params["capture"]
+
+    @capture.setter
+    def capture(self, value):
+        """Set the capture file."""
+
+        if "capture" in self.params and self.params["capture"]:
+            raise ValueError("Param capture can not be changed")
+
+        self.params["capture"] = value
+
     def start(self):
         """Start api manager."""
 
         super().start()
 
-        for device in self.device_type.objects:
-            self.devices[device.addr] = device
+        self.start_time = time.time()
+
+        if self.capture:
+            self.capture_writer = \
+                CaptureWriter(self.capture, self.proto.HEADER_DEVICE_OFFSET)
+            self.log.info("Capturing southbound traffic to %s", self.capture)
 
         self.tcp_server.listen(self.port)
 
         self.log.info("Listening on port %u", self.port)
+        self.mark_startup("listening")
+
+        fields = projection(self.device_type, self.device_type.HYDRATE_FIELDS)
+
+        if len(fields) < len(projection(self.device_type)):
+            self.hydrate_fields = fields
+
+        self.loading = True
+
+        tornado.ioloop.IOLoop.current().spawn_callback(self.load_devices)
+
+    def mark_startup(self, phase):
+        """Record the time it took to reach a startup phase."""
+
+        self.startup[phase] = (time.time() - self.start_time) * 1000
+
+        self.log.info("Startup phase %s reached in %.1f ms (%u devices)",
+                      phase, self.startup[phase],
+                      len(self.devices) + len(self.unhydrated))
+
+    async def load_devices(self):
+        """Load the devices from the database."""
+
+        try:
+            async for batch in self.persistence.load(
+                    self.device_type, fields=self.hydrate_fields):
+                self.add_documents(batch)
+        finally:
+            self.loading = False
+            self.loaded.set()
+
+        self.mark_startup("loaded")
+        self.removed.clear()
+
+        # Build the devices that did not connect yet, a batch at a time
+        while self.unhydrated:
+
+            for addr in list(itertools.islice(self.unhydrated,
+                                              DEFAULT_BATCH_SIZE)):
+                self.hydrate(addr)
+
+            await tornado.gen.sleep(0)
+
+        self.mark_startup("ready")
+
+    def add_documents(self, docs):
+        """Add the documents read from the database to the unhydrated."""
+
+        pk_field = self.device_type._mongometa.pk
+
+        for doc in docs:
+
+            addr = pk_field.to_python(doc["_id"])
+
+            # Skip the devices created, read or removed in the meanwhile
+            if addr in self.devices or addr in self.removed:
+                continue
+
+            self.unhydrated.setdefault(addr, doc)
+
+    def hydrate(self, addr):
+        """Build a device read from the database."""
+
+        doc = self.unhydrated.pop(addr)
+
+        self.devices[addr] = self.device_type.from_document(doc)
+
+        if self.hydrate_fields:
+            self.partial.add(addr)
+
+        return self.devices[addr]
+
+    def read_device(self, addr):
+        """Read a device in the background (e.g. on a hello while loading).
+
+        The device is added to the ones read so far, if found.
+        """
+
+        if addr in self.reading:
+            return
+
+        self.reading.add(addr)
+
+        pk_field = self.device_type._mongometa.pk
+
+        future = self.persistence.submit(
+            "%s.find" % self.device_type.__name__, find, self.device_type,
+            {"_id": pk_field.to_mongo(addr)}, self.hydrate_fields)
+
+        def on_done(future):
+
+            self.reading.discard(addr)
+
+            if not future.exception():
+                self.add_documents(future.result())
+
+        future.add_done_callback(on_done)
+
+    def complete_device(self, device):
+        """Read the fields not read when loading (on the first hello)."""
+
+        if device.addr not in self.partial:
+            return
+
+        self.partial.discard(device.addr)
+
+        pk_field = self.device_type._mongometa.pk
+
+        future = self.persistence.submit(
+            "%s.find" % self.device_type.__name__, find, self.device_type,
+            {"_id": pk_field.to_mongo(device.addr)})
+
+        def on_done(future):
+
+            if future.exception():
+                self.partial.add(device.addr)
+                return
+
+            # Removed in the meanwhile
+            if not future.result() or \
+                    self.devices.get(device.addr) is not device:
+                return
+
+            stored = self.device_type.from_document(future.result()[0])
+
+            for field in self.device_type._mongometa.get_fields():
+                if field.attname not in self.device_type.HYDRATE_FIELDS:
+                    setattr(device, field.attname,
+                            getattr(stored, field.attname))
+
+        future.add_done_callback(on_done)
+
+    def get_device(self, addr):
+        """Return the device (building it if needed) or None.
+
+        While loading, the devices not read yet are reported as missing.
+        """
+
+        if addr in self.unhydrated:
+            return self.hydrate(addr)
+
+        return self.devices.get(addr)
+
+    def get_devices(self):
+        """Return the devices, building the ones not built yet.
+
+        While loading, only the devices read so far are returned (wait for
+        loaded to get all of them).
+        """
+
+        for addr in list(self.unhydrated):
+            self.hydrate(addr)
+
+        return self.devices
 
     def handle_stream(self, stream, address):
         """Handle incoming connection."""
@@ -97,53 +339,205 @@ class RANManager(EService):
 
         self.connections[address[0]] = connection
 
+    def liveness_timeout(self, device):
+        """Return the inactivity timeout for the device (in s)."""
+
+        period = device.period if device.period else HELLO_PERIOD
+
+        return period * HELLO_MISSED / 1000
+
+    def watch(self, device):
+        """Start tracking the device liveness."""
+
+        self.unwatch(device)
+        self.schedule_liveness(device)
+
+    def unwatch(self, device):
+        """Stop tracking the device liveness."""
+
+        # The heap entry is discarded when it reaches the top of the heap
+        self.liveness.pop(device.addr, None)
+
+    def refresh_liveness(self, device):
+        """Push the device deadline forward (to be called on hellos)."""
+
+        if device.addr not in self.liveness:
+            return
+
+        entry = self.liveness[device.addr]
+        deadline = self.now() + self.liveness_timeout(device)
+
+        # The period has been shortened, reschedule
+        if deadline < entry[2]:
+            self.schedule_liveness(device)
+            return
+
+        entry[0] = deadline
+
+    def schedule_liveness(self, device):
+        """Add a heap entry for the device and arm the timer if needed."""
+
+        deadline = self.now() + self.liveness_timeout(device)
+        token = next(self.liveness_tokens)
+
+        self.liveness[device.addr] = [deadline, token, deadline]
+        heapq.heappush(self.liveness_heap, (deadline, token, device.addr))
+
+        self.arm_liveness_timer()
+
+    def arm_liveness_timer(self):
+        """Arm the timer for the earliest deadline."""
+
+        if not self.liveness_heap:
+            return
+
+        deadline = self.liveness_heap[0][0]
+
+        if self.liveness_timer and self.liveness_timer_deadline <= deadline:
+            return
+
+        ioloop = tornado.ioloop.IOLoop.current()
+
+        if self.liveness_timer:
+            ioloop.remove_timeout(self.liveness_timer)
+
+        self.liveness_timer = ioloop.call_at(deadline, self.check_liveness)
+        self.liveness_timer_deadline = deadline
+
+    def check_liveness(self, now=None):
+        """Close the connections of the devices whose deadline has passed."""
+
+        self.liveness_timer = None
+        self.liveness_timer_deadline = None
+
+        if now is None:
+            now = self.now()
+
+        while self.liveness_heap and self.liveness_heap[0][0] <= now:
+
+            _, token, addr = heapq.heappop(self.liveness_heap)
+
+            entry = self.liveness.get(addr)
+
+            # Device not tracked anymore or rescheduled
+            if not entry or entry[1] != token:
+                continue
+
+            # Hellos received in the meantime, move the entry forward
+            if entry[0] > now:
+                entry[2] = entry[0]
+                heapq.heappush(self.liveness_heap, (entry[0], token, addr))
+                continue
+
+            del self.liveness[addr]
+
+            self.on_device_inactive(addr)
+
+        self.arm_liveness_timer()
+
+    def on_device_inactive(self, addr):
+        """Close the connection of an inactive device."""
+
+        device = self.devices.get(addr)
+
+        if not device or not device.connection:
+            return
+
+        connection = device.connection
+
+        if connection.stream.closed():
+            return
+
+        self.log.warning('Client inactive %s at %r', addr,
+                         connection.stream.socket.getpeername())
+
+        connection.stream.close()
+
+    @staticmethod
+    def now():
+        """Return the current time in the IOLoop time base."""
+
+        return tornado.ioloop.IOLoop.current().time()
+
+    def stop(self):
+        """Stop the manager."""
+
+        super().stop()
+
+        if self.capture_writer:
+            self.capture_writer.shutdown()
+            self.capture_writer = None
+
+        self.persistence.shutdown()
+
     def to_dict(self):
         """Return JSON-serializable representation of the object."""
 
         out = super().to_dict()
         out["connections"] = self.connections
+        out["persistence"] = self.persistence.to_dict()
+        out["startup"] = self.startup
+
+        if self.capture_writer:
+            out["capture"] = self.capture_writer.to_dict()
+
         return out
 
     def create(self, addr, desc="Generic device"):
         """Create new device."""
 
-        if addr in self.devices:
+        if self.get_device(addr):
             raise ValueError("Device %s already defined" % addr)
 
         device = self.device_type(addr=addr, desc=desc)
-        device.save()
+        future = self.persistence.save(device)
 
         self.devices[device.addr] = device
 
-        return self.devices[device.addr]
+        return chain([future], device)
 
     def update(self, addr, desc="Generic device"):
         """Update device."""
 
-        device = self.devices[addr]
+        device = self.get_device(addr)
+
+        if not device:
+            raise KeyError("Device %s not registered" % addr)
+
+        old_desc = device.desc
 
         try:
             device.desc = desc
-            device.save()
-        finally:
-            device.refresh_from_db()
+            future = self.persistence.save(device)
+        except ValidationError:
+            device.desc = old_desc
+            raise
 
-        return self.devices[device.addr]
+        return chain([future], device)
 
     def remove_all(self):
         """Remove all devices."""
 
-        for addr in list(self.devices):
-            self.remove(addr)
+        return chain([self.remove(addr) for addr in list(self.get_devices())])
 
     def remove(self, addr):
         """Remove device."""
 
-        if addr not in self.devices:
-            raise KeyError("Device %s not registered" % addr)
+        device = self.get_device(addr)
 
-        device = self.devices[addr]
+        if not device:
+            raise KeyError("Device %s not registered" % addr)
 
-        device.delete()
+        future = self.persistence.delete(device)
 
         del self.devices[addr]
+
+        if "loaded" not in self.startup:
+            self.removed.add(addr)
+
+        # Connections skip the device lookup once bound, so close the
+        # connection explicitly (the device will be refused on reconnection)
+        if device.connection:
+            device.connection.stream.close()
+
+        return future
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Pending transactions."""
+
+import heapq
+import logging
+
+import tornado.ioloop
+
+# Default transaction timeout (in ms)
+TRANSACTION_TIMEOUT = 10000
+
+# Timeout of the transactions that never expire (they can still be evicted)
+NO_TIMEOUT = float("inf")
+
+# Default max number of outstanding transactions per connection
+MAX_TRANSACTIONS = 1024
+
+# Transaction ids are 32 bits long, 0 is never used
+MAX_XID = 0xFFFFFFFF
+
+
+class Transaction:
+    """A request waiting for a response."""
+
+    __slots__ = ('xid', 'request', 'callback', 'on_timeout', 'deadline')
+
+    def __init__(self, xid, request, callback, on_timeout, deadline):
+
+        self.xid = xid
+        self.request = request
+        self.callback = callback
+        self.on_timeout = on_timeout
+        self.deadline = deadline
+
+    def __repr__(self):
+        return "%s(xid=%u, deadline=%.3f)" % \
+            (self.__class__.__name__, self.xid, self.deadline)
+
+
+class TransactionTable:
+    """Bounded table of pending transactions.
+
+    Every transaction has a deadline, unless it is added with NO_TIMEOUT.
+    Deadlines are kept in a heap and a single IOLoop timeout is armed for the
+    earliest one. Expired transactions are removed from the table and their
+    on_timeout callback is invoked. If the table is full the oldest
+    transaction is evicted (and handled as if it timed out).
+
+    The table also allocates xids: xids are 32 bits long, wrap around and
+    skip 0 and the xids that are still pending.
+    """
+
+    def __init__(self, timeout=TRANSACTION_TIMEOUT,
+                 max_transactions=MAX_TRANSACTIONS):
+
+        self.log = logging.getLogger("%s" % self.__class__.__module__)
+
+        self.timeout = timeout
+        self.max_transactions = max_transactions
+
+        self.last_xid = 0
+
+        # xid -> Transaction, in insertion order
+        self.pending = {}
+
+        # (deadline, xid, transaction), entries of completed transactions
+        # are removed lazily
+        self.deadlines = []
+
+        self.timer = None
+        self.timer_deadline = None
+
+        self.completed = 0
+        self.timeouts = 0
+        self.evicted = 0
+        self.max_outstanding = 0
+
+    def next_xid(self):
+        """Return a new xid."""
+
+        xid = self.last_xid
+
+        while True:
+            xid = xid + 1 if xid < MAX_XID else 1
+            if xid not in self.pending:
+                break
+
+        self.last_xid = xid
+
+        return xid
+
+    def add(self, xid, request, callback=None, on_timeout=None, timeout=None):
+        """Add a new transaction.
+
+        Timeout is in ms, if not specified the table default is used. Use
+        NO_TIMEOUT for requests that must wait for their response.
+        """
+
+        if xid in self.pending:
+            raise ValueError("Transaction %u already pending" % xid)
+
+        while len(self.pending) >= self.max_transactions:
+            oldest = next(iter(self.pending.values()))
+            self.log.warning("Too many pending transactions, evicting %u",
+                             oldest.xid)
+            self.evicted += 1
+            self.expire_transaction(oldest)
+
+        if timeout is None:
+            timeout = self.timeout
+
+        deadline = self.now() + timeout / 1000
+
+        transaction = Transaction(xid, request, callback, on_timeout, deadline)
+
+        self.pending[xid] = transaction
+
+        if len(self.pending) > self.max_outstanding:
+            self.max_outstanding = len(self.pending)
+
+        if timeout == NO_TIMEOUT:
+            return transaction
+
+        heapq.heappush(self.deadlines, (deadline, xid, transaction))
+
+        # Stale entries are removed lazily, rebuild the heap if they pile up
+        if len(self.deadlines) > 2 * len(self.pending) + 64:
+            self.deadlines = [entry for entry in self.deadlines
+                              if self.pending.get(entry[1]) is entry[2]]
+            heapq.heapify(self.deadlines)
+
+        self.schedule()
+
+        return transaction
+
+    def pop(self, xid):
+        """Remove and return a pending transaction (None if not found)."""
+
+        transaction = self.pending.pop(xid, None)
+
+        if transaction:
+            self.completed += 1
+
+        return transaction
+
+    def clear(self):
+        """Drop all pending transactions without invoking any callback."""
+
+        self.pending.clear()
+        self.deadlines = []
+
+        if self.timer:
+            tornado.ioloop.IOLoop.current().remove_timeout(self.timer)
+
+        self.timer = None
+        self.timer_deadline = None
+
+    def expire(self, now=None):
+        """Remove all the transactions whose deadline has passed."""
+
+        self.timer = None
+        self.timer_deadline = None
+
+        if now is None:
+            now = self.now()
+
+        while self.deadlines and self.deadlines[0][0] <= now:
+
+            _, xid, transaction = heapq.heappop(self.deadlines)
+
+            if self.pending.get(xid) is not transaction:
+                continue
+
+            self.log.warning("Transaction %u timed out", xid)
+            self.timeouts += 1
+            self.expire_transaction(transaction)
+
+        self.schedule()
+
+    def expire_transaction(self, transaction):
+        """Remove the transaction and invoke its on_timeout callback."""
+
+        del self.pending[transaction.xid]
+
+        if not transaction.on_timeout:
+            return
+
+        try:
+            transaction.on_timeout(transaction.request)
+        except Exception as ex:
+            self.log.exception(ex)
+
+    def schedule(self):
+        """Arm the timer for the earliest deadline."""
+
+        # Drop stale entries from the top of the heap
+        while self.deadlines and \
+                self.pending.get(self.deadlines[0][1]) is not \
+                self.deadlines[0][2]:
+            heapq.heappop(self.deadlines)
+
+        if not self.deadlines:
+            return
+
+        deadline = self.deadlines[0][0]
+
+        if self.timer and self.timer_deadline <= deadline:
+            return
+
+        ioloop = tornado.ioloop.IOLoop.current()
+
+        if self.timer:
+            ioloop.remove_timeout(self.timer)
+
+        self.timer = ioloop.call_at(deadline, self.expire)
+        self.timer_deadline = deadline
+
+    @staticmethod
+    def now():
+        """Return the current time in the IOLoop time base."""
+
+        return tornado.ioloop.IOLoop.current().time()
+
+    def to_dict(self):
+        """Return a JSON-serializable dictionary."""
+
+        return {
+            "outstanding": len(self.pending),
+            "max_outstanding": self.max_outstanding,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "evicted": self.evicted
+        }
+
+    def __contains__(self, xid):
+        return xid in self.pending
+
+    def __getitem__(self, xid):
+        return self.pending[xid]
+
+    def __len__(self):
+        return len(self.pending)
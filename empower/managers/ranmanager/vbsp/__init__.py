@@ -20,6 +20,10 @@
 from construct import Struct, Int8ub, Int16ub, Int32ub, Flag, Bytes, Bit, \
     BitStruct, Padding, BitsInteger, Array, GreedyRange, Byte, this, Int64ub
 
+from empower.managers.ranmanager.codec import compile_struct, TLVCodec, \
+    Unsupported
+from empower.managers.ranmanager.callbacks import CallbackRegistry
+
 PT_VERSION = 0x02
 
 MSG_TYPE_REQUEST = 0
@@ -65,6 +69,12 @@ HEADER = Struct(
     "xid" / Int32ub,
 )
 
+# Offset of the length field in HEADER (used for framing)
+HEADER_LENGTH_OFFSET = 4
+
+# Offset of the device field in HEADER (used for captures)
+HEADER_DEVICE_OFFSET = 10
+
 PACKET = Struct(
     "version" / Int8ub,
     "flags" / BitStruct(
@@ -133,10 +143,53 @@ PT_TYPES = {
 
 }
 
-PT_TYPES_HANDLERS = {}
+
+def message_name(pt_type):
+    """Return the name of the message type."""
+
+    if not PT_TYPES[pt_type]:
+        return pt_type
+
+    return PT_TYPES[pt_type][1]
+
+
+# App callbacks (see empower.managers.ranmanager.callbacks)
+CALLBACKS = CallbackRegistry()
+
+for k in PT_TYPES:
+    CALLBACKS.add_type(k, message_name(k))
+
+PT_TYPES_HANDLERS = CALLBACKS.handlers
+
+# Precompiled codecs (see empower.managers.ranmanager.codec)
+HEADER_CODEC = compile_struct(HEADER)
+
+TLV_CODECS = {}
+
+for k in TLVS:
+    TLV_CODECS[k] = compile_struct(TLVS[k])
+
+
+def compile_message(fmt):
+    """Return the codec for a message.
+
+    The TLVs of parsed messages are indexed and decoded on demand with the
+    codecs in TLV_CODECS (see TLVIndex).
+    """
+
+    codec = compile_struct(fmt, HEADER_CODEC)
+
+    try:
+        return TLVCodec(codec, HEADER_CODEC, TLV_CODECS)
+    except Unsupported:
+        return codec
+
+
+CODECS = {}
 
 for k in PT_TYPES:
-    PT_TYPES_HANDLERS[k] = []
+    if PT_TYPES[k]:
+        CODECS[k] = compile_message(PT_TYPES[k][0])
 
 
 def register_message(pt_type, parser):
@@ -145,38 +198,32 @@ def register_message(pt_type, parser):
     if pt_type not in PT_TYPES:
         PT_TYPES[pt_type] = parser
 
-    if pt_type not in PT_TYPES_HANDLERS:
-        PT_TYPES_HANDLERS[pt_type] = []
+    CALLBACKS.add_type(pt_type, message_name(pt_type))
 
+    if pt_type not in CODECS and PT_TYPES[pt_type]:
+        CODECS[pt_type] = compile_message(PT_TYPES[pt_type][0])
 
-def register_callbacks(app, callback_str='handle_'):
-    """Register callbacks."""
 
-    for pt_type in PT_TYPES_HANDLERS:
+def register_tlv(tlv_type, parser):
+    """Register a new TLV type."""
 
-        if not PT_TYPES[pt_type]:
-            handler_name = callback_str + pt_type
-        else:
-            handler_name = callback_str + PT_TYPES[pt_type][1]
+    if tlv_type not in TLVS:
+        TLVS[tlv_type] = parser
 
-        if hasattr(app, handler_name):
-            handler = getattr(app, handler_name)
-            PT_TYPES_HANDLERS[pt_type].append(handler)
+    if tlv_type not in TLV_CODECS:
+        TLV_CODECS[tlv_type] = compile_struct(TLVS[tlv_type])
 
 
-def unregister_callbacks(app, callback_str='handle_'):
-    """Unregister callbacks."""
+def register_callbacks(app, callback_str='handle_'):
+    """Register callbacks."""
 
-    for pt_type in PT_TYPES_HANDLERS:
+    CALLBACKS.register_app(app, callback_str)
 
-        if not PT_TYPES[pt_type]:
-            handler_name = callback_str + pt_type
-        else:
-            handler_name = callback_str + PT_TYPES[pt_type][1]
 
-        if hasattr(app, handler_name):
-            handler = getattr(app, handler_name)
-            PT_TYPES_HANDLERS[pt_type].remove(handler)
+def unregister_callbacks(app, callback_str='handle_'):
+    """Unregister callbacks."""
+
+    CALLBACKS.unregister_app(app, callback_str)
 
 
 def register_callback(pt_type, handler):
@@ -185,10 +232,7 @@ def register_callback(pt_type, handler):
     if pt_type not in PT_TYPES:
         raise KeyError("Packet type %u undefined")
 
-    if pt_type not in PT_TYPES_HANDLERS:
-        PT_TYPES_HANDLERS[pt_type] = []
-
-    PT_TYPES_HANDLERS[pt_type].append(handler)
+    CALLBACKS.add(pt_type, handler)
 
 
 def unregister_callback(pt_type, handler):
@@ -200,7 +244,32 @@ def unregister_callback(pt_type, handler):
     if pt_type not in PT_TYPES_HANDLERS:
         return
 
-    PT_TYPES_HANDLERS[pt_type].remove(handler)
+    CALLBACKS.remove(pt_type, handler)
+
+
+def register_demux(pt_type, demux):
+    """Register the demultiplexer for keyed subscriptions.
+
+    The demultiplexer is invoked as demux(msg, device) and must return the
+    (key, item) pairs of the message.
+    """
+
+    if pt_type not in PT_TYPES:
+        raise KeyError("Packet type %u undefined")
+
+    CALLBACKS.set_demux(pt_type, demux)
+
+
+def subscribe(pt_type, key, callback):
+    """Subscribe to the items of a message matching the key."""
+
+    CALLBACKS.subscribe(pt_type, key, callback)
+
+
+def unsubscribe(pt_type, key, callback):
+    """Remove a subscription."""
+
+    CALLBACKS.unsubscribe(pt_type, key, callback)
 
 
 def decode_msg(msg_type, crud_result):
@@ -17,14 +17,13 @@
 
 """Base Wi-Fi App class."""
 
-from empower_core.app import EApp
-
 import empower.managers.ranmanager.vbsp as vbsp
 
+from empower.managers.ranmanager.ranapp import ERANApp
 from empower.managers.ranmanager.vbsp.cellpool import CellPool
 
 
-class ELTEApp(EApp):
+class ELTEApp(ERANApp):
     """Base LTE App class."""
 
     MODULES = [vbsp]
@@ -21,6 +21,8 @@ import empower_core.apimanager.apimanager as apimanager
 
 from empower_core.etheraddress import EtherAddress
 
+import empower.managers.asyncapi as asyncapi
+
 
 # pylint: disable=W0223
 class VBSHandler(apimanager.APIHandler):
@@ -29,8 +31,8 @@ class VBSHandler(apimanager.APIHandler):
     URLS = [r"/api/v1/vbses/?",
             r"/api/v1/vbses/([a-zA-Z0-9:]*)/?"]
 
-    @apimanager.validate(max_args=1)
-    def get(self, *args, **kwargs):
+    @asyncapi.validate(max_args=1)
+    async def get(self, *args, **kwargs):
         """List devices.
 
         Args:
@@ -68,11 +70,21 @@ class VBSHandler(apimanager.APIHandler):
             }
         """
 
-        return self.service.devices \
-            if not args else self.service.devices[EtherAddress(args[0])]
+        # Wait for all the devices to be read
+        await self.service.loaded.wait()
+
+        if not args:
+            return self.service.get_devices()
+
+        device = self.service.get_device(EtherAddress(args[0]))
+
+        if not device:
+            raise KeyError("Device %s not registered" % args[0])
 
-    @apimanager.validate(returncode=204, min_args=1, max_args=1)
-    def put(self, *args, **kwargs):
+        return device
+
+    @asyncapi.validate(returncode=204, min_args=1, max_args=1)
+    async def put(self, *args, **kwargs):
         """Update the description of the device.
 
         Request:
@@ -90,15 +102,18 @@ class VBSHandler(apimanager.APIHandler):
             }
         """
 
+        # Wait for all the devices to be read
+        await self.service.loaded.wait()
+
         addr = EtherAddress(args[0])
 
         if 'desc' in kwargs:
-            self.service.update(addr, kwargs['desc'])
+            await self.service.update(addr, kwargs['desc'])
         else:
-            self.service.update(addr)
+            await self.service.update(addr)
 
-    @apimanager.validate(returncode=201, min_args=0, max_args=0)
-    def post(self, *args, **kwargs):
+    @asyncapi.validate(returncode=201, min_args=0, max_args=0)
+    async def post(self, *args, **kwargs):
         """Add a new device.
 
         Request:
@@ -125,17 +140,20 @@ class VBSHandler(apimanager.APIHandler):
             }
         """
 
+        # Wait for all the devices to be read
+        await self.service.loaded.wait()
+
         addr = EtherAddress(kwargs['addr'])
 
         if 'desc' in kwargs:
-            device = self.service.create(addr, kwargs['desc'])
+            device = await self.service.create(addr, kwargs['desc'])
         else:
-            device = self.service.create(addr)
+            device = await self.service.create(addr)
 
         self.set_header("Location", "/api/v1/vbses/%s" % device.addr)
 
-    @apimanager.validate(returncode=204, min_args=0, max_args=1)
-    def delete(self, *args, **kwargs):
+    @asyncapi.validate(returncode=204, min_args=0, max_args=1)
+    async def delete(self, *args, **kwargs):
         """Delete one or all devices.
 
         Args:
@@ -148,7 +166,10 @@ class VBSHandler(apimanager.APIHandler):
             DELETE /api/v1/vbses/00:00:00:00:00:01
         """
 
+        # Wait for all the devices to be read
+        await self.service.loaded.wait()
+
         if args:
-            self.service.remove(EtherAddress(args[0]))
+            await self.service.remove(EtherAddress(args[0]))
         else:
-            self.service.remove_all()
+            await self.service.remove_all()
@@ -20,7 +20,6 @@
 import time
 
 from construct import Container
-from tornado.iostream import StreamClosedError
 
 from empower_core.imsi import IMSI
 from empower_core.etheraddress import EtherAddress
@@ -35,66 +34,64 @@ from empower.managers.ranmanager.vbsp import HELLO_SERVICE_PERIOD, \
 class VBSPConnection(RANConnection):
     """A persistent connection to a VBS."""
 
-    def on_read(self, future):
-        """Assemble message from agent.
+    def on_frame(self, frame):
+        """Handle a complete frame from the agent.
 
-        Appends bytes read from socket to a buffer. Once the full packet
-        has been read the parser is invoked and the buffers is cleared. The
-        parsed packet is then passed to the suitable method or dropped if the
-        packet type in unknown.
+        The frame is parsed and passed to the suitable method or dropped if
+        the packet type in unknown.
         """
 
-        try:
-            self.buffer = self.buffer + future.result()
-        except StreamClosedError as stream_ex:
-            self.log.error(stream_ex)
-            return
-
-        hdr = self.proto.HEADER.parse(self.buffer)
-
-        if len(self.buffer) < hdr.length:
-            remaining = hdr.length - len(self.buffer)
-            future = self.stream.read_bytes(remaining)
-            future.add_done_callback(self.on_read)
-            return
+        hdr = self.proto.HEADER_CODEC.parse(frame)
 
         # Check if we know the message type
-        if hdr.tsrc.action not in self.proto.PT_TYPES:
+        if hdr.tsrc.action not in self.proto.CODECS:
             self.log.warning("Unknown message type %u, ignoring.",
                              hdr.tsrc.action)
             return
 
-        # Check if the Device is among the ones we known
-        addr = EtherAddress(hdr.device)
+        # Fast path, the connection is already bound to the device
+        if self.device and hdr.device == self.device_raw:
 
-        if addr not in self.manager.devices:
-            self.log.warning("Unknown Device %s, closing connection.", addr)
-            self.stream.close()
-            return
+            device = self.device
+
+        else:
+
+            # Check if the Device is among the ones we known
+            addr = EtherAddress(hdr.device)
 
-        device = self.manager.devices[addr]
+            device = self.manager.get_device(addr)
+
+            if not device and self.manager.loading:
+                # Not read yet, the device will be found at its next hello
+                self.manager.read_device(addr)
+                return
+
+            if not device:
+                self.log.warning("Unknown Device %s, closing connection.",
+                                 addr)
+                self.stream.close()
+                return
 
         # Log message informations
-        parser = self.proto.PT_TYPES[hdr.tsrc.action][0]
+        parser = self.proto.CODECS[hdr.tsrc.action]
         name = self.proto.PT_TYPES[hdr.tsrc.action][1]
-        msg = parser.parse(self.buffer)
+        msg = parser.parse_body(frame, hdr)
 
         tmp = self.proto.decode_msg(hdr.flags.msg_type, hdr.tsrc.crud_result)
 
         self.log.debug("Got %s message (%s, %s) from %s seq %u", name,
-                       tmp[0], tmp[1], EtherAddress(addr), msg.seq)
+                       tmp[0], tmp[1], device.addr, hdr.seq)
 
         # If Device is not online and is not connected, then the only message
         # type we can accept is HELLO_RESPONSE
         if not device.is_connected():
 
-            if msg.tsrc.action != self.proto.PT_HELLO_SERVICE:
-                if not self.stream.closed():
-                    self.wait()
+            if hdr.tsrc.action != self.proto.PT_HELLO_SERVICE:
                 return
 
             # This is a new connection, set pointer to the device
             self.device = device
+            self.device_raw = hdr.device
 
             # The set pointer from device connection to this object
             device.connection = self
@@ -102,8 +99,11 @@ class VBSPConnection(RANConnection):
             # Transition to connected state
             device.set_connected()
 
-            # Start hb worker
-            self.hb_worker.start()
+            # Start tracking the device liveness
+            self.manager.watch(device)
+
+            # Read the fields not read when the devices were loaded
+            self.manager.complete_device(device)
 
             # Send caps request
             self.send_caps_request()
@@ -115,44 +115,31 @@ class VBSPConnection(RANConnection):
             valid = (self.proto.PT_HELLO_SERVICE,
                      self.proto.PT_CAPABILITIES_SERVICE)
 
-            if msg.tsrc.action not in valid:
-
-                if not self.stream.closed():
-                    self.wait()
-
+            if hdr.tsrc.action not in valid:
                 return
 
         # Otherwise handle message
         try:
-            self.handle_message(name, msg)
+            self.handle_message(msg, hdr)
         except Exception as ex:
             self.log.exception(ex)
             self.stream.close()
 
-        if not self.stream.closed():
-            self.wait()
+    def handle_message(self, msg, hdr=None):
+        """Handle incoming message.
 
-    def handle_message(self, method, msg):
-        """Handle incoming message."""
+        The header (if already decoded) is used for dispatching, otherwise
+        the header fields are taken from the message.
+        """
 
-        # If the default handler is defined then call it
-        handler_name = "_handle_%s" % method
-        if hasattr(self, handler_name):
-            handler = getattr(self, handler_name)
-            handler(msg)
+        if hdr is None:
+            hdr = msg
 
-        # Call registered callbacks
-        if msg.tsrc.action in self.proto.PT_TYPES_HANDLERS:
-            for handler in self.proto.PT_TYPES_HANDLERS[msg.tsrc.action]:
-                handler(msg, self.device)
+        # Call the default handler and the registered callbacks
+        self.dispatch_message(hdr.tsrc.action, msg)
 
         # Check if there are pending XIDs
-        if msg.xid in self.xids:
-            request = self.xids[msg.xid][0]
-            callback = self.xids[msg.xid][1]
-            if callback:
-                callback(msg, self.device, request)
-            del self.xids[msg.xid]
+        self.complete_transaction(hdr.xid, msg)
 
     def on_disconnect(self):
         """Handle device disconnection."""
@@ -163,13 +150,15 @@ class VBSPConnection(RANConnection):
         self.log.warning("Device disconnected: %s", self.device.addr)
 
         # Remove hosted Users
-        users = [user for user in self.manager.users.values()
-                 if user.cell.vbs.addr == self.device.addr]
+        users = self.manager.users.lookup("vbs", self.device.addr)
 
-        for user in list(users):
+        for user in list(users.values()):
             self.send_client_leave_message_to_self(user)
             del self.manager.users[user.imsi]
 
+        # Stop tracking the device liveness
+        self.manager.unwatch(self.device)
+
         # reset state
         self.device.set_disconnected()
         self.device.last_seen = 0
@@ -177,14 +166,18 @@ class VBSPConnection(RANConnection):
         self.device.cells = {}
         self.device = None
 
-        # Stop hb worker
-        self.hb_worker.stop()
+        # Drop pending transactions
+        self.xids.clear()
 
     def send_message(self, action, msg_type, crud_result, tlvs=None,
-                     callback=None):
-        """Send message and set common parameters."""
+                     callback=None, on_timeout=None, timeout=None):
+        """Send message and set common parameters.
 
-        parser = self.proto.PT_TYPES[action][0]
+        If a callback or an on_timeout callback is specified the request is
+        tracked until the response arrives or the timeout (in ms) expires.
+        """
+
+        parser = self.proto.CODECS[action]
         name = self.proto.PT_TYPES[action][1]
 
         if self.stream.closed():
@@ -221,10 +214,9 @@ class VBSPConnection(RANConnection):
         self.log.debug("Sending %s message (%s, %s) to %s seq %u",
                        name, tmp[0], tmp[1], addr[0], msg.seq)
 
-        self.stream.write(parser.build(msg))
+        self.write(parser.build(msg))
 
-        if callback:
-            self.xids[msg.xid] = (msg, callback)
+        self.add_transaction(msg, callback, on_timeout, timeout)
 
         return msg.xid
 
@@ -266,51 +258,37 @@ class VBSPConnection(RANConnection):
     def _handle_hello_service(self, msg):
         """Handle an incoming HELLO message."""
 
-        period = 0;
+        period = 0
 
-        # parse TLVs
-        for tlv in msg.tlvs:
+        for tlv_type in msg.tlvs.unknown():
+            self.log.warning("Unknown options %u", tlv_type)
 
-            if tlv.type not in self.proto.TLVS:
-                self.log.warning("Unknown options %u", tlv.type)
-                continue
-
-            parser = self.proto.TLVS[tlv.type]
-            option = parser.parse(tlv.value)
-
-            self.log.debug("Processing options %s", parser.name)
-
-            if tlv.type == self.proto.PT_HELLO_SERVICE_PERIOD:
-                self.log.info("Hello period set to %usms", option.period)
-                period = option.period
-                self.send_hello_response(option.period)
+        # parse TLVs
+        for option in msg.tlvs.decode(self.proto.PT_HELLO_SERVICE_PERIOD):
+            self.log.info("Hello period set to %usms", option.period)
+            period = option.period
+            self.send_hello_response(option.period)
 
         self.device.period = period
         self.device.last_seen = msg.seq
         self.device.last_seen_ts = time.time()
 
+        self.manager.refresh_liveness(self.device)
+
     def _handle_capabilities_service(self, msg):
         """Handle an incoming CAPABILITIES_SERVICE message."""
 
-        # parse TLVs
-        for tlv in msg.tlvs:
-
-            if tlv.type not in self.proto.TLVS:
-                self.log.warning("Unknown options %u", tlv.type)
-                continue
-
-            parser = self.proto.TLVS[tlv.type]
-            option = parser.parse(tlv.value)
+        for tlv_type in msg.tlvs.unknown():
+            self.log.warning("Unknown options %u", tlv_type)
 
-            self.log.debug("Processing options %s", parser.name)
-
-            if tlv.type == self.proto.PT_CAPABILITIES_SERVICE_CELL:
-                self.device.cells[option.pci] = \
-                    Cell(vbs=self.device,
-                         pci=option.pci,
-                         dl_earfcn=option.dl_earfcn,
-                         ul_earfcn=option.ul_earfcn,
-                         n_prbs=option.n_prbs)
+        # parse TLVs
+        for option in msg.tlvs.decode(self.proto.PT_CAPABILITIES_SERVICE_CELL):
+            self.device.cells[option.pci] = \
+                Cell(vbs=self.device,
+                     pci=option.pci,
+                     dl_earfcn=option.dl_earfcn,
+                     ul_earfcn=option.ul_earfcn,
+                     n_prbs=option.n_prbs)
 
         # set state to online
         self.device.set_online()
@@ -321,59 +299,54 @@ class VBSPConnection(RANConnection):
     def _handle_ue_reports_service(self, msg):
         """Handle an incoming CAPABILITIES_SERVICE message."""
 
-        # parse TLVs
-        for tlv in msg.tlvs:
-
-            if tlv.type not in self.proto.TLVS:
-                self.log.warning("Unknown options %u", tlv.type)
-                continue
-
-            parser = self.proto.TLVS[tlv.type]
-            option = parser.parse(tlv.value)
+        for tlv_type in msg.tlvs.unknown():
+            self.log.warning("Unknown options %u", tlv_type)
 
-            self.log.debug("Processing options %s", parser.name)
+        # parse TLVs
+        identities = \
+            msg.tlvs.decode(self.proto.PT_UE_REPORTS_SERVICE_IDENTITY)
 
-            if tlv.type == self.proto.PT_UE_REPORTS_SERVICE_IDENTITY:
+        for option in identities:
 
-                if option.pci not in self.device.cells:
-                    self.log.warning("Unable to find pci %u", option.pci)
+            if option.pci not in self.device.cells:
+                self.log.warning("Unable to find pci %u", option.pci)
 
-                cell = self.device.cells[option.pci]
-                imsi = IMSI(str(option.imsi))
+            cell = self.device.cells[option.pci]
+            imsi = IMSI(str(option.imsi))
 
-                # User disconnected
-                if option.status == USER_STATUS_DISCONNECTED:
+            # User disconnected
+            if option.status == USER_STATUS_DISCONNECTED:
 
-                    if imsi not in self.manager.users:
-                        self.log.warning("IMSI not found: %s", imsi)
-                        continue
+                if imsi not in self.manager.users:
+                    self.log.warning("IMSI not found: %s", imsi)
+                    continue
 
-                    user = self.manager.users[imsi]
+                user = self.manager.users[imsi]
 
-                    self.send_client_leave_message_to_self(user)
-                    del self.manager.users[imsi]
+                self.send_client_leave_message_to_self(user)
+                del self.manager.users[imsi]
 
-                    self.log.info("Removing user: %s", user)
+                self.log.info("Removing user: %s", user)
 
-                    continue
+                continue
 
-                # User connected
-                if imsi in self.manager.users:
+            # User connected
+            if imsi in self.manager.users:
 
-                    user = self.manager.users[imsi]
-                    user.rnti = option.rnti
+                user = self.manager.users[imsi]
+                user.rnti = option.rnti
 
-                    self.log.info("Updating user: %s", user)
+                self.log.info("Updating user: %s", user)
 
-                else:
+            else:
 
-                    user = User(imsi=imsi,
-                                tmsi=option.tmsi,
-                                rnti=option.rnti,
-                                status=option.status,
-                                cell=cell)
+                user = User(imsi=imsi,
+                            tmsi=option.tmsi,
+                            rnti=option.rnti,
+                            status=option.status,
+                            cell=cell)
 
-                    self.manager.users[imsi] = user
-                    self.send_client_join_message_to_self(user)
+                self.manager.users[imsi] = user
+                self.send_client_join_message_to_self(user)
 
-                    self.log.info("Adding user: %s", user)
+                self.log.info("Adding user: %s", user)
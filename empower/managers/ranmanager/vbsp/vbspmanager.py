@@ -20,6 +20,7 @@
 import empower.managers.ranmanager.vbsp as vbsp
 
 from empower.managers.ranmanager.ranmanager import RANManager
+from empower.managers.ranmanager.index import IndexedDict
 from empower.managers.ranmanager.vbsp.vbshandler import VBSHandler
 from empower.managers.ranmanager.vbsp.userhandler import UserHandler
 from empower.managers.ranmanager.vbsp.vbspconnection import VBSPConnection
@@ -29,29 +30,53 @@ from empower.managers.ranmanager.vbsp.vbs import VBS
 DEFAULT_PORT = 5533
 
 
+def user_vbs(user):
+    """Return the address of the VBS serving the UE."""
+
+    return [user.vbs.addr]
+
+
+def user_cell(user):
+    """Return the cell serving the UE."""
+
+    return [user.cell]
+
+
+def user_plmnid(user):
+    """Return the PLMN id of the UE."""
+
+    return [user.plmnid]
+
+
 class VBSPManager(RANManager):
     """VBSP RAN Manager
 
     Parameters:
         port: the port on which the TCP server should listen (optional,
             default: 5533)
+        capture: the file where southbound frames are recorded (optional,
+            default: None)
     """
 
     HANDLERS = [VBSHandler, UserHandler]
 
-    def __init__(self, context, service_id, port):
+    def __init__(self, context, service_id, port, capture=None):
 
         super().__init__(context=context,
                          service_id=service_id,
                          device_type=VBS,
                          connection_type=VBSPConnection,
                          proto=vbsp,
-                         port=port)
+                         port=port,
+                         capture=capture)
 
-        self.users = {}
+        # UEs indexed by VBS, cell and PLMN id (they never change)
+        self.users = IndexedDict(vbs=user_vbs, cell=user_cell,
+                                 plmnid=user_plmnid)
 
 
-def launch(context, service_id, port=DEFAULT_PORT):
+def launch(context, service_id, port=DEFAULT_PORT, capture=None):
     """ Initialize the module. """
 
-    return VBSPManager(context=context, service_id=service_id, port=port)
+    return VBSPManager(context=context, service_id=service_id, port=port,
+                       capture=capture)
@@ -67,6 +67,8 @@ class MACPrbUtilization(ELTEWorker):
         # Register messages
         parser = (vbsp.PACKET, "mac_prb_utilization_service")
         vbsp.register_message(PT_MAC_PRB_UTILIZATION_SERVICE, parser)
+        vbsp.register_tlv(TLV_MAC_PRB_UTILIZATION,
+                          MAC_PRB_UTILIZATION_SERVICE_REPORT)
 
         # Data structures
         self.dl_prb_counter = None
@@ -111,17 +113,11 @@ class MACPrbUtilization(ELTEWorker):
         # set last iteration time
         self.last = time.time()
 
-        # parse TLVs
-        for tlv in msg.tlvs:
-
-            if tlv.type != TLV_MAC_PRB_UTILIZATION:
-                self.log.warning("Unknown options %u", tlv.type)
-                continue
+        for tlv_type in msg.tlvs.types() - {TLV_MAC_PRB_UTILIZATION}:
+            self.log.warning("Unknown options %u", tlv_type)
 
-            parser = MAC_PRB_UTILIZATION_SERVICE_REPORT
-            option = parser.parse(tlv.value)
-
-            self.log.debug("Processing options %s", parser.name)
+        # parse TLVs
+        for option in msg.tlvs.decode(TLV_MAC_PRB_UTILIZATION):
 
             if option.pci not in vbs.cells:
                 self.log.warning("PCI %u not found", option.pci)
@@ -215,6 +215,73 @@ class TestAlerts(BaseTest):
         self.get(("root", "root",
                   "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26"), 404)
 
+    def test_subscriptions_bulk(self):
+        """test_subscriptions_bulk."""
+
+        params = ("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26")
+        self.post(params, {"alert": "This is a new alert message"}, 201)
+
+        params = ("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/subs")
+
+        subs = ["00:0D:B9:2F:%02X:%02X" % (i // 256, i % 256)
+                for i in range(1000)]
+
+        self.post(params, {"subs": subs + ["foo"]}, 400)
+        self.post(params, {"subs": subs}, 201)
+        self.post(params, {"subs": subs[:10]}, 201)
+
+        self.get(("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/subs/"
+                  "00:0D:B9:2F:03:E7"), 200)
+
+        self.delete(params, 204, {"subs": subs[1:]})
+
+        self.get(("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/subs/"
+                  "00:0D:B9:2F:03:E7"), 404)
+
+        self.get(("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/subs/"
+                  "00:0D:B9:2F:00:00"), 200)
+
+        self.delete(("root", "root",
+                     "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26"), 204)
+
+    def test_wtps_bulk(self):
+        """test_wtps_bulk."""
+
+        params = ("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26")
+        self.post(params, {"alert": "This is a new alert message"}, 201)
+
+        params = ("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/wtps")
+
+        wtps = ["00:0D:B9:54:%02X:%02X" % (i // 256, i % 256)
+                for i in range(1000)]
+
+        self.post(params, {"wtps": wtps + ["foo"]}, 400)
+        self.post(params, {"wtps": wtps}, 201)
+
+        self.get(("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/wtps/"
+                  "00:0D:B9:54:03:E7"), 200)
+
+        self.delete(params, 204, {"wtps": wtps[1:]})
+
+        self.get(("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/wtps/"
+                  "00:0D:B9:54:03:E7"), 404)
+
+        self.get(("root", "root",
+                  "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26/wtps/"
+                  "00:0D:B9:54:00:00"), 200)
+
+        self.delete(("root", "root",
+                     "/alerts/52313ecb-9d00-4b7d-b873-b55d3d9ada26"), 204)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -28,6 +28,21 @@ from .lteslices import TestLTESlices
 from .applications import TestApplications
 from .workers import TestWorkers
 from .alerts import TestAlerts
+from .codec import TestCodec
+from .connection import TestConnection
+from .transactions import TestTransactions
+from .callbacks import TestCallbacks
+from .capture import TestCapture
+from .index import TestIndex
+from .networks import TestNetworks
+from .persistence import TestPersistence
+from .asyncapi import TestAsyncAPI
+from .snapshot import TestSnapshot
+from .bssid import TestBSSID
+from .lvappmanager import TestLVAPPManager
+from .beacons import TestBeacons
+from .slices import TestSlices
+from .devices import TestDevices
 
 
 def full_suite():
@@ -38,8 +53,10 @@ def full_suite():
     suite.addTest(TestAlerts('test_create_new_alert'))
     suite.addTest(TestAlerts('test_create_new_alert_empty_body'))
     suite.addTest(TestAlerts('test_subscriptions'))
+    suite.addTest(TestAlerts('test_subscriptions_bulk'))
     suite.addTest(TestAlerts('test_update_alert'))
     suite.addTest(TestAlerts('test_wtps'))
+    suite.addTest(TestAlerts('test_wtps_bulk'))
 
     suite.addTest(TestWorkers('test_register_new_worker'))
     suite.addTest(TestWorkers('test_register_new_worker_fixed_uuid'))
@@ -109,6 +126,87 @@ def full_suite():
     suite.addTest(TestApplications('test_modify_app_invalid_param_value'))
     suite.addTest(TestApplications('test_register_new_app_parameters'))
 
+    suite.addTest(TestCodec('test_compile'))
+    suite.addTest(TestCodec('test_parse'))
+    suite.addTest(TestCodec('test_build'))
+    suite.addTest(TestCodec('test_parse_body'))
+    suite.addTest(TestCodec('test_truncated'))
+    suite.addTest(TestCodec('test_sizeof'))
+    suite.addTest(TestCodec('test_invalid_build'))
+    suite.addTest(TestCodec('test_fallback'))
+    suite.addTest(TestCodec('test_record'))
+    suite.addTest(TestCodec('test_tlv_index'))
+
+    suite.addTest(TestConnection('test_coalesce'))
+    suite.addTest(TestConnection('test_batch'))
+    suite.addTest(TestConnection('test_closed'))
+
+    suite.addTest(TestTransactions('test_xid_wraparound'))
+    suite.addTest(TestTransactions('test_complete'))
+    suite.addTest(TestTransactions('test_deadlines'))
+    suite.addTest(TestTransactions('test_eviction'))
+    suite.addTest(TestTransactions('test_duplicate'))
+    suite.addTest(TestTransactions('test_no_timeout'))
+
+    suite.addTest(TestCallbacks('test_register_app'))
+    suite.addTest(TestCallbacks('test_new_type'))
+    suite.addTest(TestCallbacks('test_shared_name'))
+    suite.addTest(TestCallbacks('test_instance_handler'))
+    suite.addTest(TestCallbacks('test_version'))
+    suite.addTest(TestCallbacks('test_subscriptions'))
+    suite.addTest(TestCallbacks('test_invalid'))
+    suite.addTest(TestCallbacks('test_demux_sta'))
+
+    suite.addTest(TestCapture('test_roundtrip'))
+    suite.addTest(TestCapture('test_truncated'))
+    suite.addTest(TestCapture('test_stream'))
+    suite.addTest(TestCapture('test_replay'))
+
+    suite.addTest(TestIndex('test_lookup'))
+    suite.addTest(TestIndex('test_remove'))
+    suite.addTest(TestIndex('test_reindex'))
+    suite.addTest(TestIndex('test_view'))
+
+    suite.addTest(TestNetworks('test_networks'))
+    suite.addTest(TestNetworks('test_cache'))
+
+    suite.addTest(TestPersistence('test_coalesce'))
+    suite.addTest(TestPersistence('test_retry'))
+    suite.addTest(TestPersistence('test_retry_discarded'))
+    suite.addTest(TestPersistence('test_shutdown'))
+    suite.addTest(TestPersistence('test_persistence'))
+    suite.addTest(TestPersistence('test_persistence_error'))
+    suite.addTest(TestPersistence('test_update'))
+    suite.addTest(TestPersistence('test_chain'))
+    suite.addTest(TestPersistence('test_load'))
+    suite.addTest(TestPersistence('test_to_bool'))
+
+    suite.addTest(TestAsyncAPI('test_validate'))
+
+    suite.addTest(TestSnapshot('test_roundtrip'))
+    suite.addTest(TestSnapshot('test_offline'))
+    suite.addTest(TestSnapshot('test_file'))
+
+    suite.addTest(TestBSSID('test_order'))
+    suite.addTest(TestBSSID('test_ssid'))
+
+    suite.addTest(TestLVAPPManager('test_launch'))
+    suite.addTest(TestLVAPPManager('test_evict'))
+    suite.addTest(TestLVAPPManager('test_max_idle_lvaps'))
+    suite.addTest(TestLVAPPManager('test_admit_probe'))
+
+    suite.addTest(TestBeacons('test_beacons'))
+    suite.addTest(TestBeacons('test_wtps'))
+
+    suite.addTest(TestSlices('test_slices'))
+    suite.addTest(TestSlices('test_invalid'))
+
+    suite.addTest(TestDevices('test_get_device'))
+    suite.addTest(TestDevices('test_get_devices'))
+    suite.addTest(TestDevices('test_read_device'))
+    suite.addTest(TestDevices('test_complete_device'))
+    suite.addTest(TestDevices('test_remove'))
+
     return suite
 
 
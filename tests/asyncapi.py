@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Asynchronous REST methods unit tests."""
+
+import json
+import unittest
+
+from types import SimpleNamespace
+
+import tornado.ioloop
+
+from tornado.concurrent import Future
+from pymongo.errors import PyMongoError
+
+import empower.managers.asyncapi as asyncapi
+
+from empower.managers.persistence import resolved
+
+
+class DummyHandler:
+    """A handler recording its replies."""
+
+    def __init__(self, **params):
+
+        self.request = SimpleNamespace(body=json.dumps(params).encode())
+        self.errors = []
+        self.status = None
+
+    def send_error(self, status_code, message):
+        """Record the error."""
+
+        self.errors.append((status_code, message))
+
+    def set_status(self, status_code, reason):
+        """Record the status."""
+
+        self.status = status_code
+
+    @asyncapi.validate(returncode=201, min_args=1, max_args=1)
+    async def post(self, *args, **kwargs):
+        """Wait for the write of the item."""
+
+        if args[0] == "missing":
+            raise KeyError(args[0])
+
+        if not kwargs.get("fail"):
+            return await resolved(args[0])
+
+        future = Future()
+        future.set_exception(PyMongoError("Write failed"))
+
+        return await future
+
+
+class TestAsyncAPI(unittest.TestCase):
+    """Asynchronous REST methods unit tests."""
+
+    def post(self, handler, *args):
+        """Run the method in a new IOLoop."""
+
+        ioloop = tornado.ioloop.IOLoop()
+
+        try:
+            ioloop.run_sync(lambda: handler.post(*args))
+        finally:
+            ioloop.close()
+
+    def test_validate(self):
+        """Check that failed writes and invalid requests are reported."""
+
+        handler = DummyHandler()
+        self.post(handler, "item")
+
+        self.assertEqual(handler.errors, [])
+        self.assertEqual(handler.status, 201)
+
+        handler = DummyHandler(fail=True)
+        self.post(handler, "item")
+
+        self.assertEqual(handler.errors, [(500, "Write failed")])
+
+        handler = DummyHandler()
+        self.post(handler, "missing")
+
+        self.assertEqual(handler.errors, [(404, "'missing'")])
+
+        handler = DummyHandler()
+        self.post(handler)
+
+        self.assertEqual(handler.errors, [(400, "Invalid url (1, 1)")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Alert beacons unit tests."""
+
+import uuid
+import unittest
+
+from empower_core.etheraddress import EtherAddress
+
+from empower.managers.persistence import resolved
+from empower.managers.alertsmanager.alertsmanager import launch
+from empower.managers.alertsmanager.alert import Alert
+
+WTP1 = EtherAddress("00:0D:B9:00:00:01")
+WTP2 = EtherAddress("00:0D:B9:00:00:02")
+STA = EtherAddress("60:F4:45:00:00:01")
+
+
+class DummyPersistence:
+    """Record the updates instead of writing them."""
+
+    def __init__(self):
+        self.updates = []
+
+    def update(self, doc, update):
+        """Record the update."""
+
+        self.updates.append((doc.alert_id, update))
+
+        return resolved()
+
+
+class TestBeacons(unittest.TestCase):
+    """Alert beacons unit tests."""
+
+    def setUp(self):
+        """Create a manager with an alert broadcast by WTP1."""
+
+        self.manager = launch(context=None, service_id=uuid.uuid4())
+        self.manager.persistence = DummyPersistence()
+
+        self.alert = Alert(alert_id=uuid.uuid4(), message="x" * 40,
+                           wtps=[WTP1])
+
+        self.manager.alerts[self.alert.alert_id] = self.alert
+        self.manager.index(self.alert)
+
+    def test_beacons(self):
+        """Check that beacons are prebuilt and looked up by WTP."""
+
+        beacons = self.manager.get_beacons(STA, WTP1)
+
+        self.assertEqual(len(beacons), 2)
+        self.assertEqual(beacons[0]["bssid"],
+                         EtherAddress("00:0D:B9:01:00:01"))
+        self.assertEqual(beacons[1]["bssid"],
+                         EtherAddress("00:0D:B9:01:01:00"))
+        self.assertEqual(self.manager.get_beacons(STA, WTP2), [])
+
+        # The message id changes only when the alert is rebuilt
+        self.assertEqual(self.manager.get_beacons(STA, WTP1), beacons)
+
+        self.manager.index(self.alert)
+        self.assertNotEqual(self.manager.get_beacons(STA, WTP1), beacons)
+
+    def test_wtps(self):
+        """Check that the WTP index follows the alert WTPs."""
+
+        self.manager.add_wtps(self.alert.alert_id, [WTP1, WTP2])
+
+        self.assertEqual(len(self.manager.get_beacons(STA, WTP2)), 2)
+        self.assertEqual(self.manager.persistence.updates, [
+            (self.alert.alert_id,
+             {"$addToSet": {"wtps": {"$each": [str(WTP2)]}}})])
+
+        self.manager.del_wtp(self.alert.alert_id, WTP1)
+
+        self.assertEqual(self.manager.get_beacons(STA, WTP1), [])
+        self.assertNotIn(WTP1, self.manager.wtp_alerts)
+        self.assertRaises(KeyError, self.manager.del_wtp,
+                          self.alert.alert_id, WTP1)
+
+        self.manager.unindex(self.alert.alert_id)
+
+        self.assertEqual(self.manager.wtp_alerts, {})
+        self.assertEqual(self.manager.beacons, {})
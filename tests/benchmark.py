@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Southbound codec benchmark.
+
+By default, for every LVAPP and VBSP message type compares the time needed
+to decode a message using:
+
+  construct:   HEADER.parse() followed by the message Struct parse()
+  two-pass:    HEADER_CODEC.parse() followed by the codec parse()
+  single-pass: HEADER_CODEC.parse() followed by the codec parse_body()
+
+With --check (or --save) runs a microbenchmark of every Struct defined by
+the protocols, apps and workers (see tests.codec.MODULES) reporting ns/op
+for parse and build and the bytes allocated by a parse. Results are
+compared against a baseline file and the exit status is non-zero if any
+message regressed by more than the threshold and by more than MIN_DELTA ns
+(smaller differences are within the noise). Timings are compared relative
+to a reference measure (parsing an LVAPP header) interleaved with the
+message ones, so that machine speed and frequency drifts cancel out and a
+baseline can be reused on a different machine. Allocations are compared as
+they are.
+
+Usage:
+
+  python3 -m tests.benchmark [--iterations N]
+  python3 -m tests.benchmark --save [--baseline FILE]
+  python3 -m tests.benchmark --check [--baseline FILE] [--threshold PCT]
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+import empower.managers.ranmanager.lvapp as lvapp
+import empower.managers.ranmanager.vbsp as vbsp
+
+from empower.managers.ranmanager.codec import compile_struct
+from tests.codec import sample, all_structs
+
+SAMPLES = 10
+
+# Number of times every measure is repeated (the median is kept)
+REPEAT = 21
+
+# Default regression threshold (in percent)
+THRESHOLD = 25
+
+# Minimum timing regression (in ns)
+MIN_DELTA = 100
+
+BASELINE = os.path.join(os.path.dirname(__file__), "benchmark.json")
+
+
+def measure(func, frames, iterations):
+    """Return the average time (in ns) needed to process a frame."""
+
+    start = time.perf_counter_ns()
+
+    for _ in range(iterations):
+        for frame in frames:
+            func(frame)
+
+    return (time.perf_counter_ns() - start) / (iterations * len(frames))
+
+
+def paths(proto, pt_type):
+    """Return the decoding paths for the specified message type."""
+
+    codec = proto.CODECS[pt_type]
+    fmt = codec.fmt
+
+    def construct_path(frame):
+        proto.HEADER.parse(frame)
+        return fmt.parse(frame)
+
+    def two_pass_path(frame):
+        proto.HEADER_CODEC.parse(frame)
+        return codec.parse(frame)
+
+    def single_pass_path(frame):
+        hdr = proto.HEADER_CODEC.parse(frame)
+        return codec.parse_body(frame, hdr)
+
+    return [("construct", construct_path),
+            ("two-pass", two_pass_path),
+            ("single-pass", single_pass_path)]
+
+
+def run(iterations):
+    """Run the benchmark and return the results."""
+
+    rng = random.Random(42)
+    results = []
+
+    for proto in (lvapp, vbsp):
+
+        for pt_type, codec in proto.CODECS.items():
+
+            frames = [codec.fmt.build(sample(codec.fmt, rng))
+                      for _ in range(SAMPLES)]
+
+            # VBSP messages share the same Struct, use the type name
+            if isinstance(proto.PT_TYPES[pt_type], tuple):
+                name = proto.PT_TYPES[pt_type][1]
+            else:
+                name = codec.name
+
+            name = "%s.%s" % (proto.__name__.split(".")[-1], name)
+
+            row = {"message": name}
+
+            for path, func in paths(proto, pt_type):
+                row[path] = measure(func, frames, iterations)
+
+            results.append(row)
+
+    return results
+
+
+def median(func, frames, iterations, reference):
+    """Return the median of REPEAT measures, both relative to the reference
+    measure (interleaved with the function ones) and in ns."""
+
+    gc.disable()
+
+    try:
+        samples = []
+        for _ in range(REPEAT):
+            base = reference()
+            value = measure(func, frames, iterations)
+            samples.append((value / base, value))
+    finally:
+        gc.enable()
+
+    return sorted(samples)[len(samples) // 2]
+
+
+def allocated(func, frames):
+    """Return the average number of bytes allocated to process a frame."""
+
+    total = 0
+
+    tracemalloc.start()
+
+    for frame in frames:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        func(frame)
+        total += tracemalloc.get_traced_memory()[1] - current
+
+    tracemalloc.stop()
+
+    return total // len(frames)
+
+
+def calibration(iterations):
+    """Return the reference measure (the time needed to parse a header)."""
+
+    rng = random.Random(42)
+    frames = [lvapp.HEADER.build(sample(lvapp.HEADER, rng))
+              for _ in range(SAMPLES)]
+
+    return lambda: measure(lvapp.HEADER_CODEC.parse, frames, iterations)
+
+
+def run_suite(iterations):
+    """Run the microbenchmark of every Struct and return the results."""
+
+    rng = random.Random(42)
+    reference = calibration(iterations)
+    results = {}
+    seen = set()
+
+    for name, fmt in all_structs():
+
+        # The same Struct can be exported by more than one module
+        if id(fmt) in seen:
+            continue
+
+        seen.add(id(fmt))
+
+        codec = compile_struct(fmt)
+
+        frames = [codec.build(sample(fmt, rng)) for _ in range(SAMPLES)]
+        values = [codec.parse(frame) for frame in frames]
+
+        parse_rel, parse = median(codec.parse, frames, iterations, reference)
+        build_rel, build = median(codec.build, values, iterations, reference)
+
+        name = ".".join(name.split(".")[-2:])
+
+        results[name] = {"parse": round(parse),
+                         "build": round(build),
+                         "parse_rel": round(parse_rel, 3),
+                         "build_rel": round(build_rel, 3),
+                         "alloc": allocated(codec.parse, frames)}
+
+    return results
+
+
+def compare(baseline, results, threshold):
+    """Compare the results against the baseline, return the regressions."""
+
+    regressions = []
+
+    print("%-52s %10s %10s %10s %9s" %
+          ("message", "parse", "build", "alloc", "status"))
+
+    for name, row in sorted(results.items()):
+
+        base = baseline.get(name)
+        status = "new"
+
+        if base:
+
+            status = "ok"
+
+            for key in ("parse_rel", "build_rel", "alloc"):
+
+                if row[key] <= base[key] * (1 + threshold / 100):
+                    continue
+
+                # Timings are compared relative to the reference measure,
+                # convert the difference back to ns with the current one
+                if key != "alloc":
+                    timing = row[key[:-len("_rel")]]
+                    if (row[key] - base[key]) * timing / row[key] < MIN_DELTA:
+                        continue
+
+                regressions.append((name, key, base[key], row[key]))
+                status = "REGRESSED"
+
+        print("%-52s %7.0f ns %7.0f ns %8u B %9s" %
+              (name, row["parse"], row["build"], row["alloc"], status))
+
+    for name, key, old, new in regressions:
+        print("%s: %s regressed from %.2f to %.2f (threshold %u%%)" %
+              (name, key, old, new, threshold), file=sys.stderr)
+
+    return regressions
+
+
+def main():
+    """Parse the command line and print the results."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--iterations", type=int, default=200,
+                        help="Number of iterations (default: 200)")
+    parser.add_argument("--check", action="store_true",
+                        help="Compare all the messages against the baseline")
+    parser.add_argument("--save", action="store_true",
+                        help="Save the results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="Baseline file (default: %s)" % BASELINE)
+    parser.add_argument("--threshold", type=int, default=THRESHOLD,
+                        help="Regression threshold in percent "
+                             "(default: %u)" % THRESHOLD)
+    args = parser.parse_args()
+
+    if args.check or args.save:
+
+        results = run_suite(args.iterations)
+
+        if args.save:
+            with open(args.baseline, "w") as baseline:
+                json.dump(results, baseline, indent=2, sort_keys=True)
+                baseline.write("\n")
+            print("Baseline saved to %s" % args.baseline)
+
+        if args.check:
+            with open(args.baseline) as baseline:
+                baseline = json.load(baseline)
+            if compare(baseline, results, args.threshold):
+                sys.exit(1)
+
+        return
+
+    print("%-42s %12s %12s %12s %8s" %
+          ("message", "construct", "two-pass", "single-pass", "speedup"))
+
+    for row in run(args.iterations):
+        print("%-42s %9.0f ns %9.0f ns %9.0f ns %7.1fx" %
+              (row["message"], row["construct"], row["two-pass"],
+               row["single-pass"], row["construct"] / row["single-pass"]))
+
+
+if __name__ == '__main__':
+    main()
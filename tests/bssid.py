@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Project lookup by BSSID unit tests."""
+
+import unittest
+
+from types import SimpleNamespace
+
+from empower_core.etheraddress import EtherAddress
+
+from empower.managers.projectsmanager.projectsmanager import \
+    EmpowerProjectsManager, mac_to_int
+from empower.managers.projectsmanager.project import T_BSSID_TYPE_SHARED, \
+    T_BSSID_TYPE_UNIQUE
+
+STA = EtherAddress("60:F4:45:D0:3B:FC")
+
+# The unique BSSID of STA and the shared BSSID have the same prefix
+BSSID = EtherAddress("52:31:3E:D0:3B:FC")
+
+
+def make_project(name, bssid_type, ssid, vaps=()):
+    """Return a project-like object."""
+
+    return SimpleNamespace(
+        name=name,
+        wifi_props=SimpleNamespace(bssid_type=bssid_type, ssid=ssid),
+        vaps={vap: None for vap in vaps})
+
+
+class TestBSSID(unittest.TestCase):
+    """Project lookup by BSSID unit tests."""
+
+    def lookup(self, projects, ssid=None):
+        """Return the name of the project serving BSSID to STA."""
+
+        manager = SimpleNamespace(
+            bssid_prefixes={mac_to_int(BSSID) >> 24: projects})
+
+        project = EmpowerProjectsManager.load_project_by_bssid(
+            manager, BSSID, STA, ssid)
+
+        return project.name if project else None
+
+    def test_order(self):
+        """Check that unique BSSIDs are checked before shared ones."""
+
+        shared = make_project("shared", T_BSSID_TYPE_SHARED, "b", [BSSID])
+        unique = make_project("unique", T_BSSID_TYPE_UNIQUE, "a")
+
+        self.assertEqual(self.lookup([shared, unique]), "unique")
+        self.assertEqual(self.lookup([shared]), "shared")
+        self.assertEqual(self.lookup([make_project(
+            "other", T_BSSID_TYPE_SHARED, "b")]), None)
+
+    def test_ssid(self):
+        """Check that only projects with the SSID are matched."""
+
+        shared = make_project("shared", T_BSSID_TYPE_SHARED, "b", [BSSID])
+        unique = make_project("unique", T_BSSID_TYPE_UNIQUE, "a")
+
+        self.assertEqual(self.lookup([unique, shared], "a"), "unique")
+        self.assertEqual(self.lookup([unique, shared], "b"), "shared")
+        self.assertEqual(self.lookup([unique, shared], "c"), None)
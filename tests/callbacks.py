@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Callback registry unit tests."""
+
+import unittest
+
+from types import SimpleNamespace
+
+from construct import Container
+
+from empower_core.etheraddress import EtherAddress
+
+import empower.managers.ranmanager.lvapp as lvapp
+
+from empower.managers.ranmanager.callbacks import CallbackRegistry
+
+
+class App:
+    """A simple app."""
+
+    def __init__(self):
+        self.received = []
+
+    def handle_hello(self, msg, *_):
+        """Handle hello messages."""
+
+        self.received.append(msg)
+
+    def handle_unknown(self, msg, *_):
+        """Handle messages of an unknown type."""
+
+        self.received.append(msg)
+
+
+class TestCallbacks(unittest.TestCase):
+    """Callback registry unit tests."""
+
+    def setUp(self):
+        """Create a registry with two packet types."""
+
+        self.registry = CallbackRegistry()
+        self.registry.add_type(1, "hello")
+        self.registry.add_type(2, "caps")
+
+    def test_register_app(self):
+        """Check that only the handlers defined by the app are registered."""
+
+        apps = [App() for _ in range(3)]
+
+        for app in apps:
+            self.registry.register_app(app, "handle_")
+
+        self.assertEqual(self.registry.manifest(apps[0], "handle_"),
+                         ((1, "handle_hello"),))
+
+        callbacks = self.registry.callbacks(1)
+
+        self.assertEqual(callbacks, tuple(app.handle_hello for app in apps))
+        self.assertEqual(self.registry.callbacks(2), ())
+
+        self.registry.unregister_app(apps[1], "handle_")
+
+        self.assertEqual(self.registry.callbacks(1),
+                         (apps[0].handle_hello, apps[2].handle_hello))
+
+        # snapshots are immutable
+        self.assertEqual(len(callbacks), 3)
+
+    def test_new_type(self):
+        """Check that manifests are refreshed when types are added."""
+
+        app = App()
+
+        self.assertEqual(len(self.registry.manifest(app, "handle_")), 1)
+
+        self.registry.add_type(3, "unknown")
+        self.registry.register_app(app, "handle_")
+
+        self.assertEqual(self.registry.callbacks(3), (app.handle_unknown,))
+
+    def test_shared_name(self):
+        """Check that handlers are registered on every type with the name."""
+
+        app = App()
+
+        self.registry.add_type(3, "hello")
+        self.registry.register_app(app, "handle_")
+
+        self.assertEqual(self.registry.callbacks(1), (app.handle_hello,))
+        self.assertEqual(self.registry.callbacks(3), (app.handle_hello,))
+
+        # Renamed types are no longer matched by the old name
+        self.registry.add_type(3, "caps")
+        self.assertEqual(self.registry.names["hello"], {1: None})
+
+    def test_instance_handler(self):
+        """Check that handlers set on the instance are registered."""
+
+        app = App()
+        app.handle_caps = app.received.append
+
+        self.registry.register_app(app, "handle_")
+        self.assertEqual(self.registry.callbacks(2), (app.handle_caps,))
+
+        self.registry.unregister_app(app, "handle_")
+        self.assertEqual(self.registry.callbacks(2), ())
+
+        # The class manifest is not affected
+        self.assertEqual(self.registry.manifest(App(), "handle_"),
+                         ((1, "handle_hello"),))
+
+    def test_version(self):
+        """Check that the version changes only when the registry changes."""
+
+        version = self.registry.version
+
+        self.registry.add_type(1, "hello")
+        self.assertEqual(self.registry.version, version)
+
+        self.registry.add(1, print)
+        self.assertNotEqual(self.registry.version, version)
+
+    def test_subscriptions(self):
+        """Check that items are delivered only to matching subscribers."""
+
+        received = []
+
+        def demux(msg, device):
+            return [((device, item), item) for item in msg]
+
+        def callback(item, device):
+            received.append((device, item))
+
+        self.assertRaises(KeyError, self.registry.subscribe, 1, "a", callback)
+
+        self.registry.set_demux(1, demux)
+        self.registry.subscribe(1, ("dev1", 2), callback)
+
+        self.registry.publish(1, [1, 2, 3], "dev1")
+        self.registry.publish(1, [1, 2, 3], "dev2")
+
+        self.assertEqual(received, [("dev1", 2)])
+
+        self.registry.unsubscribe(1, ("dev1", 2), callback)
+        self.registry.publish(1, [2], "dev1")
+
+        self.assertEqual(received, [("dev1", 2)])
+        self.assertEqual(self.registry.subscribers[1], {})
+        self.assertRaises(ValueError, self.registry.unsubscribe, 1,
+                          ("dev1", 2), callback)
+
+    def test_demux_sta(self):
+        """Check that per-station messages are keyed by (device, sta)."""
+
+        received = []
+
+        wtp = SimpleNamespace(addr=EtherAddress("00:0D:B9:00:00:01"))
+        sta = EtherAddress("60:F4:45:D0:3B:FC")
+
+        self.registry.set_demux(2, lvapp.demux_sta)
+        self.registry.subscribe(2, (wtp.addr, sta),
+                                lambda msg, _: received.append(msg))
+
+        msg = Container(sta=sta.to_raw())
+        other = Container(sta=EtherAddress("60:F4:45:D0:3B:FD").to_raw())
+
+        self.registry.publish(2, msg, wtp)
+        self.registry.publish(2, other, wtp)
+
+        self.assertEqual(received, [msg])
+
+    def test_invalid(self):
+        """Check invalid add/remove operations."""
+
+        self.assertRaises(KeyError, self.registry.add, 3, print)
+        self.assertRaises(ValueError, self.registry.remove, 1, print)
+
+
+if __name__ == '__main__':
+    unittest.main()
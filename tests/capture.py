@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Southbound capture and replay unit tests."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import tornado.ioloop
+
+from empower.managers.ranmanager.capture import CaptureWriter, \
+    CaptureReader, ReplayStream, Replay, RECORD_OPEN, RECORD_FRAME, \
+    RECORD_CLOSE
+
+DEVICE = b"\x02\x00\x00\x00\x00\x01"
+
+
+def make_frame(payload):
+    """Return a frame with DEVICE at offset 2."""
+
+    return b"\x01\x02" + DEVICE + payload
+
+
+class DummyManager:
+    """Record the streams handed over by a replay."""
+
+    def __init__(self):
+
+        self.streams = []
+        self.received = []
+
+    def handle_stream(self, stream, address):
+        """Start reading from the stream."""
+
+        self.streams.append((stream, address))
+        self.read(stream)
+
+    def read(self, stream):
+        """Read from the stream until it is closed."""
+
+        buf = bytearray(4)
+        future = stream.read_into(buf, partial=True)
+
+        def on_read(future):
+            if future.error:
+                return
+            self.received.append(bytes(buf[:future.result()]))
+            stream.write(b"ack")
+            self.read(stream)
+
+        future.add_done_callback(on_read)
+
+
+class TestCapture(unittest.TestCase):
+    """Southbound capture and replay unit tests."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "test.cap")
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+
+        shutil.rmtree(self.tmp)
+
+    def write_capture(self):
+        """Write a capture with one connection and two frames."""
+
+        writer = CaptureWriter(self.path, device_offset=2)
+
+        conn_id = writer.open(("127.0.0.1", 40000))
+        writer.frame(conn_id, memoryview(make_frame(b"abc")))
+        writer.frame(conn_id, make_frame(b"defgh"))
+        writer.close(conn_id)
+        writer.shutdown()
+
+        return writer
+
+    def test_roundtrip(self):
+        """Check that records are read back in order."""
+
+        writer = self.write_capture()
+        self.assertEqual(writer.to_dict()["frames"], 2)
+
+        reader = CaptureReader(self.path)
+        records = list(reader)
+        reader.close()
+
+        self.assertEqual([rec.kind for rec in records],
+                         [RECORD_OPEN, RECORD_FRAME, RECORD_FRAME,
+                          RECORD_CLOSE])
+        self.assertEqual(records[0].payload, b"127.0.0.1:40000")
+        self.assertEqual(records[1].payload, make_frame(b"abc"))
+        self.assertEqual(records[1].device, DEVICE)
+        self.assertEqual(records[2].payload, make_frame(b"defgh"))
+        self.assertTrue(records[0].ts <= records[3].ts)
+
+        # Writes after shutdown are ignored
+        writer.frame(1, make_frame(b"x"))
+
+    def test_truncated(self):
+        """Check that a truncated record is skipped."""
+
+        self.write_capture()
+
+        size = os.path.getsize(self.path)
+
+        with open(self.path, "r+b") as capture:
+            capture.truncate(size - 2)
+
+        reader = CaptureReader(self.path)
+        kinds = [rec.kind for rec in reader]
+        reader.close()
+
+        self.assertEqual(kinds, [RECORD_OPEN, RECORD_FRAME, RECORD_FRAME])
+
+        with open(self.path, "wb") as capture:
+            capture.write(b"garbage!")
+
+        self.assertRaises(ValueError, CaptureReader, self.path)
+
+    def test_stream(self):
+        """Check that fed data is split and coalesced like a socket."""
+
+        manager = DummyManager()
+        stream = ReplayStream(("127.0.0.1", 40000))
+
+        stream.feed(b"ab")
+        manager.handle_stream(stream, ("127.0.0.1", 40000))
+        stream.feed(b"cdefgh")
+
+        self.assertEqual(manager.received, [b"ab", b"cdef", b"gh"])
+        self.assertEqual(stream.tx_messages, 3)
+
+        stream.close()
+        stream.feed(b"ij")
+
+        self.assertTrue(stream.closed())
+        self.assertEqual(manager.received, [b"ab", b"cdef", b"gh"])
+
+    def test_replay(self):
+        """Check that a capture is fed to the manager."""
+
+        self.write_capture()
+
+        manager = DummyManager()
+        replay = Replay(manager, self.path)
+
+        result = tornado.ioloop.IOLoop.current().run_sync(replay.run)
+
+        self.assertEqual(result["connections"], 1)
+        self.assertEqual(result["open_connections"], 0)
+        self.assertEqual(result["frames"], 2)
+        self.assertEqual(manager.streams[0][1], ("127.0.0.1", 40000))
+        self.assertEqual(b"".join(manager.received),
+                         make_frame(b"abc") + make_frame(b"defgh"))
+        self.assertEqual(result["tx_messages"], len(manager.received))
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Codecs unit tests."""
+
+import random
+import struct
+import importlib
+import unittest
+
+from construct import Struct, FormatField, Bytes, Array, GreedyRange, \
+    Transformed, Renamed, Padded, BitsInteger, Flag, Container, Int8ub, \
+    Int24ub
+
+import empower.managers.ranmanager.lvapp as lvapp
+import empower.managers.ranmanager.vbsp as vbsp
+
+from empower.managers.ranmanager.codec import compile_struct, StructCodec, \
+    ConstructCodec, CodecError
+
+# Modules defining southbound messages
+MODULES = [
+    "empower.managers.ranmanager.lvapp",
+    "empower.managers.ranmanager.vbsp",
+    "empower.apps.lvapbincounter.lvapbincounter",
+    "empower.apps.txpbincounter.txpbincounter",
+    "empower.apps.wifircstats.wifircstats",
+    "empower.apps.wifislicestats.wifislicestats",
+    "empower.apps.uemeasurements.uemeasurements",
+    "empower.workers.wifichannelstats.wifichannelstats",
+    "empower.workers.wifichannelqualitymap.wifichannelqualitymap",
+    "empower.workers.macprbutilization.macprbutilization",
+]
+
+# Number of random samples for each message
+SAMPLES = 25
+
+# Max number of elements in arrays and max length of variable byte strings
+MAX_COUNT = 16
+
+
+def all_structs():
+    """Return all the Structs defined in MODULES."""
+
+    structs = []
+
+    for name in MODULES:
+        module = importlib.import_module(name)
+        for attr in sorted(dir(module)):
+            value = getattr(module, attr)
+            if isinstance(value, Struct):
+                structs.append(("%s.%s" % (name, attr), value))
+
+    return structs
+
+
+def normalize(value):
+    """Convert Containers and records into plain dicts."""
+
+    if hasattr(value, "keys"):
+        return {k: normalize(value[k]) for k in value.keys()
+                if not k.startswith("_")}
+
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+
+    return value
+
+
+def evaluate(expr, ctx, rng):
+    """Evaluate expr tweaking the integers in ctx to keep it small."""
+
+    def distance(value):
+        if 0 <= value <= MAX_COUNT:
+            return 0
+        return min(abs(value), abs(value - MAX_COUNT))
+
+    if not callable(expr):
+        return expr
+
+    value = expr(ctx)
+
+    for key in reversed(list(ctx.keys())):
+
+        if not distance(value):
+            break
+
+        if not isinstance(ctx[key], int) or isinstance(ctx[key], bool):
+            continue
+
+        best = (distance(value), ctx[key])
+        candidates = list(range(MAX_COUNT + 8))
+        rng.shuffle(candidates)
+
+        for candidate in candidates:
+            ctx[key] = candidate
+            if distance(expr(ctx)) < best[0]:
+                best = (distance(expr(ctx)), candidate)
+            if not best[0]:
+                break
+
+        ctx[key] = best[1]
+        value = expr(ctx)
+
+    return value
+
+
+def sample(fmt, rng, ctx=None):
+    """Generate a random value for the specified construct."""
+
+    while isinstance(fmt, Renamed):
+        fmt = fmt.subcon
+
+    if isinstance(fmt, Struct):
+        out = Container()
+        for subcon in fmt.subcons:
+            out[subcon.name] = sample(subcon, rng, out)
+        return out
+
+    if isinstance(fmt, FormatField):
+        bits = struct.calcsize(fmt.fmtstr) * 8
+        if fmt.fmtstr[-1].islower():
+            return rng.randint(-(1 << (bits - 1)), (1 << (bits - 1)) - 1)
+        return rng.randint(0, (1 << bits) - 1)
+
+    if isinstance(fmt, Bytes):
+        length = evaluate(fmt.length, ctx, rng)
+        return bytes(rng.getrandbits(8) for _ in range(length))
+
+    if isinstance(fmt, Transformed):
+        return sample(fmt.subcon, rng, ctx)
+
+    if isinstance(fmt, type(Flag)):
+        return rng.choice([True, False])
+
+    if isinstance(fmt, BitsInteger):
+        if fmt.signed:
+            return rng.randint(-(1 << (fmt.length - 1)),
+                               (1 << (fmt.length - 1)) - 1)
+        return rng.randint(0, (1 << fmt.length) - 1)
+
+    if isinstance(fmt, Padded):
+        return None
+
+    if isinstance(fmt, Array):
+        count = evaluate(fmt.count, ctx, rng)
+        return [sample(fmt.subcon, rng, ctx) for _ in range(count)]
+
+    if isinstance(fmt, GreedyRange):
+        return [sample(fmt.subcon, rng, ctx) for _ in range(rng.randint(0, 3))]
+
+    raise ValueError("Unsupported construct %s" % fmt)
+
+
+class TestCodec(unittest.TestCase):
+    """Codecs unit tests."""
+
+    def setUp(self):
+        """Collect messages."""
+
+        self.rng = random.Random(42)
+        self.structs = all_structs()
+
+    def samples(self, fmt):
+        """Return a list of serialized random messages."""
+
+        return [fmt.build(sample(fmt, self.rng)) for _ in range(SAMPLES)]
+
+    def test_compile(self):
+        """Check that all messages are compiled."""
+
+        self.assertTrue(self.structs)
+
+        for name, fmt in self.structs:
+            codec = compile_struct(fmt)
+            self.assertIsInstance(codec, StructCodec, name)
+            self.assertIs(codec, compile_struct(fmt), name)
+            self.assertEqual(codec.name, fmt.name, name)
+
+    def test_parse(self):
+        """Check that codecs and construct parse messages in the same way."""
+
+        for name, fmt in self.structs:
+
+            codec = compile_struct(fmt)
+
+            for data in self.samples(fmt):
+
+                expected = normalize(fmt.parse(data))
+
+                self.assertEqual(normalize(codec.parse(data)), expected, name)
+                self.assertEqual(normalize(codec.parse(memoryview(data))),
+                                 expected, name)
+
+    def test_build(self):
+        """Check that codecs and construct build messages in the same way."""
+
+        for name, fmt in self.structs:
+
+            codec = compile_struct(fmt)
+
+            for _ in range(SAMPLES):
+
+                msg = sample(fmt, self.rng)
+                data = fmt.build(msg)
+
+                self.assertEqual(codec.build(msg), data, name)
+                self.assertEqual(codec.build(fmt.parse(data)), data, name)
+                self.assertEqual(codec.build(codec.parse(data)), data, name)
+
+    def test_parse_body(self):
+        """Check single pass decoding of the header and the body."""
+
+        for proto in (lvapp, vbsp):
+
+            for pt_type, codec in proto.CODECS.items():
+
+                fmt = codec.fmt
+                name = "%s %s" % (proto.__name__, pt_type)
+
+                self.assertIs(codec.header, proto.HEADER_CODEC, name)
+
+                for data in self.samples(fmt):
+
+                    hdr = proto.HEADER_CODEC.parse(data)
+                    msg = codec.parse_body(data, hdr)
+
+                    self.assertEqual(normalize(msg),
+                                     normalize(fmt.parse(data)), name)
+
+    def test_truncated(self):
+        """Check that truncated messages are handled like construct."""
+
+        for name, fmt in self.structs:
+
+            codec = compile_struct(fmt)
+
+            for data in self.samples(fmt):
+
+                data = data[:self.rng.randint(0, len(data))]
+
+                try:
+                    expected = normalize(fmt.parse(data))
+                except Exception:
+                    self.assertRaises(CodecError, codec.parse, data)
+                    continue
+
+                self.assertEqual(normalize(codec.parse(data)), expected, name)
+
+    def test_sizeof(self):
+        """Check the size of fixed length messages."""
+
+        for name, fmt in self.structs:
+
+            codec = compile_struct(fmt)
+
+            try:
+                size = fmt.sizeof()
+            except Exception:
+                self.assertRaises(CodecError, codec.sizeof)
+                continue
+
+            self.assertEqual(codec.sizeof(), size, name)
+
+    def test_invalid_build(self):
+        """Check that invalid values are rejected."""
+
+        fmt = Struct("a" / Int8ub, "b" / Bytes(2))
+        codec = compile_struct(fmt)
+
+        self.assertEqual(codec.build(dict(a=1, b=2)), b"\x01\x00\x02")
+        self.assertRaises(CodecError, codec.build, dict(a=256, b=b"xx"))
+        self.assertRaises(CodecError, codec.build, dict(a=1, b=b"xxx"))
+        self.assertRaises(KeyError, codec.build, dict(a=1))
+
+    def test_fallback(self):
+        """Check that unsupported Structs fall back to construct."""
+
+        fmt = Struct("a" / Int8ub, "b" / Int24ub)
+        codec = compile_struct(fmt)
+
+        self.assertIsInstance(codec, ConstructCodec)
+        self.assertEqual(codec.parse(b"\x01\x00\x00\x02").b, 2)
+        self.assertEqual(codec.build(dict(a=1, b=2)), b"\x01\x00\x00\x02")
+
+    def test_record(self):
+        """Check that records behave like Containers."""
+
+        fmt = Struct("a" / Int8ub, "b" / Bytes(2))
+        msg = compile_struct(fmt).parse(b"\x01ab")
+
+        self.assertEqual(msg.a, 1)
+        self.assertEqual(msg['b'], b"ab")
+        self.assertEqual(dict(msg), {"a": 1, "b": b"ab"})
+        self.assertEqual(msg, fmt.parse(b"\x01ab"))
+        self.assertIn("a", msg)
+        self.assertNotIn("_io", msg)
+        self.assertIsNone(msg.get("c"))
+        self.assertRaises(KeyError, msg.__getitem__, "c")
+
+        msg.a += 1
+        msg['b'] = b"cd"
+
+        self.assertEqual(msg.items(), [("a", 2), ("b", b"cd")])
+
+    def test_tlv_index(self):
+        """Check that indexed TLVs are decoded like construct."""
+
+        tlvs = []
+
+        for pci in range(3):
+            value = vbsp.CAPABILITIES_SERVICE_CELL.build(
+                dict(pci=pci, dl_earfcn=1, ul_earfcn=2, n_prbs=25))
+            tlvs.append(dict(type=vbsp.PT_CAPABILITIES_SERVICE_CELL,
+                             length=4 + len(value), value=value))
+
+        # an unknown TLV breaking the run and a malformed TLV
+        tlvs.insert(1, dict(type=0xFF, length=6, value=b"xy"))
+        tlvs.append(dict(type=vbsp.PT_HELLO_SERVICE_PERIOD, length=6,
+                         value=b"xy"))
+
+        msg = sample(vbsp.HEADER, self.rng)
+        msg.tlvs = tlvs
+
+        data = vbsp.PACKET.build(msg)
+        codec = vbsp.CODECS[vbsp.PT_CAPABILITIES_SERVICE]
+        msg = codec.parse(data)
+
+        self.assertEqual(len(msg.tlvs), 5)
+        self.assertEqual(msg.tlvs, vbsp.PACKET.parse(data).tlvs)
+        self.assertEqual(msg.tlvs.unknown(), {0xFF})
+
+        cells = msg.tlvs.decode(vbsp.PT_CAPABILITIES_SERVICE_CELL)
+
+        self.assertEqual([cell.pci for cell in cells], [0, 1, 2])
+        self.assertEqual(cells[0], vbsp.CAPABILITIES_SERVICE_CELL.parse(
+            tlvs[0]["value"]))
+        self.assertIs(msg.tlvs.decode(vbsp.PT_CAPABILITIES_SERVICE_CELL),
+                      cells)
+
+        self.assertRaises(CodecError, msg.tlvs.decode,
+                          vbsp.PT_HELLO_SERVICE_PERIOD)
+        self.assertRaises(KeyError, msg.tlvs.decode, 0xFF)
+
+        # truncated TLVs are ignored
+        msg = codec.parse(data[:-2])
+
+        self.assertEqual(len(msg.tlvs), 4)
+        self.assertEqual(msg.tlvs, vbsp.PACKET.parse(data[:-2]).tlvs)
+
+
+if __name__ == '__main__':
+    unittest.main()
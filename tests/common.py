@@ -64,8 +64,12 @@ class BaseTest(unittest.TestCase):
         req = requests.put(url=URL % params, data=json.dumps(data))
         self.assertEqual(req.status_code, result, req.text)
 
-    def delete(self, params, result):
+    def delete(self, params, result, data=None):
         """REST delete method."""
 
-        req = requests.delete(url=URL % params)
+        if data is not None:
+            data["version"] = "1.0"
+            data = json.dumps(data)
+
+        req = requests.delete(url=URL % params, data=data)
         self.assertEqual(req.status_code, result, req.text)
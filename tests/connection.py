@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""RAN connection unit tests."""
+
+import unittest
+
+from types import SimpleNamespace
+
+import tornado.gen
+import tornado.ioloop
+
+from tornado.concurrent import Future
+from tornado.iostream import StreamClosedError
+
+import empower.managers.ranmanager.lvapp as lvapp
+
+from empower.managers.ranmanager.ranconnection import RANConnection
+
+
+class RecordingStream:
+    """A stand-in for IOStream recording the writes of the runtime."""
+
+    def __init__(self):
+
+        self.socket = None
+        self.writes = []
+
+        self.is_closed = False
+        self.close_callback = None
+
+    def set_nodelay(self, value):
+        """Nothing to do."""
+
+    def set_close_callback(self, callback):
+        """Set the callback invoked when the stream is closed."""
+
+        self.close_callback = callback
+
+    def read_into(self, buf, partial=False):
+        """Return a read that never completes."""
+
+        return Future()
+
+    def write(self, data):
+        """Record the data."""
+
+        if self.is_closed:
+            raise StreamClosedError()
+
+        self.writes.append(bytes(data))
+
+    def closed(self):
+        """Return True if the stream is closed."""
+
+        return self.is_closed
+
+    def close(self):
+        """Close the stream."""
+
+        self.is_closed = True
+
+        if self.close_callback:
+            self.close_callback()
+
+
+class DummyConnection(RANConnection):
+    """A connection not bound to any device."""
+
+    def on_disconnect(self):
+        """Ignore the disconnection."""
+
+
+class TestConnection(unittest.TestCase):
+    """RAN connection unit tests."""
+
+    def run_sync(self, func):
+        """Run func in a new IOLoop with a connection."""
+
+        ioloop = tornado.ioloop.IOLoop()
+
+        stream = RecordingStream()
+        manager = SimpleNamespace(proto=lvapp, capture_writer=None)
+
+        async def run():
+            await func(DummyConnection(stream, manager), stream)
+
+        try:
+            ioloop.run_sync(run)
+        finally:
+            ioloop.close()
+
+    def test_coalesce(self):
+        """Check that messages are sent with one write per iteration."""
+
+        async def run(connection, stream):
+
+            connection.write(b"a")
+            connection.write(b"b")
+            connection.write(b"c")
+
+            self.assertEqual(stream.writes, [])
+
+            await tornado.gen.sleep(0)
+
+            connection.write(b"d")
+
+            await tornado.gen.sleep(0)
+
+            self.assertEqual(stream.writes, [b"abc", b"d"])
+
+        self.run_sync(run)
+
+    def test_batch(self):
+        """Check that batches are flushed when the outermost block exits."""
+
+        async def run(connection, stream):
+
+            with connection.batch():
+
+                connection.write(b"a")
+
+                with connection.batch():
+                    connection.write(b"b")
+
+                # Nested blocks do not flush, nor does the IOLoop
+                await tornado.gen.sleep(0)
+                self.assertEqual(stream.writes, [])
+
+                connection.write(b"c")
+
+            self.assertEqual(stream.writes, [b"abc"])
+
+            await tornado.gen.sleep(0)
+
+            self.assertEqual(stream.writes, [b"abc"])
+
+        self.run_sync(run)
+
+    def test_closed(self):
+        """Check that queued messages are dropped if the stream is closed."""
+
+        async def run(connection, stream):
+
+            connection.write(b"a")
+            stream.close()
+
+            await tornado.gen.sleep(0)
+
+            self.assertEqual(stream.writes, [])
+            self.assertEqual(connection.out_queue, [])
+
+        self.run_sync(run)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Device lookup while loading unit tests."""
+
+import uuid
+import unittest
+
+from types import SimpleNamespace
+
+import tornado.gen
+import tornado.ioloop
+
+from empower_core.etheraddress import EtherAddress
+
+from empower.managers.persistence import resolved
+from empower.managers.ranmanager.lvapp.lvappmanager import launch
+
+WTP1 = EtherAddress("00:0D:B9:00:00:01")
+WTP2 = EtherAddress("00:0D:B9:00:00:02")
+WTP3 = EtherAddress("00:0D:B9:00:00:03")
+
+
+class QuerySet:
+    """A pymodm-like queryset over the stored devices."""
+
+    def __init__(self, docs):
+
+        self.docs = docs
+        self.queries = []
+
+    def raw(self, query):
+        """Filter the documents by _id (if specified)."""
+
+        self.queries.append(query)
+
+        if "_id" not in query:
+            return DummyQuery(self.docs)
+
+        return DummyQuery([doc for doc in self.docs
+                           if doc["_id"] == query["_id"]])
+
+
+class DummyQuery(list):
+    """The result of a query."""
+
+    def only(self, *fields):
+        """Project the documents."""
+
+        return DummyQuery([{key: value for key, value in doc.items()
+                            if key in fields} for doc in self])
+
+    def values(self):
+        """Return the documents."""
+
+        return self
+
+
+class DummyDevice:
+    """A pymodm-like device model."""
+
+    pk_field = SimpleNamespace(to_python=lambda value: value,
+                               to_mongo=lambda value: value)
+
+    fields = [SimpleNamespace(attname="addr", mongo_name="_id"),
+              SimpleNamespace(attname="desc", mongo_name="desc")]
+
+    _mongometa = SimpleNamespace(pk=pk_field,
+                                 get_fields=lambda: DummyDevice.fields)
+
+    objects = None
+
+    HYDRATE_FIELDS = ("addr",)
+
+    def __init__(self, addr, desc=None):
+
+        self.addr = addr
+        self.desc = desc
+        self.connection = None
+
+    @classmethod
+    def from_document(cls, doc):
+        """Build the device."""
+
+        return cls(doc["_id"], doc.get("desc"))
+
+
+class DummyPersistence:
+    """Perform the reads in place and record the deletes."""
+
+    def __init__(self):
+        self.deleted = []
+
+    @classmethod
+    def submit(cls, operation, func, *args):
+        """Perform the operation."""
+
+        return resolved(func(*args))
+
+    def delete(self, doc):
+        """Record the delete."""
+
+        self.deleted.append(doc.addr)
+
+        return resolved()
+
+
+class TestDevices(unittest.TestCase):
+    """Device lookup while loading unit tests."""
+
+    def setUp(self):
+        """Create a manager with WTP1 and WTP2 stored but not read."""
+
+        DummyDevice.objects = QuerySet([{"_id": WTP1, "desc": "WTP 1"},
+                                        {"_id": WTP2, "desc": "WTP 2"}])
+
+        self.manager = launch(context=None, service_id=uuid.uuid4())
+        self.manager.device_type = DummyDevice
+        self.manager.persistence = DummyPersistence()
+        self.manager.hydrate_fields = ["_id"]
+        self.manager.loading = True
+
+    def run_callbacks(self, func, *args):
+        """Call func and run the callbacks of the reads in a new IOLoop."""
+
+        async def run():
+            func(*args)
+            await tornado.gen.sleep(0)
+
+        ioloop = tornado.ioloop.IOLoop()
+
+        try:
+            ioloop.run_sync(run)
+        finally:
+            ioloop.close()
+
+    def test_get_device(self):
+        """Check that devices not read yet are not read by the lookups."""
+
+        self.assertEqual(self.manager.get_device(WTP1), None)
+
+        self.manager.add_documents([{"_id": WTP1}])
+
+        device = self.manager.get_device(WTP1)
+
+        self.assertEqual(device.addr, WTP1)
+        self.assertEqual(self.manager.get_device(WTP1), device)
+        self.assertEqual(self.manager.get_device(WTP3), None)
+
+        self.assertEqual(set(self.manager.devices), {WTP1})
+        self.assertEqual(DummyDevice.objects.queries, [])
+
+    def test_get_devices(self):
+        """Check that listings return the devices read so far."""
+
+        self.assertEqual(self.manager.get_devices(), {})
+
+        self.manager.add_documents([{"_id": WTP1}])
+
+        self.assertEqual(set(self.manager.get_devices()), {WTP1})
+        self.assertEqual(self.manager.unhydrated, {})
+        self.assertEqual(DummyDevice.objects.queries, [])
+
+    def test_read_device(self):
+        """Check that devices are read in the background."""
+
+        self.run_callbacks(self.manager.read_device, WTP1)
+        self.run_callbacks(self.manager.read_device, WTP3)
+
+        self.assertEqual(DummyDevice.objects.queries,
+                         [{"_id": WTP1}, {"_id": WTP3}])
+        self.assertEqual(self.manager.reading, set())
+        self.assertEqual(set(self.manager.get_devices()), {WTP1})
+
+        # Only the hydrate fields are read
+        self.assertEqual(self.manager.get_device(WTP1).desc, None)
+
+    def test_complete_device(self):
+        """Check that the other fields are read on the first hello."""
+
+        self.manager.add_documents([{"_id": WTP1}])
+
+        device = self.manager.get_device(WTP1)
+
+        self.assertEqual(self.manager.partial, {WTP1})
+
+        self.run_callbacks(self.manager.complete_device, device)
+
+        self.assertEqual(device.desc, "WTP 1")
+        self.assertEqual(self.manager.partial, set())
+
+        # Once complete, the database is not read anymore
+        self.run_callbacks(self.manager.complete_device, device)
+        self.assertEqual(len(DummyDevice.objects.queries), 1)
+
+    def test_remove(self):
+        """Check that devices removed while loading are not read again."""
+
+        self.manager.add_documents([{"_id": WTP1}])
+        self.manager.remove(WTP1)
+
+        self.assertEqual(self.manager.persistence.deleted, [WTP1])
+        self.assertEqual(self.manager.get_device(WTP1), None)
+
+        # A batch read before the delete, but processed after it
+        self.manager.add_documents([{"_id": WTP1}, {"_id": WTP2}])
+
+        self.assertEqual(set(self.manager.get_devices()), {WTP2})
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Indexed dictionary unit tests."""
+
+import unittest
+
+from empower_core.serialize import serialize
+
+from empower.managers.ranmanager.index import IndexedDict
+
+
+class Client:
+    """A client hosted by a device on some blocks."""
+
+    def __init__(self, addr, device, blocks):
+        self.addr = addr
+        self.device = device
+        self.blocks = blocks
+
+
+class TestIndex(unittest.TestCase):
+    """Indexed dictionary unit tests."""
+
+    def setUp(self):
+        """Create a dictionary with two indexes."""
+
+        self.clients = IndexedDict(
+            device=lambda client: [client.device] if client.device else [],
+            block=lambda client: client.blocks)
+
+        for addr, device, blocks in ((1, "a", [10, 11]),
+                                     (2, "a", [11]),
+                                     (3, "b", [])):
+            self.clients[addr] = Client(addr, device, blocks)
+
+    def lookup(self, name, index_key):
+        """Return the sorted primary keys with the index key."""
+
+        return sorted(self.clients.lookup(name, index_key))
+
+    def test_lookup(self):
+        """Check that lookups return the matching entries."""
+
+        self.assertEqual(self.lookup("device", "a"), [1, 2])
+        self.assertEqual(self.lookup("device", "b"), [3])
+        self.assertEqual(self.lookup("device", "c"), [])
+        self.assertEqual(self.lookup("block", 11), [1, 2])
+
+        view = self.clients.lookup("device", "a")
+
+        with self.assertRaises(TypeError):
+            view[4] = None
+
+    def test_remove(self):
+        """Check that removed entries are unindexed."""
+
+        del self.clients[1]
+        self.assertEqual(self.lookup("device", "a"), [2])
+        self.assertEqual(self.lookup("block", 10), [])
+
+        self.assertEqual(self.clients.pop(2).addr, 2)
+        self.assertEqual(self.clients.pop(2, None), None)
+        self.assertEqual(self.lookup("device", "a"), [])
+        self.assertEqual(self.clients.buckets["device"].keys(), {"b"})
+
+        self.clients.clear()
+        self.assertEqual(self.lookup("device", "b"), [])
+        self.assertEqual(self.clients.index_keys, {})
+
+    def test_reindex(self):
+        """Check that reindex tracks value changes."""
+
+        client = self.clients[3]
+        client.device = "a"
+        client.blocks = [10]
+
+        # Stale until reindexed
+        self.assertEqual(self.lookup("device", "a"), [1, 2])
+
+        self.clients.reindex(3)
+        self.assertEqual(self.lookup("device", "a"), [1, 2, 3])
+        self.assertEqual(self.lookup("device", "b"), [])
+        self.assertEqual(self.lookup("block", 10), [1, 3])
+
+        # Entries are unindexed with the keys they were indexed with
+        client.device = None
+        del self.clients[3]
+        self.assertEqual(self.lookup("device", "a"), [1, 2])
+
+        # Replacing an entry reindexes it
+        self.clients[2] = Client(2, "b", [])
+        self.assertEqual(self.lookup("device", "a"), [1])
+        self.assertEqual(self.lookup("block", 11), [1])
+        self.assertEqual(self.lookup("device", "b"), [2])
+
+        self.clients.reindex(42)
+
+    def test_view(self):
+        """Check that views are live and can be iterated while modifying."""
+
+        view = self.clients.lookup("device", "c")
+        self.assertEqual(len(view), 0)
+        self.assertNotIn(4, view)
+
+        self.clients[4] = Client(4, "c", [])
+        self.clients[5] = Client(5, "c", [])
+
+        self.assertIn(4, view)
+        self.assertEqual(view[5].addr, 5)
+        self.assertEqual(sorted(view), [4, 5])
+        self.assertEqual(serialize(view).keys(), {"4", "5"})
+
+        for client in view.values():
+            client.device = "d"
+            self.clients.reindex(client.addr)
+
+        self.assertEqual(len(view), 0)
+        self.assertEqual(self.lookup("device", "d"), [4, 5])
+        self.assertRaises(KeyError, view.__getitem__, 4)
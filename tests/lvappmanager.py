@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""LVAPP manager unit tests."""
+
+import uuid
+import unittest
+
+from empower_core.etheraddress import EtherAddress
+from empower_core.ssid import SSID
+
+from empower.managers.ranmanager.lvapp.lvappmanager import launch, \
+    LVAPPManager
+from empower.managers.ranmanager.lvapp.resourcepool import ResourceBlock, \
+    BT_HT20
+from empower.managers.ranmanager.lvapp.txpolicy import TxPolicy
+
+WTP_ADDR = EtherAddress("00:0D:B9:00:00:01")
+STA_ADDR = EtherAddress("60:F4:45:00:00:01")
+
+
+class DummyConnection:
+    """A connection recording the TX policies deleted."""
+
+    def __init__(self):
+        self.deleted = []
+
+    def send_del_tx_policy(self, txp):
+        """Record the TX policy."""
+
+        self.deleted.append(txp.addr)
+
+
+class DummyWTP:
+    """A connected WTP with one block."""
+
+    def __init__(self):
+
+        self.addr = WTP_ADDR
+        self.connection = DummyConnection()
+        self.blocks = {
+            0: ResourceBlock(self, 0, EtherAddress("00:0D:B9:00:01:00"), 6,
+                             BT_HT20)
+        }
+
+
+class DummyLVAP:
+    """An LVAP that is not associated."""
+
+    def __init__(self, addr, block):
+
+        self.addr = addr
+        self.wtp = block.wtp
+        self.blocks = [block]
+        self.ssid = None
+        self.association_state = False
+        self.pending = False
+        self.last_seen = 0
+
+    def clear_blocks(self):
+        """Release the blocks."""
+
+        self.blocks = []
+
+
+class TestLVAPPManager(unittest.TestCase):
+    """LVAPP manager unit tests."""
+
+    def setUp(self):
+        """Create the manager through launch."""
+
+        self.manager = launch(context=None, service_id=uuid.uuid4())
+
+    def test_launch(self):
+        """Check that the manager is built with the default params."""
+
+        self.assertIsInstance(self.manager, LVAPPManager)
+
+        self.assertEqual(self.manager.port, 4433)
+        self.assertEqual(self.manager.idle_timeout, 60)
+        self.assertEqual(self.manager.max_idle_lvaps, 256)
+        self.assertEqual(self.manager.every, 2000)
+        self.assertEqual(self.manager.probe_window, 500)
+        self.assertEqual(self.manager.snapshot, None)
+
+        manager = launch(context=None, service_id=uuid.uuid4(),
+                         idle_timeout=10, probe_window=0)
+
+        self.assertEqual(manager.idle_timeout, 10)
+        self.assertEqual(manager.probe_window, 0)
+
+    def test_evict(self):
+        """Check that idle LVAPs are evicted with their TX policies."""
+
+        wtp = DummyWTP()
+        block = wtp.blocks[0]
+
+        block.tx_policies[STA_ADDR] = TxPolicy(STA_ADDR, block)
+
+        lvap = DummyLVAP(STA_ADDR, block)
+
+        self.manager.lvaps[lvap.addr] = lvap
+        self.manager.touch(lvap)
+
+        # Recently seen
+        self.manager.loop()
+        self.assertIn(STA_ADDR, self.manager.lvaps)
+
+        lvap.last_seen -= self.manager.idle_timeout + 1
+        self.manager.loop()
+
+        self.assertNotIn(STA_ADDR, self.manager.lvaps)
+        self.assertEqual(lvap.blocks, [])
+        self.assertEqual(block.tx_policies, {})
+        self.assertEqual(wtp.connection.deleted, [STA_ADDR])
+        self.assertEqual(self.manager.evictions["idle"], 1)
+
+    def test_max_idle_lvaps(self):
+        """Check that the least recently seen LVAPs are evicted first."""
+
+        self.manager.max_idle_lvaps = 2
+
+        wtp = DummyWTP()
+        block = wtp.blocks[0]
+
+        addrs = [EtherAddress("60:F4:45:00:00:%02X" % i) for i in range(3)]
+
+        for addr in addrs:
+            lvap = DummyLVAP(addr, block)
+            self.manager.lvaps[addr] = lvap
+            self.manager.touch(lvap)
+
+        self.manager.loop()
+
+        self.assertEqual(set(self.manager.lvaps), set(addrs[1:]))
+        self.assertEqual(self.manager.evictions["max_idle_lvaps"], 1)
+
+    def test_admit_probe(self):
+        """Check that only repeated probes for the same SSID are dropped."""
+
+        block = DummyWTP().blocks[0]
+
+        wildcard = SSID("")
+        directed = SSID("EmPOWER")
+
+        self.assertTrue(self.manager.admit_probe(STA_ADDR, block, wildcard))
+        self.assertFalse(self.manager.admit_probe(STA_ADDR, block, wildcard))
+        self.assertTrue(self.manager.admit_probe(STA_ADDR, block, directed))
+        self.assertFalse(self.manager.admit_probe(STA_ADDR, block, directed))
+
+        self.assertEqual(self.manager.admission["admitted"], 2)
+        self.assertEqual(self.manager.admission["duplicate"], 2)
+
+        # Admitted probes are forgotten after the window
+        self.manager.probe_window = 0
+        self.manager.loop()
+
+        self.assertEqual(len(self.manager.probes), 0)
+        self.assertTrue(self.manager.admit_probe(STA_ADDR, block, wildcard))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Available networks unit tests."""
+
+import uuid
+import unittest
+
+from types import SimpleNamespace
+
+from empower_core.etheraddress import EtherAddress
+
+from empower.managers.projectsmanager.projectsmanager import \
+    EmpowerProjectsManager
+from empower.managers.projectsmanager.project import EmpowerProject, \
+    T_BSSID_TYPE_SHARED, T_BSSID_TYPE_UNIQUE
+
+STA = EtherAddress("60:F4:45:D0:3B:FC")
+OTHER = EtherAddress("60:F4:45:D0:3B:FD")
+
+
+class DummyProject:
+    """A project with a Wi-Fi network."""
+
+    get_bssid_prefix = EmpowerProject.get_bssid_prefix
+    generate_bssid = EmpowerProject.generate_bssid
+
+    def __init__(self, ssid, bssid_type, allowed):
+
+        self.project_id = uuid.uuid4()
+        self.wifi_props = SimpleNamespace(ssid=ssid, bssid_type=bssid_type,
+                                          allowed=allowed)
+        self.lte_props = None
+
+
+class TestNetworks(unittest.TestCase):
+    """Available networks unit tests."""
+
+    def setUp(self):
+        """Create a manager with a shared and a unique project."""
+
+        self.shared = DummyProject("shared", T_BSSID_TYPE_SHARED, [STA])
+        self.unique = DummyProject("unique", T_BSSID_TYPE_UNIQUE, [STA])
+
+        self.manager = EmpowerProjectsManager.__new__(EmpowerProjectsManager)
+        self.manager.projects = {
+            self.shared.project_id: self.shared,
+            self.unique.project_id: self.unique
+        }
+        self.manager.update_indexes()
+
+        self.block = SimpleNamespace(
+            hwaddr=EtherAddress("00:0D:B9:00:01:00"))
+
+    def test_networks(self):
+        """Check the networks available to a station."""
+
+        networks = self.manager.get_available_ssids(STA, self.block)
+
+        self.assertEqual(networks, [
+            (self.shared.generate_bssid(self.block.hwaddr), "shared"),
+            (self.unique.generate_bssid(STA), "unique")])
+
+        self.assertTrue(self.manager.is_allowed(STA))
+        self.assertFalse(self.manager.is_allowed(OTHER))
+        self.assertEqual(self.manager.get_available_ssids(OTHER, self.block),
+                         [])
+
+        # Nothing is cached for stations that are in no ACL
+        self.assertEqual(len(self.manager.networks), 1)
+
+    def test_cache(self):
+        """Check that the cache is dropped when the indexes change."""
+
+        networks = self.manager.get_available_ssids(STA, self.block)
+
+        # Callers get a copy
+        networks.clear()
+        self.assertEqual(
+            len(self.manager.get_available_ssids(STA, self.block)), 2)
+
+        self.unique.wifi_props.allowed = []
+        self.assertEqual(
+            len(self.manager.get_available_ssids(STA, self.block)), 2)
+
+        self.manager.update_indexes()
+        self.assertEqual(
+            len(self.manager.get_available_ssids(STA, self.block)), 1)
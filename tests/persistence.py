@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Persistence helpers unit tests."""
+
+import threading
+import unittest
+
+from types import SimpleNamespace
+
+import tornado.gen
+import tornado.ioloop
+
+from empower.managers.persistence import Persistence, WriteBehind, \
+    resolved, chain, to_bool
+
+
+class Collection:
+    """A collection recording the writes, optionally failing the first."""
+
+    def __init__(self, fail=False):
+
+        self.fail = fail
+        self.writes = []
+
+    def replace_one(self, flt, son, upsert):
+        """Record the write."""
+
+        self.writes.append((flt["_id"], son["value"],
+                            threading.current_thread()))
+
+        if self.fail:
+            self.fail = False
+            raise IOError("Write failed")
+
+    def delete_one(self, flt):
+        """Record the delete."""
+
+        self.writes.append((flt["_id"], None, threading.current_thread()))
+
+    def update_one(self, flt, update):
+        """Record the update."""
+
+        self.writes.append((flt["_id"], update, threading.current_thread()))
+
+
+class Document:
+    """A pymodm-like document."""
+
+    def __init__(self, collection, pk):
+
+        self.pk = pk
+        self.value = 0
+        self.valid = True
+
+        pk_field = SimpleNamespace(to_mongo=lambda value: value)
+        self._mongometa = SimpleNamespace(collection=collection, pk=pk_field)
+
+    def full_clean(self):
+        """Validate the document."""
+
+        if not self.valid:
+            raise ValueError("Invalid document")
+
+    def to_son(self):
+        """Return the document as a dictionary."""
+
+        return {"value": self.value}
+
+
+class Cursor:
+    """A pymongo-like cursor over a list of documents."""
+
+    def __init__(self, docs):
+
+        self.docs = iter(docs)
+        self.size = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.docs)
+
+    def batch_size(self, size):
+        """Record the batch size."""
+
+        self.size = size
+
+
+class QuerySet:
+    """A pymodm-like queryset recording the projection."""
+
+    def __init__(self, docs):
+
+        self.docs = docs
+        self.fields = None
+
+    def only(self, *fields):
+        """Set the projection."""
+
+        self.fields = fields
+        return self
+
+    def values(self):
+        """Return documents instead of model instances."""
+
+        return self
+
+    def __iter__(self):
+        return Cursor({field: doc[field] for field in self.fields}
+                      for doc in self.docs)
+
+
+class Model:
+    """A pymodm-like model."""
+
+    fields = [SimpleNamespace(mongo_name=name) for name in ("_id", "value")]
+
+    _mongometa = SimpleNamespace(get_fields=lambda: Model.fields)
+
+    objects = QuerySet([{"_id": pk, "value": 0, "old": None}
+                        for pk in range(5)])
+
+
+class TestPersistence(unittest.TestCase):
+    """Persistence helpers unit tests."""
+
+    def run_sync(self, func):
+        """Run func in a new IOLoop."""
+
+        ioloop = tornado.ioloop.IOLoop()
+
+        try:
+            ioloop.run_sync(func)
+        finally:
+            ioloop.close()
+
+    def test_coalesce(self):
+        """Check that many marks result in one write per document."""
+
+        collection = Collection()
+        write_behind = WriteBehind(max_staleness=10)
+
+        doc1 = Document(collection, 1)
+        doc2 = Document(collection, 2)
+
+        async def run():
+
+            for value in range(100):
+                doc1.value = value
+                write_behind.mark(doc1)
+
+            write_behind.mark(doc2)
+
+            self.assertEqual(collection.writes, [])
+
+            await tornado.gen.sleep(0.1)
+
+        self.run_sync(run)
+
+        self.assertEqual([(pk, value) for pk, value, _ in collection.writes],
+                         [(1, 99), (2, 0)])
+        self.assertNotEqual(collection.writes[0][2],
+                            threading.current_thread())
+        self.assertEqual(write_behind.to_dict()["writes"], 2)
+
+        write_behind.shutdown()
+
+    def test_retry(self):
+        """Check that failed writes are retried."""
+
+        collection = Collection(fail=True)
+        write_behind = WriteBehind(max_staleness=10)
+
+        doc = Document(collection, 1)
+
+        async def run():
+            write_behind.mark(doc)
+            await tornado.gen.sleep(0.1)
+
+        self.run_sync(run)
+
+        self.assertEqual(len(collection.writes), 2)
+        self.assertEqual(write_behind.to_dict()["errors"], 1)
+        self.assertEqual(write_behind.to_dict()["dirty"], 0)
+
+        write_behind.shutdown()
+
+    def test_retry_discarded(self):
+        """Check that discarded documents are not retried."""
+
+        collection = Collection(fail=True)
+        write_behind = WriteBehind(max_staleness=10)
+
+        doc = Document(collection, 1)
+
+        async def run():
+
+            write_behind.mark(doc)
+            future = write_behind.flush()
+
+            # The document is deleted while the write is in progress
+            write_behind.discard(doc)
+
+            with self.assertRaises(IOError):
+                await future
+
+            await tornado.gen.sleep(0.1)
+
+        self.run_sync(run)
+
+        self.assertEqual(len(collection.writes), 1)
+        self.assertEqual(write_behind.to_dict()["errors"], 1)
+        self.assertEqual(write_behind.to_dict()["dirty"], 0)
+        self.assertEqual(write_behind.discarded, set())
+
+        write_behind.shutdown()
+
+    def test_shutdown(self):
+        """Check flush on shutdown."""
+
+        async def run():
+
+            for flush_on_shutdown in (True, False):
+
+                collection = Collection()
+                write_behind = WriteBehind(max_staleness=1000,
+                                           flush_on_shutdown=flush_on_shutdown)
+
+                doc = Document(collection, 1)
+                write_behind.mark(doc)
+
+                discarded = Document(collection, 2)
+                write_behind.mark(discarded)
+                write_behind.discard(discarded)
+
+                write_behind.shutdown()
+
+                writes = [pk for pk, _, _ in collection.writes]
+                self.assertEqual(writes, [1] if flush_on_shutdown else [])
+
+        self.run_sync(run)
+
+    def test_persistence(self):
+        """Check that operations are performed in order off the IOLoop."""
+
+        collection = Collection()
+        persistence = Persistence()
+
+        doc = Document(collection, 1)
+
+        async def run():
+
+            doc.value = 1
+            persistence.save(doc)
+
+            doc.value = 2
+            persistence.save(doc)
+
+            future = persistence.delete(doc)
+
+            # Validation errors are raised to the caller
+            doc.valid = False
+            self.assertRaises(ValueError, persistence.save, doc)
+
+            await future
+
+        self.run_sync(run)
+
+        self.assertEqual([(pk, value) for pk, value, _ in collection.writes],
+                         [(1, 1), (1, 2), (1, None)])
+        self.assertNotEqual(collection.writes[0][2],
+                            threading.current_thread())
+
+        stats = persistence.to_dict()["operations"]
+        self.assertEqual(stats["Document.save"]["count"], 2)
+        self.assertEqual(stats["Document.delete"]["count"], 1)
+        self.assertTrue(stats["Document.save"]["max_latency"] >=
+                        stats["Document.save"]["avg_latency"])
+
+        persistence.shutdown()
+
+    def test_update(self):
+        """Check that updates are applied without validation."""
+
+        collection = Collection()
+        persistence = Persistence()
+
+        doc = Document(collection, 1)
+        doc.valid = False
+
+        update = {"$addToSet": {"value": {"$each": [1, 2]}}}
+
+        async def run():
+            await persistence.update(doc, update)
+
+        self.run_sync(run)
+
+        self.assertEqual([(pk, value) for pk, value, _ in collection.writes],
+                         [(1, update)])
+        self.assertEqual(
+            persistence.to_dict()["operations"]["Document.update"]["count"],
+            1)
+
+        persistence.shutdown()
+
+    def test_persistence_error(self):
+        """Check that failed operations are counted."""
+
+        collection = Collection(fail=True)
+        persistence = Persistence()
+
+        async def run():
+
+            with self.assertRaises(IOError):
+                await persistence.save(Document(collection, 1))
+
+        self.run_sync(run)
+
+        stats = persistence.to_dict()["operations"]["Document.save"]
+        self.assertEqual((stats["count"], stats["errors"]), (1, 1))
+
+        persistence.shutdown()
+
+    def test_chain(self):
+        """Check that chained writes resolve with the result or fail."""
+
+        collection = Collection(fail=True)
+        persistence = Persistence()
+
+        async def run():
+
+            with self.assertRaises(IOError):
+                await chain([persistence.save(Document(collection, 1)),
+                             persistence.save(Document(collection, 2))], 3)
+
+            future = chain([persistence.save(Document(collection, 1)),
+                            resolved()], 3)
+
+            self.assertEqual(await future, 3)
+            self.assertEqual(await resolved(4), 4)
+
+        self.run_sync(run)
+
+        self.assertEqual([pk for pk, _, _ in collection.writes], [1, 2, 1])
+
+        persistence.shutdown()
+
+    def test_load(self):
+        """Check that documents are loaded in batches."""
+
+        persistence = Persistence()
+        batches = []
+
+        async def run():
+            async for batch in persistence.load(Model, batch_size=2):
+                batches.append(batch)
+
+        self.run_sync(run)
+
+        self.assertEqual([[doc["_id"] for doc in batch] for batch in batches],
+                         [[0, 1], [2, 3], [4]])
+        self.assertEqual(batches[0][0], {"_id": 0, "value": 0})
+        self.assertEqual(
+            persistence.to_dict()["operations"]["Model.load"]["count"], 4)
+
+        persistence.shutdown()
+
+    def test_to_bool(self):
+        """Check boolean parameters."""
+
+        self.assertTrue(to_bool("True"))
+        self.assertTrue(to_bool("yes"))
+        self.assertTrue(to_bool(True))
+        self.assertFalse(to_bool("false"))
+        self.assertFalse(to_bool("0"))
+        self.assertFalse(to_bool(None))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Project slices and ACL unit tests."""
+
+import unittest
+
+from types import SimpleNamespace
+
+from pymodm.errors import ValidationError
+
+from empower_core.etheraddress import EtherAddress
+
+from empower.managers.persistence import resolved
+from empower.managers.projectsmanager.project import EmpowerProject
+
+STA = EtherAddress("60:F4:45:D0:3B:FC")
+
+
+class DummyPersistence:
+    """Validate the project without writing it."""
+
+    def __init__(self):
+        self.valid = True
+        self.saves = 0
+
+    def save(self, doc):
+        """Validate the document."""
+
+        if not self.valid:
+            raise ValidationError("Invalid project")
+
+        self.saves += 1
+
+        return resolved()
+
+
+class DummyConnection:
+    """A connection recording the slices sent."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_set_slice(self, project, slc, block):
+        """Record the slice."""
+
+        self.sent.append(("set", slc.slice_id))
+
+    def send_del_slice(self, project, slice_id, block):
+        """Record the slice."""
+
+        self.sent.append(("del", slice_id))
+
+
+class DummyProject:
+    """A project with a WTP."""
+
+    save_or_restore = EmpowerProject.save_or_restore
+    upsert_acl = EmpowerProject.upsert_acl
+    remove_acl = EmpowerProject.remove_acl
+    upsert_wifi_slice = EmpowerProject.upsert_wifi_slice
+    delete_wifi_slice = EmpowerProject.delete_wifi_slice
+
+    def __init__(self):
+
+        self.manager = SimpleNamespace(persistence=DummyPersistence(),
+                                       update_indexes=lambda: None)
+
+        self.connection = DummyConnection()
+
+        wtp = SimpleNamespace(blocks={0: None}, connection=self.connection)
+
+        self.wtps = {EtherAddress("00:0D:B9:00:00:01"): wtp}
+        self.wifi_props = SimpleNamespace(allowed={})
+        self.wifi_slices = {}
+
+
+class TestSlices(unittest.TestCase):
+    """Project slices and ACL unit tests."""
+
+    def setUp(self):
+        """Create a project with the default slice."""
+
+        self.project = DummyProject()
+        self.project.upsert_wifi_slice(slice_id=0)
+
+        self.slices = dict(self.project.wifi_slices)
+
+    def test_slices(self):
+        """Check that valid slices are saved, then sent to the devices."""
+
+        self.project.upsert_wifi_slice(slice_id=80)
+        self.project.delete_wifi_slice("80")
+
+        self.assertEqual(self.project.wifi_slices, self.slices)
+        self.assertEqual(self.project.connection.sent,
+                         [("set", 0), ("set", 80), ("del", 80)])
+        self.assertEqual(self.project.manager.persistence.saves, 3)
+
+    def test_invalid(self):
+        """Check that invalid changes are undone and never sent."""
+
+        self.project.manager.persistence.valid = False
+
+        self.assertRaises(ValidationError, self.project.upsert_wifi_slice,
+                          slice_id=80)
+        self.assertEqual(self.project.wifi_slices, self.slices)
+
+        self.project.manager.persistence.valid = True
+        self.project.upsert_wifi_slice(slice_id=80)
+        self.project.manager.persistence.valid = False
+
+        slices = dict(self.project.wifi_slices)
+
+        self.assertRaises(ValidationError, self.project.delete_wifi_slice,
+                          "80")
+        self.assertEqual(self.project.wifi_slices, slices)
+
+        self.assertRaises(ValidationError, self.project.upsert_acl,
+                          STA, "sta")
+        self.assertEqual(self.project.wifi_props.allowed, {})
+
+        self.project.manager.persistence.valid = True
+        self.project.upsert_acl(STA, "sta")
+        self.project.manager.persistence.valid = False
+
+        self.assertRaises(ValidationError, self.project.remove_acl)
+        self.assertEqual(list(self.project.wifi_props.allowed), [str(STA)])
+
+        self.assertEqual(self.project.connection.sent,
+                         [("set", 0), ("set", 80)])
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""LVAPP state snapshot unit tests."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from empower_core.etheraddress import EtherAddress
+from empower_core.ssid import SSID
+
+from empower.managers.ranmanager.lvapp.snapshot import encode, decode, \
+    read, write, SnapBlock
+from empower.managers.ranmanager.lvapp.resourcepool import ResourceBlock, \
+    BT_HT20
+from empower.managers.ranmanager.lvapp.txpolicy import TxPolicy
+from empower.managers.ranmanager.lvapp.lvap import LVAP, PROCESS_RUNNING
+from empower.managers.ranmanager.lvapp.vap import VAP
+from empower.managers.ranmanager.lvapp import HT_CAPS_INFO
+
+WTP_ADDR = EtherAddress("00:0D:B9:00:00:01")
+STA_ADDR = EtherAddress("60:F4:45:00:00:01")
+BSSID = EtherAddress("52:31:3E:00:00:01")
+OTHER = EtherAddress("52:31:3E:00:00:02")
+
+
+class DummyWTP:
+    """A WTP with two blocks."""
+
+    def __init__(self, online=True):
+
+        self.addr = WTP_ADDR
+        self.online = online
+
+        self.blocks = {
+            0: ResourceBlock(self, 0, EtherAddress("00:0D:B9:00:01:00"), 6,
+                             BT_HT20),
+            1: ResourceBlock(self, 1, EtherAddress("00:0D:B9:00:01:01"), 36,
+                             BT_HT20)
+        }
+
+    def is_online(self):
+        """Return True if the WTP is online."""
+
+        return self.online
+
+
+class TestSnapshot(unittest.TestCase):
+    """LVAPP state snapshot unit tests."""
+
+    def make_state(self, wtp):
+        """Return an LVAP and a VAP on the WTP."""
+
+        txp = TxPolicy(STA_ADDR, wtp.blocks[0])
+        txp.set_mcs([6.0, 12.0])
+        txp.set_no_ack(True)
+        wtp.blocks[0].tx_policies[STA_ADDR] = txp
+
+        lvap = LVAP(STA_ADDR, assoc_id=7, state=PROCESS_RUNNING)
+        lvap.association_state = True
+        lvap.ht_caps = True
+        lvap.ht_caps_info = dict(HT_CAPS_INFO.parse(b"\x09\x2c"))
+        lvap.ht_caps_info.pop('_io', None)
+        lvap.networks = [(BSSID, SSID("EmPOWER")), (OTHER, SSID(""))]
+        lvap.bssid = BSSID
+        lvap.ssid = SSID("EmPOWER")
+        lvap.downlink = wtp.blocks[0]
+        lvap.uplink.append(wtp.blocks[1])
+
+        vap = VAP(BSSID, wtp.blocks[1], SSID("EmPOWER"))
+
+        return lvap, vap
+
+    def test_roundtrip(self):
+        """Check that the state is decoded back."""
+
+        wtp = DummyWTP()
+        lvap, vap = self.make_state(wtp)
+
+        state = decode(encode([wtp], [lvap], [vap]))[WTP_ADDR]
+
+        self.assertEqual(
+            set(state.blocks),
+            {SnapBlock(block.block_id, block.hwaddr, block.channel,
+                       block.band) for block in wtp.blocks.values()})
+
+        entry = state.lvaps[0]
+        self.assertEqual((entry.sta, entry.downlink, entry.uplink),
+                         (STA_ADDR, 0, [1]))
+        self.assertEqual((entry.assoc_id, entry.associated,
+                          entry.authenticated), (7, True, False))
+        self.assertEqual((entry.bssid, entry.ssid, entry.encap),
+                         (BSSID, SSID("EmPOWER"), None))
+        self.assertEqual((entry.ht_caps, entry.ht_caps_info),
+                         (True, lvap.ht_caps_info))
+        self.assertTrue(entry.ht_caps_info["Maximum_AMSDU_Length"])
+        self.assertEqual(entry.networks, lvap.networks)
+
+        self.assertEqual(state.vaps[0], (BSSID, 1, SSID("EmPOWER")))
+
+        entry = state.txps[0]
+        self.assertEqual((entry.block_id, entry.addr), (0, STA_ADDR))
+        self.assertEqual(entry.mcs, [6.0, 12.0])
+        self.assertTrue(entry.no_ack)
+
+    def test_offline(self):
+        """Check that WTPs that are not online are skipped."""
+
+        wtp = DummyWTP(online=False)
+        lvap, vap = self.make_state(wtp)
+
+        self.assertEqual(decode(encode([wtp], [lvap], [vap])), {})
+
+    def test_file(self):
+        """Check that truncated and invalid files are handled."""
+
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, "lvapp.snap")
+
+        try:
+
+            wtp = DummyWTP()
+            lvap, vap = self.make_state(wtp)
+
+            data = encode([wtp], [lvap], [vap])
+            write(path, data[:-2])
+
+            state = read(path)[WTP_ADDR]
+            self.assertEqual(len(state.lvaps), 1)
+            self.assertEqual(state.vaps, [])
+
+            write(path, b"garbage!")
+            self.assertRaises(ValueError, read, path)
+
+        finally:
+            shutil.rmtree(tmp)
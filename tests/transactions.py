@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2019 Roberto Riggio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Transaction table unit tests."""
+
+import unittest
+
+from empower.managers.ranmanager.transactions import TransactionTable, \
+    MAX_XID, NO_TIMEOUT
+
+
+class TestTransactions(unittest.TestCase):
+    """Transaction table unit tests."""
+
+    def setUp(self):
+        """Create an empty table."""
+
+        self.table = TransactionTable(timeout=1000, max_transactions=4)
+        self.expired = []
+
+    def tearDown(self):
+        """Cancel the timer."""
+
+        self.table.clear()
+
+    def add(self, xid, timeout=None):
+        """Add a transaction recording its expiration."""
+
+        return self.table.add(xid, "req%u" % xid,
+                              on_timeout=self.expired.append,
+                              timeout=timeout)
+
+    def test_xid_wraparound(self):
+        """Check that xids wrap around skipping 0 and live xids."""
+
+        self.table.last_xid = MAX_XID - 1
+        self.add(1)
+
+        self.assertEqual(self.table.next_xid(), MAX_XID)
+        self.assertEqual(self.table.next_xid(), 2)
+
+    def test_complete(self):
+        """Check that completed transactions are not expired."""
+
+        self.add(1)
+        self.add(2)
+
+        transaction = self.table.pop(1)
+
+        self.assertEqual(transaction.request, "req1")
+        self.assertIsNone(self.table.pop(1))
+        self.assertNotIn(1, self.table)
+
+        self.table.expire(self.table.now() + 2)
+
+        self.assertEqual(self.expired, ["req2"])
+        self.assertEqual(len(self.table), 0)
+
+        stats = self.table.to_dict()
+
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["outstanding"], 0)
+
+    def test_deadlines(self):
+        """Check that transactions expire in deadline order."""
+
+        self.add(1, timeout=3000)
+        self.add(2, timeout=1000)
+        self.add(3, timeout=2000)
+
+        self.assertAlmostEqual(self.table.timer_deadline,
+                               self.table[2].deadline)
+
+        self.table.expire(self.table[3].deadline)
+
+        self.assertEqual(self.expired, ["req2", "req3"])
+        self.assertIn(1, self.table)
+        self.assertAlmostEqual(self.table.timer_deadline,
+                               self.table[1].deadline)
+
+    def test_eviction(self):
+        """Check that the oldest transaction is evicted when full."""
+
+        for xid in range(1, 6):
+            self.add(xid)
+
+        self.assertEqual(self.expired, ["req1"])
+        self.assertEqual(len(self.table), 4)
+        self.assertEqual(self.table.to_dict()["evicted"], 1)
+        self.assertEqual(self.table.to_dict()["max_outstanding"], 4)
+
+    def test_no_timeout(self):
+        """Check that transactions without timeout never expire."""
+
+        self.add(1, timeout=NO_TIMEOUT)
+        self.add(2)
+
+        self.table.expire(self.table.now() + 3600)
+
+        self.assertEqual(self.expired, ["req2"])
+        self.assertIn(1, self.table)
+        self.assertIsNone(self.table.timer)
+
+        for xid in range(3, 7):
+            self.add(xid, timeout=NO_TIMEOUT)
+
+        self.assertEqual(self.expired, ["req2", "req1"])
+        self.assertEqual(self.table.to_dict()["evicted"], 1)
+
+    def test_duplicate(self):
+        """Check that pending xids cannot be reused."""
+
+        self.add(1)
+        self.assertRaises(ValueError, self.add, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()